@@ -3,14 +3,15 @@
 import pandas as pd
 import numpy as np
 import logging
-from sklearn.ensemble import IsolationForest
+from typing import Any, Dict, Optional
+from .anomalias import prever_em_lote, prever_serie_curta, resolver_detector
 
 logger = logging.getLogger(__name__)
 
 def agregar_realizado_vs_orcado_por_projeto(df_integrado: pd.DataFrame, df_ocorrencias_atipicas: pd.DataFrame) -> pd.DataFrame:
     if df_integrado.empty: return pd.DataFrame()
     logger.info("Agregando Orçado vs. Realizado e calculando Score de Criticidade...")
-    df_agregado = df_integrado.groupby('PROJETO').agg(VALOR_REALIZADO=('VALOR_REALIZADO', 'sum'), VALOR_ORCADO=('VALOR_ORCADO', 'sum')).reset_index()
+    df_agregado = df_integrado.groupby('PROJETO', observed=True).agg(VALOR_REALIZADO=('VALOR_REALIZADO', 'sum'), VALOR_ORCADO=('VALOR_ORCADO', 'sum')).reset_index()
     df_agregado['%_EXECUCAO'] = (df_agregado['VALOR_REALIZADO'] / df_agregado['VALOR_ORCADO']).replace([np.inf, -np.inf], 0).fillna(0)
     df_final = df_agregado.rename(columns={'PROJETO': 'Iniciativa', 'VALOR_ORCADO': 'Orçado', 'VALOR_REALIZADO': 'Realizado', '%_EXECUCAO': '% Execução'})
     projetos_com_ocorrencias = []
@@ -33,20 +34,32 @@ def agregar_realizado_vs_orcado_por_projeto(df_integrado: pd.DataFrame, df_ocorr
 
 def agregar_despesas_por_fornecedor(df_bruto: pd.DataFrame, top_n: int = 10) -> pd.DataFrame:
     if df_bruto.empty: return pd.DataFrame()
-    df_agregado = df_bruto.groupby('FORNECEDOR')['VALOR'].sum().reset_index()
+    df_agregado = df_bruto.groupby('FORNECEDOR', observed=True)['VALOR'].sum().reset_index()
+    return _selecionar_top_fornecedores(df_agregado, top_n)
+
+def _selecionar_top_fornecedores(df_agregado: pd.DataFrame, top_n: int) -> pd.DataFrame:
     df_agregado['VALOR_ABS'] = df_agregado['VALOR'].abs()
     placeholders = ['Não Informado', 'Fornecedor Não Encontrado']
     df_filtrado = df_agregado[~df_agregado['FORNECEDOR'].isin(placeholders)]
     df_top = df_filtrado.nlargest(top_n, 'VALOR_ABS')[['FORNECEDOR', 'VALOR']]
     return df_top.rename(columns={'FORNECEDOR': 'Fornecedor', 'VALOR': 'Realizado (Ano)'})
 
-def agregar_despesas_por_mes(df_bruto: pd.DataFrame) -> pd.DataFrame:
+def agregar_despesas_por_mes(df_bruto: pd.DataFrame, detector: Optional[str] = None) -> pd.DataFrame:
     if df_bruto.empty or 'tipo_projeto' not in df_bruto.columns: return pd.DataFrame()
     logger.info("Agregando despesas mensais e aplicando IA na tendência...")
     df_exclusivo = df_bruto[df_bruto['tipo_projeto'] == 'Exclusivo']
     df_compartilhado = df_bruto[df_bruto['tipo_projeto'] == 'Compartilhado']
-    df_mes_exclusivo = df_exclusivo.groupby('MES')['VALOR'].sum().reset_index().rename(columns={'VALOR': 'Realizado (Exclusivo)'})
-    df_mes_compartilhado = df_compartilhado.groupby('MES')['VALOR'].sum().reset_index().rename(columns={'VALOR': 'Realizado (Compartilhado)'})
+    return _montar_tabela_mensal(df_exclusivo.groupby('MES')['VALOR'].sum(), df_compartilhado.groupby('MES')['VALOR'].sum(), detector)
+
+def _montar_tabela_mensal(serie_mes_exclusivo: pd.Series, serie_mes_compartilhado: pd.Series, detector: Optional[str] = None) -> pd.DataFrame:
+    """Monta a tabela de Desempenho Mensal a partir dos totais por MES de cada tipo de projeto."""
+    df_final = _tabela_mensal_base(serie_mes_exclusivo, serie_mes_compartilhado)
+    outlier = prever_serie_curta(df_final[['Total Mensal']], contamination='auto', detector=detector) if len(df_final) > 3 else None
+    return _concluir_tabela_mensal(df_final, outlier)
+
+def _tabela_mensal_base(serie_mes_exclusivo: pd.Series, serie_mes_compartilhado: pd.Series) -> pd.DataFrame:
+    df_mes_exclusivo = serie_mes_exclusivo.reset_index().rename(columns={'VALOR': 'Realizado (Exclusivo)'})
+    df_mes_compartilhado = serie_mes_compartilhado.reset_index().rename(columns={'VALOR': 'Realizado (Compartilhado)'})
     if not df_mes_exclusivo.empty and not df_mes_compartilhado.empty:
         df_final = pd.merge(df_mes_exclusivo, df_mes_compartilhado, on='MES', how='outer')
     elif not df_mes_exclusivo.empty:
@@ -56,10 +69,12 @@ def agregar_despesas_por_mes(df_bruto: pd.DataFrame) -> pd.DataFrame:
     df_final = df_final.fillna(0).sort_values('MES')
     df_final['Total Mensal'] = df_final.get('Realizado (Exclusivo)', 0) + df_final.get('Realizado (Compartilhado)', 0)
     df_final['Sinalização da IA'] = ''
-    if len(df_final) > 3:
-        valores_mensais = df_final[['Total Mensal']]
-        model = IsolationForest(contamination='auto', random_state=42)
-        df_final['outlier'] = model.fit_predict(valores_mensais)
+    return df_final
+
+def _concluir_tabela_mensal(df_final: pd.DataFrame, outlier: Optional[np.ndarray]) -> pd.DataFrame:
+    """Aplica a sinalização da IA (previsões do detector sobre o Total Mensal, se houver) e formata a tabela."""
+    if outlier is not None:
+        df_final['outlier'] = outlier
         median_normal = df_final[df_final['outlier'] == 1]['Total Mensal'].median()
         outliers = df_final[df_final['outlier'] == -1]
         for idx, row in outliers.iterrows():
@@ -71,10 +86,20 @@ def agregar_despesas_por_mes(df_bruto: pd.DataFrame) -> pd.DataFrame:
     colunas_existentes = [col for col in colunas_finais if col in df_final.columns]
     return df_final[colunas_existentes].rename(columns={'MES': 'Mês'})
 
+def _calcular_faixa_normal_mes(valores_mes: pd.Series, predictions: Optional[np.ndarray] = None, detector: Optional[str] = None) -> dict:
+    """Menor e maior valor 'normal' do mês, segundo o detector sobre os lançamentos (ou previsões já calculadas)."""
+    if predictions is None:
+        predictions = prever_serie_curta(valores_mes.to_frame(name='VALOR'), contamination=0.02, detector=detector)
+    inliers = valores_mes[predictions == 1]
+    if inliers.empty:
+        return {}
+    return {"min_normal_mes": inliers.min(), "max_normal_mes": inliers.max()}
+
 def gerar_resumo_executivo(
     df_unidade_bruto: pd.DataFrame, 
     df_unidade_integrado: pd.DataFrame, 
-    mes_referencia_num: int
+    mes_referencia_num: int,
+    detector: Optional[str] = None
 ) -> dict:
     logger.info("Gerando Resumo Executivo e estatísticas de referência...")
     if df_unidade_bruto.empty: return {}
@@ -99,12 +124,7 @@ def gerar_resumo_executivo(
             stats.update({"media_ano": df_historico_tipo['VALOR'].mean(), "mediana_ano": df_historico_tipo['VALOR'].median(), "maior_ano": df_historico_tipo['VALOR'].max(), "menor_ano": df_historico_tipo['VALOR'].min()})
         if not df_mes_tipo.empty and df_mes_tipo['VALOR'].nunique() > 1:
             stats["valor_mediano_mes"] = df_mes_tipo['VALOR'].median()
-            model = IsolationForest(contamination=0.02, random_state=42)
-            predictions = model.fit_predict(df_mes_tipo[['VALOR']])
-            inliers = df_mes_tipo[predictions == 1]
-            if not inliers.empty:
-                stats["min_normal_mes"] = inliers['VALOR'].min()
-                stats["max_normal_mes"] = inliers['VALOR'].max()
+            stats.update(_calcular_faixa_normal_mes(df_mes_tipo['VALOR'], detector=detector))
         return stats
     stats_exclusivo = get_stats_de_valor(df_bruto_exclusivo, df_mes_exclusivo)
     for key, val in stats_exclusivo.items(): resumo[f"{key}_exclusivo"] = val
@@ -112,3 +132,83 @@ def gerar_resumo_executivo(
     for key, val in stats_compartilhado.items(): resumo[f"{key}_compartilhado"] = val
     logger.info("Resumo e estatísticas gerados com sucesso.")
     return resumo
+
+def agregar_unidades_em_lote(df_bruto: pd.DataFrame, df_integrado: pd.DataFrame, top_n: int = 5, detector: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Calcula, em uma passada de groupby sobre a base completa, o resumo executivo, os top N fornecedores
+    por tipo de projeto e a tabela mensal de todas as unidades. Os números são os mesmos de
+    gerar_resumo_executivo, agregar_despesas_por_fornecedor e agregar_despesas_por_mes por unidade.
+
+    Retorna {unidade: {'mes_referencia_num', 'resumo', 'fornecedores': {'Exclusivo', 'Compartilhado'}, 'mes_agregado'}}.
+    Espera a coluna UNIDADE já normalizada em ambos os DataFrames. 'detector' segue anomalias.resolver_detector.
+    """
+    if df_bruto.empty: return {}
+    logger.info("Gerando agregações de todas as unidades em lote...")
+    detector = resolver_detector(detector)
+    tipos = ['Exclusivo', 'Compartilhado']
+    sufixos = {'Exclusivo': 'exclusivo', 'Compartilhado': 'compartilhado'}
+
+    # --- Mês de referência de cada unidade e recorte dos lançamentos do mês ---
+    mes_referencia = df_bruto.groupby('UNIDADE', observed=True)['MES'].max()
+    mascara_mes = (df_bruto['MES'] == df_bruto['UNIDADE'].map(mes_referencia).astype(df_bruto['MES'].dtype)).to_numpy()
+    df_mes = df_bruto[mascara_mes]
+
+    # --- Totais e estatísticas de valor (ano e mês), por unidade e por unidade x tipo ---
+    total_ano = df_bruto.groupby('UNIDADE', observed=True)['VALOR'].agg(['sum', 'size'])
+    total_mes = df_mes.groupby('UNIDADE', observed=True)['VALOR'].agg(['sum', 'size'])
+    stats_ano = df_bruto.groupby(['UNIDADE', 'tipo_projeto'], observed=True)['VALOR'].agg(['sum', 'mean', 'median', 'max', 'min'])
+    stats_mes = df_mes.groupby(['UNIDADE', 'tipo_projeto'], observed=True)['VALOR'].agg(['sum', 'median', 'nunique'])
+    orcado_total = df_integrado.groupby('UNIDADE', observed=True)['VALOR_ORCADO'].sum()
+    orcado_tipo = df_integrado.groupby(['UNIDADE', 'tipo_projeto'], observed=True)['VALOR_ORCADO'].sum()
+
+    # --- Faixa "normal" do mês (IsolationForest) apenas nos grupos com mais de um valor distinto, ajustados em lote ---
+    grupos_com_faixa = set(stats_mes.index[stats_mes['nunique'] > 1])
+    valores_mes_por_grupo = {chave: grupo['VALOR'] for chave, grupo in df_mes.groupby(['UNIDADE', 'tipo_projeto'], observed=True) if chave in grupos_com_faixa}
+    previsoes_faixa = prever_em_lote({chave: valores.to_frame(name='VALOR') for chave, valores in valores_mes_por_grupo.items()}, contamination=0.02, detector=detector, nome_modelo='iforest_faixa_mes')
+    faixas_normais = {chave: _calcular_faixa_normal_mes(valores, previsoes_faixa[chave]) for chave, valores in valores_mes_por_grupo.items()}
+
+    # --- Fornecedores e séries mensais (agregadas uma vez; o recorte por unidade é sobre dados pequenos) ---
+    df_fornecedores = df_bruto.groupby(['UNIDADE', 'tipo_projeto', 'FORNECEDOR'], observed=True)['VALOR'].sum()
+    fornecedores_por_grupo = {chave: _selecionar_top_fornecedores(grupo.droplevel(['UNIDADE', 'tipo_projeto']).reset_index(), top_n)
+                              for chave, grupo in df_fornecedores.groupby(level=['UNIDADE', 'tipo_projeto'], observed=True)}
+    serie_mensal = df_bruto.groupby(['UNIDADE', 'tipo_projeto', 'MES'], observed=True)['VALOR'].sum()
+    series_por_grupo = {chave: grupo.droplevel(['UNIDADE', 'tipo_projeto'])
+                        for chave, grupo in serie_mensal.groupby(level=['UNIDADE', 'tipo_projeto'], observed=True)}
+    serie_vazia = pd.Series([], dtype='float64', name='VALOR', index=pd.Index([], name='MES', dtype=df_bruto['MES'].dtype))
+
+    # --- Tabelas mensais: os modelos de sinalização de todas as unidades também são ajustados em lote ---
+    tabelas_mensais = {unidade: _tabela_mensal_base(series_por_grupo.get((unidade, 'Exclusivo'), serie_vazia), series_por_grupo.get((unidade, 'Compartilhado'), serie_vazia))
+                       for unidade in mes_referencia.index}
+    previsoes_mensais = prever_em_lote({unidade: df_final[['Total Mensal']] for unidade, df_final in tabelas_mensais.items() if len(df_final) > 3}, contamination='auto', detector=detector, nome_modelo='iforest_tendencia_mensal')
+
+    agregados = {}
+    for unidade in mes_referencia.index:
+        resumo = {
+            "valor_total_mes": total_mes['sum'].get(unidade, 0.0), "valor_total_ano": total_ano.at[unidade, 'sum'],
+            "qtd_lancamentos_mes": int(total_mes['size'].get(unidade, 0)), "qtd_lancamentos_ano": int(total_ano.at[unidade, 'size']),
+        }
+        orc_total_ano = orcado_total.get(unidade, 0.0)
+        resumo.update({"orcamento_planejado_ano": orc_total_ano, "orcamento_mes_referencia": orc_total_ano / 12 if orc_total_ano else 0})
+        for tipo in tipos:
+            chave, sufixo = (unidade, tipo), sufixos[tipo]
+            resumo[f"gastos_mes_{sufixo}"] = stats_mes.at[chave, 'sum'] if chave in stats_mes.index else 0.0
+            resumo[f"gastos_ano_{sufixo}"] = stats_ano.at[chave, 'sum'] if chave in stats_ano.index else 0.0
+            orc_tipo_ano = orcado_tipo.get(chave, 0.0)
+            resumo[f"orcamento_total_{sufixo}"] = orc_tipo_ano
+            resumo[f"orcamento_mes_{sufixo}"] = orc_tipo_ano / 12 if orc_tipo_ano else 0
+            if chave in stats_ano.index:
+                for campo, estatistica in (("media_ano", 'mean'), ("mediana_ano", 'median'), ("maior_ano", 'max'), ("menor_ano", 'min')):
+                    resumo[f"{campo}_{sufixo}"] = stats_ano.at[chave, estatistica]
+            if chave in grupos_com_faixa:
+                resumo[f"valor_mediano_mes_{sufixo}"] = stats_mes.at[chave, 'median']
+                for campo, valor in faixas_normais[chave].items():
+                    resumo[f"{campo}_{sufixo}"] = valor
+
+        agregados[unidade] = {
+            "mes_referencia_num": mes_referencia[unidade],
+            "resumo": resumo,
+            "fornecedores": {tipo: fornecedores_por_grupo.get((unidade, tipo), pd.DataFrame()) for tipo in tipos},
+            "mes_agregado": _concluir_tabela_mensal(tabelas_mensais[unidade], previsoes_mensais.get(unidade)),
+        }
+    logger.info(f"Agregações em lote concluídas para {len(agregados)} unidades.")
+    return agregados
@@ -0,0 +1,108 @@
+# analise_despesa/analise/anomalias.py
+"""
+Motor de detecção de anomalias em lote.
+
+Reúne as matrizes de features de várias unidades e ajusta um IsolationForest por matriz em paralelo
+(threads do joblib), limitando as threads de BLAS/OpenMP de cada ajuste para não sobrecarregar a máquina.
+Cada modelo usa a mesma semente do ajuste individual, então as previsões são idênticas às sequenciais.
+
+Para séries curtas (totais mensais, lançamentos de um mês) há também detectores estatísticos robustos em
+forma fechada: "mad" (mediana e desvio absoluto mediano) e "iqr" (cercas de Tukey). "modelo" é o IsolationForest.
+"""
+import logging
+import time
+from typing import Any, Dict, Hashable, Optional, Union
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import IsolationForest
+from threadpoolctl import threadpool_limits
+
+from ..config import PARAMETROS_ANALISE
+from ..exceptions import AnaliseDespesaError
+from . import registro_modelos
+
+logger = logging.getLogger(__name__)
+
+DETECTORES = ("modelo", "mad", "iqr")
+# Fator de consistência do MAD com o desvio padrão (distribuição normal) e limites usuais de cada método.
+ESCALA_MAD = 1.4826
+LIMITE_MAD = 3.5
+LIMITE_IQR = 1.5
+
+def resolver_detector(detector: Optional[str] = None) -> str:
+    """Valida o detector informado, ou o de PARAMETROS_ANALISE['DETECTOR_SERIES_CURTAS'] quando omitido."""
+    detector = (detector or str(PARAMETROS_ANALISE["DETECTOR_SERIES_CURTAS"])).lower()
+    if detector not in DETECTORES:
+        raise AnaliseDespesaError(f"Detector de anomalias '{detector}' inválido. Opções: {', '.join(DETECTORES)}.")
+    return detector
+
+def prever_robusto(valores: Any, detector: str) -> np.ndarray:
+    """
+    Classifica os valores (1 = normal, -1 = atípico) com um detector estatístico em forma fechada.
+    'mad': |x - mediana| > 3,5 * MAD escalado. 'iqr': fora de [Q1 - 1,5*IQR, Q3 + 1,5*IQR].
+    Com dispersão zero (MAD ou IQR nulos), nenhum valor é considerado atípico.
+    """
+    x = np.asarray(valores, dtype='float64').ravel()
+    if x.size == 0:
+        return np.empty(0, dtype='int64')
+    if detector == "mad":
+        mediana = np.median(x)
+        desvio = ESCALA_MAD * np.median(np.abs(x - mediana))
+        atipico = np.abs(x - mediana) > LIMITE_MAD * desvio if desvio > 0 else np.zeros(x.size, dtype=bool)
+    elif detector == "iqr":
+        q1, q3 = np.percentile(x, [25, 75])
+        iqr = q3 - q1
+        atipico = (x < q1 - LIMITE_IQR * iqr) | (x > q3 + LIMITE_IQR * iqr) if iqr > 0 else np.zeros(x.size, dtype=bool)
+    else:
+        raise AnaliseDespesaError(f"Detector robusto '{detector}' inválido. Opções: mad, iqr.")
+    return np.where(atipico, -1, 1)
+
+def prever_serie_curta(matriz: Any, contamination: Union[float, str] = 'auto', detector: Optional[str] = None) -> np.ndarray:
+    """Previsões de uma série curta com o detector escolhido ('modelo' ajusta o IsolationForest)."""
+    detector = resolver_detector(detector)
+    if detector == "modelo":
+        return ajustar_e_prever(matriz, contamination=contamination)
+    return prever_robusto(matriz, detector)
+
+def ajustar_e_prever(matriz: Any, contamination: Union[float, str] = 'auto', random_state: int = 42,
+                     escopo: Optional[str] = None, nome_modelo: Optional[str] = None) -> np.ndarray:
+    """
+    Ajusta um IsolationForest na matriz e devolve fit_predict (1 = normal, -1 = atípico).
+    Com 'escopo' e 'nome_modelo', usa o registro de modelos: se os mesmos dados já foram treinados, apenas pontua.
+    """
+    if escopo is None or nome_modelo is None:
+        return IsolationForest(contamination=contamination, random_state=random_state).fit_predict(matriz)
+    impressao_digital = registro_modelos.calcular_impressao_digital(matriz, contamination=contamination, random_state=random_state)
+    modelo = registro_modelos.ler_modelo(escopo, nome_modelo, impressao_digital)
+    if modelo is not None:
+        return modelo.predict(matriz)
+    modelo = IsolationForest(contamination=contamination, random_state=random_state).fit(matriz)
+    registro_modelos.gravar_modelo(escopo, nome_modelo, impressao_digital, modelo)
+    return modelo.predict(matriz)
+
+def prever_em_lote(matrizes: Dict[Hashable, Any], contamination: Union[float, str] = 'auto', random_state: int = 42,
+                   n_jobs: Optional[int] = None, detector: Optional[str] = None, nome_modelo: Optional[str] = None) -> Dict[Hashable, np.ndarray]:
+    """
+    Ajusta um IsolationForest por matriz, em paralelo, e devolve {chave: previsões}.
+    'n_jobs' padrão: PARAMETROS_ANALISE['WORKERS_ANOMALIAS'] (-1 = todos os núcleos).
+    Com 'nome_modelo', cada chave vira o escopo do modelo no registro (ver ajustar_e_prever).
+    Com detector 'mad' ou 'iqr', as previsões são calculadas em forma fechada, sem modelos; omitido, segue
+    PARAMETROS_ANALISE['DETECTOR_SERIES_CURTAS'] (como prever_serie_curta).
+    """
+    if not matrizes:
+        return {}
+    detector = resolver_detector(detector)
+    if detector != "modelo":
+        return {chave: prever_robusto(matriz, detector) for chave, matriz in matrizes.items()}
+    n_jobs = n_jobs if n_jobs is not None else int(PARAMETROS_ANALISE["WORKERS_ANOMALIAS"])
+    chaves = list(matrizes)
+    inicio = time.perf_counter()
+    # Uma thread de BLAS/OpenMP por ajuste: o paralelismo fica entre os modelos.
+    with threadpool_limits(limits=1):
+        previsoes = Parallel(n_jobs=n_jobs, prefer="threads")(
+            delayed(ajustar_e_prever)(matrizes[chave], contamination, random_state, str(chave) if nome_modelo else None, nome_modelo)
+            for chave in chaves
+        )
+    logger.info(f"{len(chaves)} modelos IsolationForest ajustados em lote em {time.perf_counter() - inicio:.2f}s (n_jobs={n_jobs}).")
+    return dict(zip(chaves, previsoes))
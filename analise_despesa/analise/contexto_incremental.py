@@ -0,0 +1,153 @@
+# analise_despesa/analise/contexto_incremental.py
+"""
+Detecção de ocorrências de contexto em modo incremental (mês a mês).
+
+Para cada unidade, guarda no registro de modelos (subdiretório de estados, fora da retenção) o estado dos meses já fechados: acumuladores das
+frequências de fornecedor/projeto e de (n, média, M2) de cada par Fornecedor-Projeto, o scaler e o
+IsolationForest do último reajuste e as ocorrências já encontradas. Uma execução mensal pontua apenas
+os lançamentos do mês de referência contra esse estado; as frequências e o Z-Score do mês combinam os
+acumuladores com o próprio mês, reproduzindo as estatísticas do ano inteiro. O reajuste completo
+acontece a cada REAJUSTE_CONTEXTO_MESES meses, na virada do ano, quando o score médio do mês deriva ou quando
+um mês fechado muda (lançamentos tardios ou correções trazidos pela sincronização), detectado pela impressão
+digital (quantidade e soma de VALOR) de cada mês guardada no estado.
+"""
+import logging
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from ..config import PARAMETROS_ANALISE, PARAMETROS_MODELOS
+from . import registro_modelos
+from .insights_ia import FEATURES_DE_CONTEXTO, _preparar_features_de_contexto, _selecionar_ocorrencias_de_contexto
+
+logger = logging.getLogger(__name__)
+
+NOME_ESTADO = 'contexto_incremental'
+
+def calcular_acumuladores(df: pd.DataFrame) -> Dict[str, Any]:
+    """Frequências por fornecedor e projeto e (n, média, M2) do VALOR por par Fornecedor-Projeto."""
+    fornecedor, projeto = df['FORNECEDOR'].astype(object), df['PROJETO'].astype(object)
+    pares = df['VALOR'].groupby([fornecedor, projeto]).agg(['count', 'mean', 'var'])
+    pares = pd.DataFrame({'n': pares['count'], 'media': pares['mean'], 'm2': (pares['var'] * (pares['count'] - 1)).fillna(0)})
+    return {
+        'fornecedor': fornecedor.value_counts(),
+        'projeto': projeto.value_counts(),
+        'pares': pares[pares['n'] > 0],
+    }
+
+def combinar_acumuladores(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    """Soma dois conjuntos de acumuladores (fórmula de Chan para média e M2)."""
+    pares_a, pares_b = a['pares'].align(b['pares'], join='outer', fill_value=0)
+    n = pares_a['n'] + pares_b['n']
+    delta = pares_b['media'] - pares_a['media']
+    return {
+        'fornecedor': a['fornecedor'].add(b['fornecedor'], fill_value=0),
+        'projeto': a['projeto'].add(b['projeto'], fill_value=0),
+        'pares': pd.DataFrame({
+            'n': n,
+            'media': pares_a['media'] + delta * pares_b['n'] / n,
+            'm2': pares_a['m2'] + pares_b['m2'] + delta ** 2 * pares_a['n'] * pares_b['n'] / n,
+        }),
+    }
+
+def calcular_features_com_acumuladores(df: pd.DataFrame, acumuladores: Dict[str, Any]) -> pd.DataFrame:
+    """Features de contexto das linhas de 'df' a partir dos acumuladores (custo proporcional às linhas de 'df')."""
+    fornecedor, projeto = df['FORNECEDOR'].astype(object), df['PROJETO'].astype(object)
+    pares = acumuladores['pares'].reindex(pd.MultiIndex.from_arrays([fornecedor, projeto]))
+    desvio = np.sqrt(pares['m2'] / (pares['n'] - 1)).where(pares['n'] > 1).fillna(0).to_numpy()
+    z_score = np.where(desvio > 0, (df['VALOR'].to_numpy() - pares['media'].to_numpy()) / np.where(desvio > 0, desvio, 1), 0)
+    df_analise = df.reset_index(drop=True)
+    df_analise['FREQ_FORNECEDOR'] = acumuladores['fornecedor'].reindex(fornecedor).to_numpy()
+    df_analise['FREQ_PROJETO'] = acumuladores['projeto'].reindex(projeto).to_numpy()
+    df_analise['Z_SCORE_VALOR'] = pd.Series(z_score).fillna(0).to_numpy()
+    return df_analise
+
+def calcular_impressao_meses(df: pd.DataFrame) -> Dict[int, tuple]:
+    """Impressão digital barata de cada mês: (quantidade de lançamentos, soma de VALOR em centavos)."""
+    agregado = df['VALOR'].groupby(df['MES']).agg(['count', 'sum'])
+    return {int(mes): (int(linha['count']), int(round(linha['sum'] * 100))) for mes, linha in agregado.iterrows()}
+
+def _pontuar(estado: Dict[str, Any], df_analise: pd.DataFrame):
+    """Scores e previsões do modelo do estado (previsão idêntica a IsolationForest.predict)."""
+    modelo = estado['modelo']
+    scores = modelo.score_samples(estado['scaler'].transform(df_analise[FEATURES_DE_CONTEXTO]))
+    return scores, np.where(scores - modelo.offset_ < 0, -1, 1)
+
+def _reajustar(df: pd.DataFrame, unidade: str, ano: int, mes_referencia: int, contamination: float) -> pd.DataFrame:
+    """Ajuste completo sobre o ano (igual ao modo 'completo') e gravação do novo estado dos meses fechados."""
+    df_analise, features_scaled, scaler = _preparar_features_de_contexto(df, None)
+    modelo = IsolationForest(contamination=contamination, random_state=42).fit(features_scaled)
+    scores = modelo.score_samples(features_scaled)
+    ocorrencias = _selecionar_ocorrencias_de_contexto(df_analise, modelo.predict(features_scaled))
+    estado = {
+        'ano': ano, 'mes_base': mes_referencia - 1, 'mes_ajuste': mes_referencia, 'contamination': contamination,
+        'acumuladores': calcular_acumuladores(df[df['MES'] < mes_referencia]),
+        'impressao_meses': calcular_impressao_meses(df[df['MES'] < mes_referencia]),
+        'scaler': scaler, 'modelo': modelo, 'score_medio': float(scores.mean()), 'score_desvio': float(scores.std()),
+        'ocorrencias_base': ocorrencias[ocorrencias['DATA'].dt.month < mes_referencia],
+    }
+    registro_modelos.gravar_estado(unidade, NOME_ESTADO, str(ano), estado)
+    return ocorrencias
+
+def _motivo_reajuste(estado: Optional[Dict[str, Any]], df: pd.DataFrame, ano: int, mes_referencia: int,
+                     contamination: float) -> Optional[str]:
+    if estado is None:
+        return "sem estado anterior"
+    if estado['ano'] != ano or estado['contamination'] != contamination:
+        return "estado de outro ano ou outra configuração"
+    if mes_referencia <= estado['mes_base']:
+        return f"reprocessamento de mês já fechado ({mes_referencia})"
+    if mes_referencia - estado['mes_ajuste'] >= int(PARAMETROS_ANALISE["REAJUSTE_CONTEXTO_MESES"]):
+        return f"reajuste programado (último em {estado['mes_ajuste']})"
+    impressao_atual = calcular_impressao_meses(df[df['MES'] <= estado['mes_base']])
+    impressao_salva = estado.get('impressao_meses')
+    if impressao_salva is None:
+        return "estado sem impressão digital dos meses fechados"
+    alterados = sorted(mes for mes in set(impressao_atual) | set(impressao_salva) if impressao_atual.get(mes) != impressao_salva.get(mes))
+    if alterados:
+        return f"meses fechados alterados desde o último ajuste ({', '.join(map(str, alterados))})"
+    return None
+
+def detectar_anomalias_incremental(df: pd.DataFrame, unidade: str, contamination: float = 0.03) -> pd.DataFrame:
+    """
+    Ocorrências de contexto do ano da unidade (mesmas colunas de detectar_anomalias_de_contexto), pontuando
+    apenas o mês de referência (maior MES) contra o estado dos meses fechados. Meses fechados desde a última
+    execução são incorporados ao estado antes da pontuação.
+    """
+    if df.empty or len(df) < 10: return pd.DataFrame()
+    mes_referencia = int(df['MES'].max())
+    ano = int(df['DATA'].dt.year.max())
+    if not PARAMETROS_MODELOS["ATIVO"]:
+        logger.warning(f"⚠️  Contexto incremental '{unidade}': registro de modelos desativado (PARAMETROS_MODELOS['ATIVO']); "
+                       "o estado não é lido nem gravado e cada execução faz o ajuste completo.")
+    estado = registro_modelos.ler_estado(unidade, NOME_ESTADO, str(ano))
+    motivo = _motivo_reajuste(estado, df, ano, mes_referencia, contamination)
+    if motivo:
+        logger.info(f"Contexto incremental '{unidade}': reajuste completo ({motivo}).")
+        return _reajustar(df, unidade, ano, mes_referencia, contamination)
+
+    # --- Incorpora ao estado os meses fechados desde a última execução ---
+    df_fechar = df[(df['MES'] > estado['mes_base']) & (df['MES'] < mes_referencia)]
+    if not df_fechar.empty:
+        estado['acumuladores'] = combinar_acumuladores(estado['acumuladores'], calcular_acumuladores(df_fechar))
+        estado['impressao_meses'] = {**estado['impressao_meses'], **calcular_impressao_meses(df_fechar)}
+        df_analise_fechar = calcular_features_com_acumuladores(df_fechar, estado['acumuladores'])
+        _, previsoes_fechar = _pontuar(estado, df_analise_fechar)
+        estado['ocorrencias_base'] = pd.concat([estado['ocorrencias_base'], _selecionar_ocorrencias_de_contexto(df_analise_fechar, previsoes_fechar)], ignore_index=True)
+    estado['mes_base'] = mes_referencia - 1
+
+    # --- Pontua apenas o mês de referência ---
+    df_mes = df[df['MES'] == mes_referencia]
+    df_analise_mes = calcular_features_com_acumuladores(df_mes, combinar_acumuladores(estado['acumuladores'], calcular_acumuladores(df_mes)))
+    scores, previsoes = _pontuar(estado, df_analise_mes)
+    deriva = abs(float(scores.mean()) - estado['score_medio']) / estado['score_desvio'] if estado['score_desvio'] > 0 else 0.0
+    if deriva > float(PARAMETROS_ANALISE["LIMITE_DERIVA_CONTEXTO"]):
+        logger.info(f"Contexto incremental '{unidade}': deriva de {deriva:.2f} desvios no score do mês {mes_referencia}. Reajuste completo.")
+        return _reajustar(df, unidade, ano, mes_referencia, contamination)
+
+    registro_modelos.gravar_estado(unidade, NOME_ESTADO, str(ano), estado)
+    logger.info(f"Contexto incremental '{unidade}': {len(df_mes)} lançamentos do mês {mes_referencia} pontuados (deriva {deriva:.2f}).")
+    ocorrencias_mes = _selecionar_ocorrencias_de_contexto(df_analise_mes, previsoes)
+    return pd.concat([estado['ocorrencias_base'], ocorrencias_mes], ignore_index=True)
@@ -1,13 +1,23 @@
 # analise_despesa/exportacao.py
 import pandas as pd
+import gzip
+import io
 import logging
 import os
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from ..config import PARAMETROS_ANEXO
+from ..exceptions import AnaliseDespesaError
 
 logger = logging.getLogger(__name__)
 
-def exportar_dataframe_para_csv(df: pd.DataFrame, caminho_arquivo: str, nome_relatorio: str):
+def exportar_dataframe_para_csv(df: pd.DataFrame, caminho_arquivo: str, nome_relatorio: str, acrescentar: bool = False):
     """
     Função genérica para exportar qualquer DataFrame para um arquivo CSV.
+    Com 'acrescentar', as linhas vão para o fim do arquivo existente (cabeçalho só na criação), alinhadas às
+    colunas do cabeçalho já gravado: colunas ausentes ficam vazias e colunas novas são descartadas com aviso.
     """
     # Garante que o diretório de saída exista
     try:
@@ -22,13 +32,95 @@ def exportar_dataframe_para_csv(df: pd.DataFrame, caminho_arquivo: str, nome_rel
 
     logger.info(f"Exportando {len(df)} linhas para o relatório '{nome_relatorio}' em: '{caminho_arquivo}'...")
     try:
+        acrescentar = acrescentar and os.path.exists(caminho_arquivo)
+        if acrescentar:
+            colunas = pd.read_csv(caminho_arquivo, sep=';', encoding='utf-8-sig', nrows=0).columns.tolist()
+            descartadas = [coluna for coluna in df.columns if coluna not in colunas]
+            if descartadas:
+                logger.warning(f"⚠️  Colunas {descartadas} não existem no cabeçalho de '{caminho_arquivo}' e não serão gravadas.")
+            df = df.reindex(columns=colunas)
         df.to_csv(
             caminho_arquivo,
             index=False,
             sep=';',
-            encoding='utf-8-sig'
+            encoding='utf-8-sig',
+            mode='a' if acrescentar else 'w',
+            header=not acrescentar
         )
         logger.info(f"Relatório '{nome_relatorio}' salvo com sucesso.")
     except Exception as e:
         logger.error(f"Falha ao exportar o relatório '{nome_relatorio}'. Erro: {e}", exc_info=True)
 
+
+FORMATOS_ANEXO = ("zip", "gzip", "parquet", "xlsx", "csv")
+
+class _ContadorDeBytes(io.RawIOBase):
+    """Repassa o que é escrito ao destino e conta os bytes (tamanho do CSV antes da compactação)."""
+    def __init__(self, destino):
+        self.destino, self.total = destino, 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, dados) -> int:
+        self.total += len(dados)
+        return self.destino.write(dados)
+
+def _gravar_csv_em_fluxo(df: pd.DataFrame, destino_binario) -> int:
+    """Escreve o CSV (';' e UTF-8 com BOM, como o anexo original) direto no fluxo binário e devolve os bytes gerados."""
+    contador = _ContadorDeBytes(destino_binario)
+    texto = io.TextIOWrapper(contador, encoding='utf-8-sig', newline='')
+    try:
+        df.to_csv(texto, index=False, sep=';')
+    finally:
+        # Desacopla sem fechar: quem abriu o destino (zip/gzip) é quem o finaliza.
+        texto.flush()
+        texto.detach()
+    return contador.total
+
+def exportar_anexo(df: pd.DataFrame, caminho_csv: Path, formato: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Grava o anexo do relatório no formato configurado (PARAMETROS_ANEXO) a partir do nome do CSV.
+    Nos formatos compactados o CSV é comprimido enquanto é escrito, sem cópia descompactada em disco ou na memória.
+    Retorna o caminho gravado, o tamanho final, o tamanho sem compactação e a taxa de compressão.
+    """
+    formato = formato or PARAMETROS_ANEXO["FORMATO"]
+    if formato not in FORMATOS_ANEXO:
+        raise AnaliseDespesaError(f"Formato de anexo '{formato}' inválido. Use um de {FORMATOS_ANEXO}.")
+    caminho_csv = Path(caminho_csv)
+    caminho_csv.parent.mkdir(parents=True, exist_ok=True)
+    nivel = int(PARAMETROS_ANEXO["NIVEL_COMPRESSAO"])
+
+    if formato == "xlsx":
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            logger.warning("⚠️  openpyxl não instalado: o anexo será gerado em 'zip' no lugar de 'xlsx'.")
+            formato = "zip"
+
+    if formato == "zip":
+        caminho = caminho_csv.with_suffix(".zip")
+        with zipfile.ZipFile(caminho, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=nivel) as arquivo_zip:
+            with arquivo_zip.open(caminho_csv.name, 'w', force_zip64=True) as destino:
+                bytes_originais = _gravar_csv_em_fluxo(df, destino)
+    elif formato == "gzip":
+        caminho = caminho_csv.with_name(caminho_csv.name + ".gz")
+        with gzip.open(caminho, 'wb', compresslevel=nivel) as destino:
+            bytes_originais = _gravar_csv_em_fluxo(df, destino)
+    elif formato == "csv":
+        caminho = caminho_csv
+        with open(caminho, 'wb') as destino:
+            bytes_originais = _gravar_csv_em_fluxo(df, destino)
+    else:
+        # Parquet e XLSX não passam por CSV: a referência da compressão é o tamanho do DataFrame em memória.
+        caminho = caminho_csv.with_suffix(f".{formato}")
+        if formato == "parquet":
+            df.to_parquet(caminho, index=False, compression='zstd')
+        else:
+            df.to_excel(caminho, index=False)
+        bytes_originais = int(df.memory_usage(index=False, deep=True).sum())
+
+    bytes_arquivo = caminho.stat().st_size
+    taxa = bytes_originais / bytes_arquivo if bytes_arquivo else float('nan')
+    logger.info(f"Anexo '{caminho.name}' gravado: {bytes_arquivo / 1024:.1f} KB ({bytes_originais / 1024:.1f} KB sem compactação, taxa {taxa:.1f}x).")
+    return {"caminho": caminho, "formato": formato, "bytes_arquivo": bytes_arquivo, "bytes_originais": bytes_originais, "taxa_compressao": taxa}
@@ -0,0 +1,159 @@
+# analise_despesa/analise/features.py
+"""
+Repositório de features dos modelos de insights_ia.
+
+As frequências de fornecedor/projeto, o Z-Score por (FORNECEDOR, PROJETO), as frequências usadas
+na investigação de causa raiz e as features de comportamento das contas (DESC_NIVEL_4) são calculadas uma única vez por execução,
+para todas as unidades, com groupby/transform. O resultado fica em memória e em disco (joblib),
+identificado pela impressão digital da base analisada.
+"""
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from ..config import PARAMETROS_FEATURES
+from . import registro_modelos
+
+logger = logging.getLogger(__name__)
+
+COLUNAS_IMPRESSAO_DIGITAL = ['UNIDADE', 'tipo_projeto', 'FORNECEDOR', 'PROJETO', 'DESC_NIVEL_4', 'MES', 'VALOR']
+# Incrementar quando o conteúdo do repositório mudar, para invalidar os arquivos joblib antigos.
+VERSAO_REPOSITORIO = 2
+
+_CACHE_MEMORIA: Dict[str, "RepositorioFeatures"] = {}
+
+class RepositorioFeatures:
+    """
+    Features de todas as unidades, indexadas por UNIDADE.
+    'contexto' usa o mesmo índice de linhas da base analisada (apenas projetos exclusivos).
+    """
+    def __init__(self, contexto: pd.DataFrame, freq_fornecedor: pd.Series, freq_combinacao: pd.Series,
+                 comportamento: pd.DataFrame, impressao_digital: str = ""):
+        self.contexto = contexto
+        self.freq_fornecedor = freq_fornecedor
+        self.freq_combinacao = freq_combinacao
+        self.comportamento = comportamento
+        self.impressao_digital = impressao_digital
+
+    @classmethod
+    def construir(cls, df: pd.DataFrame, impressao_digital: str = "") -> "RepositorioFeatures":
+        """Calcula as features de todas as unidades da base (UNIDADE já normalizada)."""
+        df_exclusivo = df[df['tipo_projeto'] == 'Exclusivo']
+
+        # --- Features de contexto (detectar_anomalias_de_contexto), por linha ---
+        chaves_par = [df_exclusivo['UNIDADE'], df_exclusivo['FORNECEDOR'], df_exclusivo['PROJETO']]
+        media = df_exclusivo.groupby(chaves_par, observed=True)['VALOR'].transform('mean')
+        desvio = df_exclusivo.groupby(chaves_par, observed=True)['VALOR'].transform('std').fillna(0)
+        z_score = pd.Series(np.where(desvio > 0, (df_exclusivo['VALOR'] - media) / desvio, 0), index=df_exclusivo.index).fillna(0)
+        contexto = pd.DataFrame({
+            'UNIDADE': df_exclusivo['UNIDADE'],
+            'FREQ_FORNECEDOR': df_exclusivo.groupby(['UNIDADE', 'FORNECEDOR'], observed=True)['FORNECEDOR'].transform('count'),
+            'FREQ_PROJETO': df_exclusivo.groupby(['UNIDADE', 'PROJETO'], observed=True)['PROJETO'].transform('count'),
+            'Z_SCORE_VALOR': z_score,
+        })
+
+        # --- Frequências da investigação de causa raiz (todos os tipos de projeto) ---
+        freq_fornecedor = df.groupby(['UNIDADE', 'FORNECEDOR'], observed=True).size()
+        freq_combinacao = df.groupby(['UNIDADE', 'FORNECEDOR', 'PROJETO'], observed=True).size()
+
+        # --- Comportamento das contas (segmentar_contas_por_comportamento), de todas as unidades em uma chamada ---
+        comportamento = calcular_features_de_comportamento(df_exclusivo, chaves=['UNIDADE', 'DESC_NIVEL_4'])
+        return cls(contexto, freq_fornecedor, freq_combinacao, comportamento, impressao_digital)
+
+    def recortar(self, unidade: str) -> "RepositorioFeatures":
+        """Devolve um repositório apenas com a unidade informada (leve para enviar a outro processo)."""
+        def _linhas_da_unidade(obj):
+            return obj[obj.index.get_level_values('UNIDADE') == unidade]
+        return RepositorioFeatures(
+            self.contexto[self.contexto['UNIDADE'] == unidade], _linhas_da_unidade(self.freq_fornecedor),
+            _linhas_da_unidade(self.freq_combinacao), _linhas_da_unidade(self.comportamento), self.impressao_digital
+        )
+
+    def features_de_contexto(self, df: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """Features de contexto das linhas de 'df', ou None se alguma linha não estiver no repositório."""
+        if not df.index.isin(self.contexto.index).all():
+            return None
+        return self.contexto.loc[df.index, ['FREQ_FORNECEDOR', 'FREQ_PROJETO', 'Z_SCORE_VALOR']]
+
+    def frequencias(self, unidade: str):
+        """Retorna (lançamentos por fornecedor, lançamentos por fornecedor x projeto) da unidade."""
+        return _da_unidade(self.freq_fornecedor, unidade), _da_unidade(self.freq_combinacao, unidade)
+
+    def comportamento_contas(self, unidade: str) -> pd.DataFrame:
+        """Features de comportamento por DESC_NIVEL_4 dos projetos exclusivos da unidade (ver calcular_features_de_comportamento)."""
+        return _da_unidade(self.comportamento, unidade)
+
+def _da_unidade(obj, unidade: str):
+    """Seleciona a unidade no primeiro nível do índice, removendo o nível."""
+    mascara = obj.index.get_level_values('UNIDADE') == unidade
+    return obj[mascara].droplevel('UNIDADE')
+
+def calcular_features_de_comportamento(df: pd.DataFrame, chaves: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Features de comportamento de cada combinação de 'chaves' (padrão: DESC_NIVEL_4), em uma única chamada:
+    valor_total e frequencia (lançamentos) do período, e, a partir da matriz chaves x MES com os meses positivos
+    mascarados (numpy.ma), coef_variacao dos totais mensais positivos (0 com menos de 2 meses), meses_ativos
+    e concentracao_pico (participação do maior mês no total dos meses positivos).
+    """
+    chaves = chaves or ['DESC_NIVEL_4']
+    comportamento = df.groupby(chaves, observed=True).agg(valor_total=('VALOR', 'sum'), frequencia=('VALOR', 'count'))
+    matriz = df.groupby(chaves + ['MES'], observed=True)['VALOR'].sum().unstack(fill_value=0).reindex(comportamento.index, fill_value=0)
+
+    positivos = np.ma.masked_less_equal(matriz.to_numpy(dtype='float64'), 0)
+    meses_ativos = positivos.count(axis=1)
+    media = positivos.mean(axis=1).filled(0)
+    desvio = positivos.std(axis=1, ddof=1).filled(0)
+    total_positivo = positivos.sum(axis=1).filled(0)
+    comportamento['coef_variacao'] = np.where((meses_ativos >= 2) & (media > 0), desvio / np.where(media > 0, media, 1), 0.0)
+    comportamento['meses_ativos'] = meses_ativos
+    comportamento['concentracao_pico'] = np.where(total_positivo > 0, positivos.max(axis=1).filled(0) / np.where(total_positivo > 0, total_positivo, 1), 0.0)
+    return comportamento
+
+def calcular_impressao_digital(df: pd.DataFrame) -> str:
+    """Hash do conteúdo (e do índice) das colunas usadas nas features e da versão do repositório."""
+    colunas = [coluna for coluna in COLUNAS_IMPRESSAO_DIGITAL if coluna in df.columns]
+    hashes = pd.util.hash_pandas_object(df[colunas], index=True).to_numpy()
+    return hashlib.sha256(hashes.tobytes() + f"{VERSAO_REPOSITORIO}:{','.join(colunas)}".encode("utf-8")).hexdigest()
+
+def construir_repositorio_features(df: pd.DataFrame) -> RepositorioFeatures:
+    """Retorna o repositório de features da base, a partir da memória, do disco ou calculando-o."""
+    impressao_digital = calcular_impressao_digital(df)
+    if impressao_digital in _CACHE_MEMORIA:
+        logger.info(f"⚡ Features reaproveitadas da memória ('{impressao_digital[:12]}').")
+        return _CACHE_MEMORIA[impressao_digital]
+
+    caminho = Path(PARAMETROS_FEATURES["DIRETORIO"]) / f"{impressao_digital}.joblib"
+    repositorio = None
+    if PARAMETROS_FEATURES["CACHE_EM_DISCO"] and caminho.exists():
+        try:
+            repositorio = joblib.load(caminho)
+            # Atualiza apenas o horário de acesso (LRU da retenção), preservando o de gravação (idade).
+            os.utime(caminho, (time.time(), caminho.stat().st_mtime))
+            logger.info(f"⚡ Features carregadas do disco ('{impressao_digital[:12]}').")
+        except Exception as e:
+            logger.warning(f"⚠️  Arquivo de features '{caminho.name}' ilegível e será recalculado. Erro: {e}")
+
+    if repositorio is None:
+        logger.info(f"Calculando features dos modelos de IA para {df['UNIDADE'].nunique()} unidades...")
+        repositorio = RepositorioFeatures.construir(df, impressao_digital)
+        if PARAMETROS_FEATURES["CACHE_EM_DISCO"]:
+            try:
+                caminho.parent.mkdir(parents=True, exist_ok=True)
+                joblib.dump(repositorio, caminho)
+            except Exception as e:
+                logger.warning(f"⚠️  Não foi possível gravar as features em disco. Erro: {e}")
+
+    _CACHE_MEMORIA[impressao_digital] = repositorio
+    return repositorio
+
+def aplicar_retencao() -> None:
+    """Remove os arquivos de features antigos ou menos usados (IDADE_MAXIMA_DIAS e TAMANHO_MAXIMO_MB de PARAMETROS_FEATURES)."""
+    registro_modelos.aplicar_retencao(PARAMETROS_FEATURES["DIRETORIO"], PARAMETROS_FEATURES["IDADE_MAXIMA_DIAS"],
+                                      PARAMETROS_FEATURES["TAMANHO_MAXIMO_MB"])
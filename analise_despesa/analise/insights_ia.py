@@ -1,74 +1,123 @@
 # analise_despesa/analise/insights_ia.py (VERSÃO FINAL COM AJUSTE DE ROBUSTEZ)
 import pandas as pd
 import logging
-from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.cluster import KMeans
 from scipy.sparse import hstack
-from typing import Dict, Tuple, Any
+from typing import Dict, Tuple, Any, Optional
 import numpy as np
+from ..config import PARAMETROS_MODELOS
+from . import registro_modelos
+from .anomalias import ajustar_e_prever, prever_em_lote
+from .features import RepositorioFeatures, calcular_features_de_comportamento
 
 logger = logging.getLogger(__name__)
 
-def detectar_anomalias_de_contexto(df: pd.DataFrame, contamination: float = 0.03) -> pd.DataFrame:
-    # (Código inalterado)
+FEATURES_DE_CONTEXTO = ['Z_SCORE_VALOR', 'FREQ_FORNECEDOR', 'FREQ_PROJETO']
+
+def detectar_anomalias_de_contexto(df: pd.DataFrame, contamination: float = 0.03, features: Optional[RepositorioFeatures] = None) -> pd.DataFrame:
+    """
+    Detecta ocorrências atípicas pelo contexto (frequências e Z-Score do par Fornecedor-Projeto).
+    Com 'features', as colunas de contexto vêm do repositório da execução em vez de serem recalculadas.
+    """
     if df.empty or len(df) < 10: return pd.DataFrame()
+    df_analise, features_scaled, _ = _preparar_features_de_contexto(df, features)
+    return _selecionar_ocorrencias_de_contexto(df_analise, ajustar_e_prever(features_scaled, contamination=contamination))
+
+def detectar_anomalias_em_lote(dfs_por_unidade: Dict[str, pd.DataFrame], contamination: float = 0.03,
+                               features: Optional[RepositorioFeatures] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Versão em lote de detectar_anomalias_de_contexto: prepara as features de todas as unidades e ajusta
+    os modelos em paralelo (anomalias.prever_em_lote). O resultado de cada unidade é o mesmo da chamada individual.
+    """
+    preparados = {unidade: _preparar_features_de_contexto(df, features) for unidade, df in dfs_por_unidade.items() if not (df.empty or len(df) < 10)}
+    previsoes = prever_em_lote({unidade: features_scaled for unidade, (_, features_scaled, _) in preparados.items()}, contamination=contamination, detector='modelo', nome_modelo='iforest_contexto')
+    return {unidade: _selecionar_ocorrencias_de_contexto(preparados[unidade][0], previsoes[unidade]) if unidade in preparados else pd.DataFrame()
+            for unidade in dfs_por_unidade}
+
+def _preparar_features_de_contexto(df: pd.DataFrame, features: Optional[RepositorioFeatures]) -> Tuple[pd.DataFrame, np.ndarray, StandardScaler]:
     logger.info("Iniciando detecção de ocorrências atípicas com Engenharia de Features e Z-Score...")
-    df_analise = df.copy()
-    df_analise['FREQ_FORNECEDOR'] = df_analise.groupby('FORNECEDOR')['FORNECEDOR'].transform('count')
-    df_analise['FREQ_PROJETO'] = df_analise.groupby('PROJETO')['PROJETO'].transform('count')
-    group_stats = df_analise.groupby(['FORNECEDOR', 'PROJETO'])['VALOR'].agg(['mean', 'std']).reset_index()
-    df_analise = pd.merge(df_analise, group_stats, on=['FORNECEDOR', 'PROJETO'], how='left')
-    df_analise['std'] = df_analise['std'].fillna(0)
-    df_analise['Z_SCORE_VALOR'] = np.where(df_analise['std'] > 0, (df_analise['VALOR'] - df_analise['mean']) / df_analise['std'], 0)
-    df_analise['Z_SCORE_VALOR'] = df_analise['Z_SCORE_VALOR'].fillna(0)
-    features_para_analise = ['Z_SCORE_VALOR', 'FREQ_FORNECEDOR', 'FREQ_PROJETO']
+    df_contexto = features.features_de_contexto(df) if features is not None else None
+    if df_contexto is not None:
+        df_analise = pd.concat([df, df_contexto], axis=1).reset_index(drop=True)
+    else:
+        df_analise = df.copy()
+        df_analise['FREQ_FORNECEDOR'] = df_analise.groupby('FORNECEDOR', observed=True)['FORNECEDOR'].transform('count')
+        df_analise['FREQ_PROJETO'] = df_analise.groupby('PROJETO', observed=True)['PROJETO'].transform('count')
+        group_stats = df_analise.groupby(['FORNECEDOR', 'PROJETO'], observed=True)['VALOR'].agg(['mean', 'std']).reset_index()
+        df_analise = pd.merge(df_analise, group_stats, on=['FORNECEDOR', 'PROJETO'], how='left')
+        df_analise['std'] = df_analise['std'].fillna(0)
+        df_analise['Z_SCORE_VALOR'] = np.where(df_analise['std'] > 0, (df_analise['VALOR'] - df_analise['mean']) / df_analise['std'], 0)
+        df_analise['Z_SCORE_VALOR'] = df_analise['Z_SCORE_VALOR'].fillna(0)
     scaler = StandardScaler()
-    features_scaled = scaler.fit_transform(df_analise[features_para_analise])
-    modelo_ia = IsolationForest(contamination=contamination, random_state=42)
-    df_analise['ocorrencia_contexto'] = modelo_ia.fit_predict(features_scaled)
+    return df_analise, scaler.fit_transform(df_analise[FEATURES_DE_CONTEXTO]), scaler
+
+def _selecionar_ocorrencias_de_contexto(df_analise: pd.DataFrame, previsoes: np.ndarray) -> pd.DataFrame:
+    df_analise['ocorrencia_contexto'] = previsoes
     ocorrencias_contexto = df_analise[df_analise['ocorrencia_contexto'] == -1].copy()
     logger.info(f"Análise de contexto com Z-Score concluída. Encontradas {len(ocorrencias_contexto)} ocorrências atípicas.")
     colunas_relevantes = ['DATA', 'FORNECEDOR', 'PROJETO', 'VALOR', 'COMPLEMENTO', 'Z_SCORE_VALOR']
     return ocorrencias_contexto[colunas_relevantes]
 
-def investigar_causa_raiz_ocorrencia(df_ocorrencias: pd.DataFrame, df_historico_completo: pd.DataFrame) -> pd.DataFrame:
-    # (Código inalterado)
+def _acrescentar_razao(justificativas: np.ndarray, mascara: np.ndarray, textos: np.ndarray) -> None:
+    """Anexa 'textos' às justificativas das linhas marcadas, separando as razões com ' | '."""
+    atuais = justificativas[mascara]
+    separadores = np.where(atuais == "", "", " | ").astype(object)
+    justificativas[mascara] = atuais + separadores + textos
+
+def investigar_causa_raiz_ocorrencia(df_ocorrencias: pd.DataFrame, df_historico_completo: pd.DataFrame,
+                                     features: Optional[RepositorioFeatures] = None, unidade: Optional[str] = None) -> pd.DataFrame:
+    """
+    Gera a 'Justificativa IA' de cada ocorrência. As regras (Z-Score, combinação rara e fornecedor pouco ativo)
+    são avaliadas como máscaras sobre as frequências do histórico, e os textos são montados por coluna.
+    Com 'features' e 'unidade', as frequências vêm do repositório da execução.
+    """
     if df_ocorrencias.empty: return df_ocorrencias
     logger.info(f"Iniciando investigação de causa raiz para {len(df_ocorrencias)} ocorrências...")
     df_investigado = df_ocorrencias.copy()
-    freq_fornecedor_geral = df_historico_completo['FORNECEDOR'].value_counts()
-    freq_combinacao_geral = df_historico_completo.groupby(['FORNECEDOR', 'PROJETO']).size()
-    justificativas = []
-    for idx, ocorrencia in df_investigado.iterrows():
-        razoes = []
-        fornecedor, projeto = ocorrencia['FORNECEDOR'], ocorrencia['PROJETO']
-        if 'Z_SCORE_VALOR' in ocorrencia and abs(ocorrencia['Z_SCORE_VALOR']) > 2.0: razoes.append(f"Valor (R$ {ocorrencia['VALOR']:.0f}) é um pico ou vale estatístico (Z-Score: {ocorrencia['Z_SCORE_VALOR']:.2f}) para esta combinação.")
-        if freq_combinacao_geral.get((fornecedor, projeto), 0) <= 2: razoes.append(f"Combinação Fornecedor-Projeto rara (vista {freq_combinacao_geral.get((fornecedor, projeto), 0)}x no ano).")
-        if freq_fornecedor_geral.get(fornecedor, 0) <= 3: razoes.append(f"Fornecedor com baixa atividade geral na unidade ({freq_fornecedor_geral.get(fornecedor, 0)} lançamentos no ano).")
-        if not razoes: razoes.append("Combinação de fatores (valor, frequência) considerada incomum pela IA.")
-        justificativas.append(" | ".join(razoes))
+    if features is not None and unidade is not None:
+        freq_fornecedor_geral, freq_combinacao_geral = features.frequencias(unidade)
+    else:
+        freq_fornecedor_geral = df_historico_completo['FORNECEDOR'].value_counts()
+        freq_combinacao_geral = df_historico_completo.groupby(['FORNECEDOR', 'PROJETO'], observed=True).size()
+
+    # --- Frequências de cada ocorrência (0 quando a chave não aparece no histórico) ---
+    chaves_combinacao = pd.MultiIndex.from_arrays([df_investigado['FORNECEDOR'], df_investigado['PROJETO']])
+    freq_combinacao = freq_combinacao_geral.reindex(chaves_combinacao).fillna(0).to_numpy(dtype='int64')
+    freq_fornecedor = freq_fornecedor_geral.reindex(df_investigado['FORNECEDOR'].to_numpy()).fillna(0).to_numpy(dtype='int64')
+
+    justificativas = np.full(len(df_investigado), "", dtype=object)
+    if 'Z_SCORE_VALOR' in df_investigado.columns:
+        z_score = df_investigado['Z_SCORE_VALOR'].to_numpy(dtype='float64')
+        mascara = np.abs(z_score) > 2.0
+        if mascara.any():
+            valores = np.char.mod('%.0f', df_investigado['VALOR'].to_numpy(dtype='float64')[mascara]).astype(object)
+            textos = "Valor (R$ " + valores + ") é um pico ou vale estatístico (Z-Score: " + np.char.mod('%.2f', z_score[mascara]).astype(object) + ") para esta combinação."
+            _acrescentar_razao(justificativas, mascara, textos)
+    mascara = freq_combinacao <= 2
+    if mascara.any():
+        _acrescentar_razao(justificativas, mascara, "Combinação Fornecedor-Projeto rara (vista " + freq_combinacao[mascara].astype(str).astype(object) + "x no ano).")
+    mascara = freq_fornecedor <= 3
+    if mascara.any():
+        _acrescentar_razao(justificativas, mascara, "Fornecedor com baixa atividade geral na unidade (" + freq_fornecedor[mascara].astype(str).astype(object) + " lançamentos no ano).")
+    justificativas[justificativas == ""] = "Combinação de fatores (valor, frequência) considerada incomum pela IA."
+
     df_investigado['Justificativa IA'] = justificativas
     df_investigado.drop(columns=['Z_SCORE_VALOR'], inplace=True, errors='ignore')
     logger.info("Investigação concluída.")
     return df_investigado
 
-def segmentar_contas_por_comportamento(df_a_segmentar: pd.DataFrame, n_clusters: int = 3) -> Tuple[Dict[str, pd.DataFrame], Dict[str, Dict[str, Any]]]:
+def segmentar_contas_por_comportamento(df_a_segmentar: pd.DataFrame, n_clusters: int = 3,
+                                       features: Optional[RepositorioFeatures] = None, unidade: Optional[str] = None) -> Tuple[Dict[str, pd.DataFrame], Dict[str, Dict[str, Any]]]:
     logger.info(f"Iniciando segmentação de contas contábeis (Nível 4) com {n_clusters} clusters...")
     if df_a_segmentar.empty or 'DESC_NIVEL_4' not in df_a_segmentar.columns:
         logger.warning("DataFrame para segmentação vazio ou sem 'DESC_NIVEL_4'.")
         return {}, {}
-    df_mensal_conta = df_a_segmentar.groupby(['DESC_NIVEL_4', 'MES'])['VALOR'].sum().unstack(fill_value=0)
-    df_comportamento = df_a_segmentar.groupby('DESC_NIVEL_4').agg(valor_total=('VALOR', 'sum'), frequencia=('VALOR', 'count')).reset_index()
-    def calcular_cv(group_name):
-        if group_name in df_mensal_conta.index:
-            valores_mensais = df_mensal_conta.loc[group_name][df_mensal_conta.loc[group_name] > 0]
-            if len(valores_mensais) < 2: return 0.0
-            media = valores_mensais.mean()
-            desvio_padrao = valores_mensais.std()
-            if media > 0: return desvio_padrao / media
-        return 0.0
-    df_comportamento['coef_variacao'] = df_comportamento['DESC_NIVEL_4'].apply(calcular_cv)
+    if features is not None and unidade is not None:
+        # Features das contas já calculadas para os projetos exclusivos de todas as unidades.
+        df_comportamento = features.comportamento_contas(unidade).reset_index()
+    else:
+        df_comportamento = calcular_features_de_comportamento(df_a_segmentar).reset_index()
     df_comportamento = df_comportamento[(df_comportamento['valor_total'] != 0) & (df_comportamento['frequencia'] > 0)].copy()
     
     # --- CORREÇÃO DE ROBUSTEZ ---
@@ -80,10 +129,7 @@ def segmentar_contas_por_comportamento(df_a_segmentar: pd.DataFrame, n_clusters:
         logger.warning(f"Número de agrupamentos ({len(df_comportamento)}) é menor que o de clusters desejado. Ajustando para {n_clusters} clusters.")
 
     features_para_cluster = ['valor_total', 'frequencia', 'coef_variacao']
-    scaler = StandardScaler()
-    df_scaled = pd.DataFrame(scaler.fit_transform(df_comportamento[features_para_cluster]), columns=features_para_cluster, index=df_comportamento.index)
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init='auto')
-    df_comportamento['cluster'] = kmeans.fit_predict(df_scaled)
+    df_comportamento['cluster'] = _agrupar_contas(df_comportamento[features_para_cluster], n_clusters, escopo=unidade)
     clusters_tabelas = {}
     clusters_resumo = {}
     centroids = df_comportamento.groupby('cluster')[features_para_cluster].mean()
@@ -119,3 +165,34 @@ def segmentar_contas_por_comportamento(df_a_segmentar: pd.DataFrame, n_clusters:
         logger.info(f"Cluster {cluster_id} nomeado como '{name}' com {len(df_cluster)} agrupamentos.")
     logger.info("Segmentação de contas contábeis (Nível 4) concluída.")
     return clusters_tabelas, clusters_resumo
+
+def _agrupar_contas(df_features: pd.DataFrame, n_clusters: int, escopo: Optional[str] = None) -> np.ndarray:
+    """
+    Padroniza as features e agrupa as contas com KMeans. Com 'escopo' (a unidade), usa o registro de modelos:
+    dados já vistos são apenas pontuados; dados novos partem dos centróides do último modelo da unidade (warm start).
+    """
+    if escopo is None:
+        scaler = StandardScaler()
+        df_scaled = pd.DataFrame(scaler.fit_transform(df_features), columns=df_features.columns, index=df_features.index)
+        return KMeans(n_clusters=n_clusters, random_state=42, n_init='auto').fit_predict(df_scaled)
+
+    impressao_digital = registro_modelos.calcular_impressao_digital(df_features, n_clusters=n_clusters, random_state=42)
+    salvo = registro_modelos.ler_modelo(escopo, 'kmeans_contas', impressao_digital)
+    if salvo is not None:
+        scaler, kmeans = salvo
+        logger.info(f"Segmentação reaproveitada do registro de modelos ('{escopo}').")
+        return kmeans.predict(pd.DataFrame(scaler.transform(df_features), columns=df_features.columns, index=df_features.index))
+
+    scaler = StandardScaler().fit(df_features)
+    df_scaled = pd.DataFrame(scaler.transform(df_features), columns=df_features.columns, index=df_features.index)
+    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init='auto')
+    anterior = registro_modelos.ler_ultimo_modelo(escopo, 'kmeans_contas') if PARAMETROS_MODELOS["WARM_START_KMEANS"] else None
+    if anterior is not None and anterior[1].n_clusters == n_clusters and anterior[1].n_features_in_ == df_features.shape[1]:
+        scaler_anterior, kmeans_anterior = anterior
+        # Centróides anteriores levados para a escala dos dados atuais.
+        centroides = pd.DataFrame(scaler_anterior.inverse_transform(kmeans_anterior.cluster_centers_), columns=df_features.columns)
+        kmeans = KMeans(n_clusters=n_clusters, init=scaler.transform(centroides), n_init=1, random_state=42)
+        logger.info(f"Segmentação com warm start a partir dos centróides anteriores ('{escopo}').")
+    rotulos = kmeans.fit_predict(df_scaled)
+    registro_modelos.gravar_modelo(escopo, 'kmeans_contas', impressao_digital, (scaler, kmeans))
+    return rotulos
@@ -2,11 +2,22 @@
 # NOVO ARQUIVO: Contém a lógica para previsão de séries temporais.
 
 import pandas as pd
+import numpy as np
 import logging
-from statsmodels.tsa.statespace.sarima import SARIMAX
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+from ..config import PARAMETROS_PREVISAO
+from . import registro_modelos
 
 logger = logging.getLogger(__name__)
 
+# Quantil da normal para o intervalo de 90% (o mesmo alpha=0.10 do SARIMAX).
+Z_INTERVALO_90 = 1.6448536269514722
+COLUNAS_PREVISAO = ['Mês Previsto', 'Previsão', 'Mínimo Esperado', 'Máximo Esperado']
+
 def prever_proximos_meses(df_historico_mensal: pd.DataFrame, meses_a_prever: int = 3) -> pd.DataFrame:
     """
     Prevê os gastos para os próximos meses com base no histórico mensal.
@@ -29,32 +40,15 @@ def prever_proximos_meses(df_historico_mensal: pd.DataFrame, meses_a_prever: int
     # Converte a coluna 'Mês' (ex: 'Jan', 'Fev') para um índice de data real
     mes_map_inverso = {'Jan': 1, 'Fev': 2, 'Mar': 3, 'Abr': 4, 'Mai': 5, 'Jun': 6, 'Jul': 7, 'Ago': 8, 'Set': 9, 'Out': 10, 'Nov': 11, 'Dez': 12}
     df_historico_mensal['num_mes'] = df_historico_mensal['Mês'].map(mes_map_inverso)
-    # Assume o ano atual para criar o índice de data
+    # Assume o ano atual para criar o índice de data (montado de uma vez, sem apply por linha)
     ano_atual = pd.Timestamp.now().year
-    df_historico_mensal.index = pd.to_datetime(df_historico_mensal.apply(lambda row: f"{ano_atual}-{int(row['num_mes'])}-01", axis=1))
+    df_historico_mensal.index = _datas_de_meses(df_historico_mensal['num_mes'], ano_atual)
     
     serie_temporal = df_historico_mensal['Valor'].resample('MS').sum()
 
     try:
-        # Instancia e treina o modelo SARIMAX.
-        # Parâmetros simples (1,1,1) são um bom ponto de partida.
-        # A ordem sazonal está zerada por simplicidade nesta primeira versão.
-        modelo_sarima = SARIMAX(serie_temporal, order=(1, 1, 1), seasonal_order=(0, 0, 0, 0))
-        resultado_sarima = modelo_sarima.fit(disp=False)
-
-        # Gera a previsão
-        previsao_obj = resultado_sarima.get_forecast(steps=meses_a_prever)
-        
-        # Converte a previsão para um DataFrame amigável
-        previsao_df = previsao_obj.summary_frame(alpha=0.10) # Intervalo de confiança de 90%
-        
-        previsao_df.reset_index(inplace=True)
-        previsao_df['Mês'] = previsao_df['index'].dt.strftime('%b/%Y')
-        
-        # Renomeia as colunas para o relatório
-        previsao_final = previsao_df[['Mês', 'mean', 'mean_ci_lower', 'mean_ci_upper']]
-        previsao_final.columns = ['Mês Previsto', 'Previsão', 'Mínimo Esperado', 'Máximo Esperado']
-        
+        previsao_final = _ajustar_sarimax(serie_temporal.to_numpy(dtype='float64'), serie_temporal.index[0], meses_a_prever)
+        previsao_final['Mês Previsto'] = previsao_final['Mês Previsto'].dt.strftime('%b/%Y')
         logger.info("Previsão gerada com sucesso.")
         return previsao_final
 
@@ -62,3 +56,165 @@ def prever_proximos_meses(df_historico_mensal: pd.DataFrame, meses_a_prever: int
         logger.error(f"Falha ao gerar a previsão de despesas. Erro: {e}", exc_info=True)
         return pd.DataFrame()
 
+def _datas_de_meses(meses: pd.Series, ano: int) -> pd.DatetimeIndex:
+    """Primeiro dia de cada mês (1-12) do ano, vetorizado."""
+    return pd.DatetimeIndex(pd.to_datetime(pd.DataFrame({'year': ano, 'month': meses.astype(int).to_numpy(), 'day': 1})))
+
+def _ajustar_sarimax(valores: np.ndarray, inicio: pd.Timestamp, meses_a_prever: int) -> pd.DataFrame:
+    """Ajusta o SARIMAX(1,1,1) na série mensal iniciada em 'inicio' e devolve a previsão com intervalo de 90%."""
+    serie_temporal = pd.Series(valores, index=pd.date_range(inicio, periods=len(valores), freq='MS'))
+    # Parâmetros simples (1,1,1) são um bom ponto de partida; a ordem sazonal está zerada nesta versão.
+    modelo_sarima = SARIMAX(serie_temporal, order=(1, 1, 1), seasonal_order=(0, 0, 0, 0))
+    resultado_sarima = modelo_sarima.fit(disp=False)
+    previsao_df = resultado_sarima.get_forecast(steps=meses_a_prever).summary_frame(alpha=0.10)
+    previsao_final = pd.DataFrame({
+        'Mês Previsto': previsao_df.index, 'Previsão': previsao_df['mean'].to_numpy(),
+        'Mínimo Esperado': previsao_df['mean_ci_lower'].to_numpy(), 'Máximo Esperado': previsao_df['mean_ci_upper'].to_numpy(),
+    })
+    return previsao_final
+
+# --- PREVISÃO EM LOTE ---
+
+def montar_matriz_de_series(df_longo: pd.DataFrame, chaves: List[str], coluna_mes: str = 'MES', coluna_valor: str = 'VALOR',
+                            ano: Optional[int] = None) -> pd.DataFrame:
+    """
+    Converte o formato longo (chaves, mês, valor) em uma matriz séries x meses (colunas = início de cada mês).
+    Cada série começa no seu primeiro mês com lançamentos (NaN antes dele) e vai até o último mês da base,
+    com 0 nos meses sem lançamentos, como no resample('MS').sum() da previsão individual.
+    """
+    meses = df_longo[coluna_mes]
+    if pd.api.types.is_datetime64_any_dtype(meses):
+        periodos = meses.dt.to_period('M').dt.to_timestamp()
+    else:
+        if ano is None:
+            raise ValueError("Informe 'ano' quando a coluna de mês for numérica (1-12).")
+        periodos = pd.Series(_datas_de_meses(meses, ano), index=df_longo.index)
+    somas = df_longo[coluna_valor].groupby([df_longo[chave] for chave in chaves] + [periodos.rename('_periodo')], observed=True).sum()
+    matriz = somas.unstack('_periodo')
+    matriz = matriz.reindex(columns=pd.date_range(matriz.columns.min(), matriz.columns.max(), freq='MS'))
+    ja_iniciada = matriz.notna().cumsum(axis=1) > 0
+    return matriz.fillna(0).where(ja_iniciada)
+
+def _suavizacao_exponencial(valores: np.ndarray, alfa: float, meses_a_prever: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Suavização exponencial simples em todas as linhas de uma vez (NaN à esquerda = série ainda não iniciada).
+    Retorna (previsões, desvios) por horizonte; o desvio do horizonte h é sigma * sqrt(1 + (h-1) * alfa^2).
+    """
+    nivel = np.full(valores.shape[0], np.nan)
+    soma_erros, n_erros = np.zeros(valores.shape[0]), np.zeros(valores.shape[0])
+    for t in range(valores.shape[1]):
+        y = valores[:, t]
+        com_nivel = ~np.isnan(nivel) & ~np.isnan(y)
+        erro = np.where(com_nivel, y - np.nan_to_num(nivel), 0.0)
+        soma_erros += erro ** 2
+        n_erros += com_nivel
+        nivel = np.where(np.isnan(nivel), y, np.where(np.isnan(y), nivel, alfa * np.nan_to_num(y) + (1 - alfa) * np.nan_to_num(nivel)))
+    sigma = np.sqrt(np.divide(soma_erros, n_erros, out=np.zeros_like(soma_erros), where=n_erros > 0))
+    horizontes = np.arange(1, meses_a_prever + 1)
+    previsoes = np.repeat(nivel[:, None], meses_a_prever, axis=1)
+    desvios = sigma[:, None] * np.sqrt(1 + (horizontes[None, :] - 1) * alfa ** 2)
+    return previsoes, desvios
+
+def _sazonal_ingenuo(valores: np.ndarray, meses_a_prever: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Repete o valor do mesmo mês do ano anterior (exige 12 meses). Desvio: das diferenças sazonais disponíveis."""
+    indices = valores.shape[1] - 12 + (np.arange(meses_a_prever) % 12)
+    previsoes = valores[:, indices]
+    diferencas = valores[:, 12:] - valores[:, :-12] if valores.shape[1] > 12 else np.empty((valores.shape[0], 0))
+    sigma = np.sqrt(np.nanmean(diferencas ** 2, axis=1)) if diferencas.shape[1] else np.full(valores.shape[0], np.nan)
+    return previsoes, np.repeat(sigma[:, None], meses_a_prever, axis=1)
+
+def _previsoes_em_forma_fechada(matriz: pd.DataFrame, meses_a_prever: int, metodo: str) -> Dict[Tuple, pd.DataFrame]:
+    if matriz.empty:
+        return {}
+    valores = matriz.to_numpy(dtype='float64')
+    previsoes, desvios = _suavizacao_exponencial(valores, float(PARAMETROS_PREVISAO["ALFA_SUAVIZACAO"]), meses_a_prever)
+    metodos = np.full(len(matriz), 'suavizacao_exponencial', dtype=object)
+    if metodo == 'sazonal_ingenuo' and valores.shape[1] >= 12:
+        completas = ~np.isnan(valores[:, -12:]).any(axis=1)
+        previsoes_sazonais, desvios_sazonais = _sazonal_ingenuo(valores, meses_a_prever)
+        desvios_sazonais = np.where(np.isnan(desvios_sazonais), desvios, desvios_sazonais)
+        previsoes = np.where(completas[:, None], previsoes_sazonais, previsoes)
+        desvios = np.where(completas[:, None], desvios_sazonais, desvios)
+        metodos[completas] = 'sazonal_ingenuo'
+    datas = pd.date_range(matriz.columns[-1], periods=meses_a_prever + 1, freq='MS')[1:]
+    resultado = {}
+    for i, chave in enumerate(matriz.index):
+        resultado[chave if isinstance(chave, tuple) else (chave,)] = pd.DataFrame({
+            'Mês Previsto': datas, 'Previsão': previsoes[i], 'Mínimo Esperado': previsoes[i] - Z_INTERVALO_90 * desvios[i],
+            'Máximo Esperado': previsoes[i] + Z_INTERVALO_90 * desvios[i], 'Método': metodos[i],
+        })
+    return resultado
+
+def _ajustar_sarimax_lote(tarefas: List[Tuple[Tuple, np.ndarray, pd.Timestamp]], meses_a_prever: int) -> List[Tuple[Tuple, Optional[pd.DataFrame], str]]:
+    """Executado em um processo do pool: ajusta um bloco de séries e devolve (chave, previsão ou None, erro)."""
+    import warnings
+    resultados = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for chave, valores, inicio in tarefas:
+            try:
+                resultados.append((chave, _ajustar_sarimax(valores, inicio, meses_a_prever), ""))
+            except Exception as e:
+                resultados.append((chave, None, str(e)))
+    return resultados
+
+def prever_series_em_lote(df_longo: pd.DataFrame, chaves: List[str], coluna_mes: str = 'MES', coluna_valor: str = 'VALOR',
+                          ano: Optional[int] = None, meses_a_prever: Optional[int] = None, max_workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Prevê os próximos meses de todas as séries do formato longo (ex.: chaves=['UNIDADE', 'PROJETO']).
+
+    Séries com pelo menos MIN_PONTOS_SARIMAX meses usam o SARIMAX(1,1,1), ajustado em paralelo em processos
+    (max_workers, padrão PARAMETROS_PREVISAO['WORKERS']) e guardado no registro de modelos pela impressão digital
+    da série. As demais, e as que falharem no SARIMAX, usam a forma fechada de METODO_SERIES_CURTAS
+    ("suavizacao" ou "sazonal_ingenuo"), calculada para todas as séries de uma vez.
+    Retorna as chaves + 'Mês Previsto', 'Previsão', 'Mínimo Esperado', 'Máximo Esperado' e 'Método'.
+    """
+    meses_a_prever = meses_a_prever or int(PARAMETROS_PREVISAO["MESES_A_PREVER"])
+    max_workers = max_workers or int(PARAMETROS_PREVISAO["WORKERS"])
+    if df_longo.empty:
+        return pd.DataFrame(columns=chaves + COLUNAS_PREVISAO + ['Método'])
+    inicio_execucao = time.perf_counter()
+    matriz = montar_matriz_de_series(df_longo, chaves, coluna_mes, coluna_valor, ano)
+    n_pontos = matriz.notna().sum(axis=1).to_numpy()
+    longas = n_pontos >= int(PARAMETROS_PREVISAO["MIN_PONTOS_SARIMAX"])
+
+    # --- Formas fechadas para todas as séries (servem também de contingência do SARIMAX) ---
+    previsoes = _previsoes_em_forma_fechada(matriz, meses_a_prever, str(PARAMETROS_PREVISAO["METODO_SERIES_CURTAS"]))
+
+    # --- SARIMAX: reaproveita o registro e ajusta só as séries novas ou alteradas ---
+    pendentes, impressoes, reaproveitadas = [], {}, 0
+    for chave, valores in zip(matriz.index[longas], matriz.to_numpy(dtype='float64')[longas]):
+        chave = chave if isinstance(chave, tuple) else (chave,)
+        inicio = matriz.columns[int(np.argmax(~np.isnan(valores)))]
+        valores = valores[~np.isnan(valores)]
+        impressao = registro_modelos.calcular_impressao_digital(valores, inicio=str(inicio), meses=meses_a_prever, modelo='sarimax_111')
+        salvo = registro_modelos.ler_modelo("|".join(map(str, chave)), 'previsao_sarimax', impressao)
+        if salvo is not None:
+            previsoes[chave] = salvo
+            reaproveitadas += 1
+        else:
+            impressoes[chave] = impressao
+            pendentes.append((chave, valores, inicio))
+
+    if pendentes:
+        blocos = [pendentes[i::max_workers] for i in range(max_workers)]
+        if max_workers <= 1:
+            resultados = _ajustar_sarimax_lote(pendentes, meses_a_prever)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                resultados = [item for bloco in executor.map(_ajustar_sarimax_lote, blocos, [meses_a_prever] * len(blocos)) for item in bloco]
+        for chave, previsao_sarimax, erro in resultados:
+            if previsao_sarimax is None:
+                logger.warning(f"⚠️  SARIMAX falhou para a série {chave}; usando a forma fechada. Erro: {erro}")
+                continue
+            previsao_sarimax['Método'] = 'sarimax'
+            previsoes[chave] = previsao_sarimax
+            registro_modelos.gravar_modelo("|".join(map(str, chave)), 'previsao_sarimax', impressoes[chave], previsao_sarimax)
+
+    partes = []
+    for chave, previsao in previsoes.items():
+        partes.append(previsao.assign(**dict(zip(chaves, chave))))
+    df_previsao = pd.concat(partes, ignore_index=True)[chaves + COLUNAS_PREVISAO + ['Método']]
+    logger.info(f"Previsão em lote concluída em {time.perf_counter() - inicio_execucao:.2f}s: {len(matriz)} séries "
+                f"({int(longas.sum())} com SARIMAX, {reaproveitadas} reaproveitadas do registro, {len(pendentes)} ajustadas).")
+    return df_previsao
@@ -0,0 +1,124 @@
+# analise_despesa/analise/registro_modelos.py
+"""
+Registro em disco (joblib) dos modelos ajustados pelos módulos de IA.
+
+Cada entrada é identificada pelo escopo (normalmente a unidade), pelo nome do modelo e pela impressão
+digital dos dados de treino e dos hiperparâmetros. Com a mesma impressão digital, o modelo salvo é
+reutilizado sem novo treino; quando ela muda, o último modelo do mesmo escopo e nome fica disponível
+para warm start. A data de modificação marca a gravação (idade máxima) e a de acesso o último uso (LRU).
+Estados de processamento incremental (ler_estado/gravar_estado) ficam no subdiretório SUBDIRETORIO_ESTADOS,
+fora da retenção: descartá-los forçaria um reajuste completo silencioso.
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+import unicodedata
+from pathlib import Path
+from typing import Any, Optional
+
+import joblib
+import numpy as np
+
+from ..config import PARAMETROS_MODELOS
+
+logger = logging.getLogger(__name__)
+
+SUBDIRETORIO_ESTADOS = "estados"
+
+def calcular_impressao_digital(matriz: Any, **parametros: Any) -> str:
+    """Hash SHA-256 do conteúdo da matriz de treino e dos hiperparâmetros informados."""
+    dados = np.ascontiguousarray(np.asarray(matriz, dtype='float64'))
+    conteudo = repr(dados.shape).encode("utf-8") + dados.tobytes() + repr(sorted(parametros.items())).encode("utf-8")
+    return hashlib.sha256(conteudo).hexdigest()
+
+def _prefixo(escopo: str, nome_modelo: str) -> str:
+    texto = unicodedata.normalize('NFKD', str(escopo)).encode('ascii', 'ignore').decode('ascii')
+    legivel = re.sub(r'[^a-zA-Z0-9]+', '_', texto).strip('_').lower()[:40]
+    return f"{legivel}-{hashlib.sha1(str(escopo).encode('utf-8')).hexdigest()[:8]}--{nome_modelo}--"
+
+def _caminho_entrada(escopo: str, nome_modelo: str, impressao_digital: str, subdiretorio: str = "") -> Path:
+    return Path(PARAMETROS_MODELOS["DIRETORIO"]) / subdiretorio / f"{_prefixo(escopo, nome_modelo)}{impressao_digital[:24]}.joblib"
+
+def _carregar(caminho: Path) -> Optional[Any]:
+    try:
+        objeto = joblib.load(caminho)
+    except Exception as e:
+        logger.warning(f"⚠️  Modelo salvo '{caminho.name}' ilegível e será descartado. Erro: {e}")
+        caminho.unlink(missing_ok=True)
+        return None
+    # Atualiza apenas o horário de acesso (LRU), preservando o horário de gravação (idade).
+    os.utime(caminho, (time.time(), caminho.stat().st_mtime))
+    return objeto
+
+def ler_modelo(escopo: str, nome_modelo: str, impressao_digital: str, subdiretorio: str = "") -> Optional[Any]:
+    """Retorna o modelo salvo para o escopo, nome e impressão digital, ou None."""
+    if not PARAMETROS_MODELOS["ATIVO"]:
+        return None
+    caminho = _caminho_entrada(escopo, nome_modelo, impressao_digital, subdiretorio)
+    return _carregar(caminho) if caminho.exists() else None
+
+def ler_ultimo_modelo(escopo: str, nome_modelo: str) -> Optional[Any]:
+    """Retorna o modelo gravado mais recentemente para o escopo e nome (qualquer impressão digital), ou None."""
+    if not PARAMETROS_MODELOS["ATIVO"]:
+        return None
+    candidatos = list(Path(PARAMETROS_MODELOS["DIRETORIO"]).glob(f"{_prefixo(escopo, nome_modelo)}*.joblib"))
+    if not candidatos:
+        return None
+    return _carregar(max(candidatos, key=lambda caminho: caminho.stat().st_mtime))
+
+def gravar_modelo(escopo: str, nome_modelo: str, impressao_digital: str, objeto: Any, subdiretorio: str = "") -> None:
+    """Grava o modelo ajustado. Falhas não interrompem a execução."""
+    if not PARAMETROS_MODELOS["ATIVO"]:
+        return
+    caminho = _caminho_entrada(escopo, nome_modelo, impressao_digital, subdiretorio)
+    caminho_temporario = caminho.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(objeto, caminho_temporario)
+        os.replace(caminho_temporario, caminho)
+    except Exception as e:
+        logger.warning(f"⚠️  Não foi possível gravar o modelo '{caminho.name}'. Erro: {e}")
+        caminho_temporario.unlink(missing_ok=True)
+
+def ler_estado(escopo: str, nome_estado: str, chave: str) -> Optional[Any]:
+    """Retorna o estado incremental salvo (subdiretório de estados, não sujeito à retenção), ou None."""
+    return ler_modelo(escopo, nome_estado, chave, SUBDIRETORIO_ESTADOS)
+
+def gravar_estado(escopo: str, nome_estado: str, chave: str, objeto: Any) -> None:
+    """Grava o estado incremental no subdiretório de estados. Falhas não interrompem a execução."""
+    gravar_modelo(escopo, nome_estado, chave, objeto, SUBDIRETORIO_ESTADOS)
+
+def aplicar_retencao(diretorio: Optional[Path] = None, idade_maxima_dias: Optional[float] = None,
+                     tamanho_maximo_mb: Optional[float] = None, padrao: str = "*.joblib") -> None:
+    """
+    Remove os arquivos do padrão mais antigos que IDADE_MAXIMA_DIAS e, depois, os menos usados até caber em TAMANHO_MAXIMO_MB.
+    Apenas a raiz do diretório é considerada: os estados incrementais (SUBDIRETORIO_ESTADOS) são preservados.
+    Sem argumentos, aplica-se ao registro de modelos (PARAMETROS_MODELOS); outros diretórios
+    (ex.: features, histórico de execuções) informam o seu diretório, limites e padrão.
+    """
+    diretorio = Path(diretorio if diretorio is not None else PARAMETROS_MODELOS["DIRETORIO"])
+    idade_maxima_dias = idade_maxima_dias if idade_maxima_dias is not None else PARAMETROS_MODELOS["IDADE_MAXIMA_DIAS"]
+    tamanho_maximo_mb = tamanho_maximo_mb if tamanho_maximo_mb is not None else PARAMETROS_MODELOS["TAMANHO_MAXIMO_MB"]
+    if not diretorio.exists():
+        return
+    agora = time.time()
+    idade_maxima_s = idade_maxima_dias * 86400
+    entradas = []
+    for caminho in diretorio.glob(padrao):
+        info = caminho.stat()
+        if agora - info.st_mtime > idade_maxima_s:
+            caminho.unlink(missing_ok=True)
+            logger.info(f"Arquivo '{caminho.name}' removido por idade.")
+        else:
+            entradas.append((caminho, info))
+
+    limite_bytes = tamanho_maximo_mb * 1024 ** 2
+    tamanho_total = sum(info.st_size for _, info in entradas)
+    for caminho, info in sorted(entradas, key=lambda entrada: entrada[1].st_atime):
+        if tamanho_total <= limite_bytes:
+            break
+        caminho.unlink(missing_ok=True)
+        tamanho_total -= info.st_size
+        logger.info(f"Arquivo '{caminho.name}' removido (LRU) para respeitar o limite de {tamanho_maximo_mb} MB.")
@@ -0,0 +1,107 @@
+# analise_despesa/cache.py
+"""
+Cache em disco para resultados de consultas SQL.
+
+Cada entrada é um arquivo Parquet identificado pelo hash do texto SQL, dos parâmetros
+e do nome da conexão. A data de modificação do arquivo marca a gravação (usada no TTL)
+e a data de acesso marca o último uso (usada na remoção LRU quando o limite de tamanho é atingido).
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import pandas as pd
+
+from .config import PARAMETROS_CACHE
+
+logger = logging.getLogger(__name__)
+
+def gerar_chave_cache(consulta_sql: str, params: Any, nome_conexao: str) -> str:
+    """Gera a chave (hash SHA-256) de uma consulta a partir do SQL, parâmetros e conexão."""
+    conteudo = json.dumps(
+        {"sql": consulta_sql, "params": params, "conexao": nome_conexao},
+        sort_keys=True, default=str, ensure_ascii=False
+    )
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+def _caminho_entrada(chave: str) -> Path:
+    return Path(PARAMETROS_CACHE["DIRETORIO"]) / f"{chave}.parquet"
+
+def ler_cache(chave: str) -> Optional[pd.DataFrame]:
+    """Retorna o DataFrame em cache, ou None se a entrada não existir ou estiver expirada."""
+    caminho = _caminho_entrada(chave)
+    if not caminho.exists():
+        return None
+
+    idade_horas = (time.time() - caminho.stat().st_mtime) / 3600
+    if idade_horas > PARAMETROS_CACHE["TTL_HORAS"]:
+        logger.info(f"Entrada de cache '{chave[:12]}' expirada ({idade_horas:.1f}h). Removendo.")
+        caminho.unlink(missing_ok=True)
+        return None
+
+    try:
+        df = pd.read_parquet(caminho)
+    except Exception as e:
+        logger.warning(f"⚠️  Entrada de cache '{chave[:12]}' ilegível e será descartada. Erro: {e}")
+        caminho.unlink(missing_ok=True)
+        return None
+
+    # Atualiza apenas o horário de acesso (LRU), preservando o horário de gravação (TTL).
+    os.utime(caminho, (time.time(), caminho.stat().st_mtime))
+    return df
+
+def gravar_cache(chave: str, df: pd.DataFrame) -> None:
+    """Grava o DataFrame no cache e aplica o limite de tamanho. Falhas não interrompem a execução."""
+    caminho = _caminho_entrada(chave)
+    caminho_temporario = caminho.with_suffix(".tmp")
+    try:
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(caminho_temporario, index=False)
+        os.replace(caminho_temporario, caminho)
+    except Exception as e:
+        logger.warning(f"⚠️  Não foi possível gravar a entrada de cache '{chave[:12]}'. Erro: {e}")
+        caminho_temporario.unlink(missing_ok=True)
+        return
+    _aplicar_limite_tamanho()
+
+def _aplicar_limite_tamanho() -> None:
+    """Remove as entradas menos usadas recentemente até o cache caber no tamanho máximo."""
+    diretorio = Path(PARAMETROS_CACHE["DIRETORIO"])
+    limite_bytes = PARAMETROS_CACHE["TAMANHO_MAXIMO_MB"] * 1024 ** 2
+    entradas = [(caminho, caminho.stat()) for caminho in diretorio.glob("*.parquet")]
+    tamanho_total = sum(info.st_size for _, info in entradas)
+    if tamanho_total <= limite_bytes:
+        return
+
+    for caminho, info in sorted(entradas, key=lambda entrada: entrada[1].st_atime):
+        if tamanho_total <= limite_bytes:
+            break
+        caminho.unlink(missing_ok=True)
+        tamanho_total -= info.st_size
+        logger.info(f"Entrada de cache '{caminho.stem[:12]}' removida (LRU) para respeitar o limite de {PARAMETROS_CACHE['TAMANHO_MAXIMO_MB']} MB.")
+
+def obter_ou_executar(consulta_sql: str, params: Any, nome_conexao: str,
+                      funcao_carga: Callable[[], pd.DataFrame], atualizar: bool = False) -> pd.DataFrame:
+    """
+    Retorna o resultado da consulta a partir do cache, ou executa 'funcao_carga' e grava o resultado.
+    Com 'atualizar', ignora a entrada existente e força uma nova leitura do banco.
+    """
+    if not PARAMETROS_CACHE["ATIVO"]:
+        return funcao_carga()
+
+    chave = gerar_chave_cache(consulta_sql, params, nome_conexao)
+    if not atualizar:
+        df = ler_cache(chave)
+        if df is not None:
+            logger.info(f"⚡ Resultado obtido do cache local ('{chave[:12]}', {len(df)} linhas).")
+            return df
+    else:
+        logger.info(f"Atualização forçada do cache para a consulta '{chave[:12]}'.")
+
+    df = funcao_carga()
+    gravar_cache(chave, df)
+    return df
@@ -1,17 +1,25 @@
 # analise_despesa/comunicacao/email.py (VERSÃO FINAL COM CORREÇÃO DO ANEXO)
 
 import pandas as pd
-import logging, os, smtplib
+import logging, mimetypes, os, smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
-from jinja2 import Environment, FileSystemLoader
-from typing import Dict, Any
+from functools import lru_cache
+from jinja2 import Environment, FileSystemLoader, Template
+from typing import Dict, Any, Optional
+from ..config import PARAMETROS_ENTREGA
+from . import tabelas
 
 logger = logging.getLogger(__name__)
 template_dir = os.path.join(os.path.dirname(__file__), '..', 'templates')
-env = Environment(loader=FileSystemLoader(template_dir))
+# O template é compilado uma vez por processo; sem auto_reload, o Jinja não consulta o arquivo a cada relatório.
+env = Environment(loader=FileSystemLoader(template_dir), auto_reload=False)
+
+@lru_cache(maxsize=None)
+def obter_template(nome: str = 'relatorio_analise.html') -> Template:
+    return env.get_template(nome)
 
 def gerar_corpo_email_analise(unidade_gestora: str, data_relatorio: str, resumo: dict,
                               df_orcamento_exclusivo: pd.DataFrame, df_orcamento_compartilhado: pd.DataFrame,
@@ -22,62 +30,83 @@ def gerar_corpo_email_analise(unidade_gestora: str, data_relatorio: str, resumo:
                               resumo_clusters_folha: Dict[str, Dict[str, Any]]) -> str:
     # (O código desta função permanece inalterado)
     logger.info("Gerando corpo de e-mail com todas as análises...")
-    template = env.get_template('relatorio_analise.html')
-    def robust_currency_formatter(value):
-        if pd.isna(value) or (isinstance(value, (int, float)) and value == 0): return "-"
-        if isinstance(value, str): return value
-        return f"R$ {value:,.0f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    def robust_int_formatter(value):
-        if pd.isna(value): return "-"
-        return f"{int(value):,}".replace(",", ".")
-    def robust_percent_formatter(value):
-        if pd.isna(value): return "N/A"
-        return f"{value:.0%}"
+    template = obter_template()
+    robust_currency_formatter, robust_int_formatter, robust_percent_formatter = tabelas.formatar_moeda, tabelas.formatar_inteiro, tabelas.formatar_percentual
     itens_resumo = [{"indicador": "Total Gasto (Realizado)", "mes": robust_currency_formatter(resumo.get("valor_total_mes")), "ano": robust_currency_formatter(resumo.get("valor_total_ano")), "is_total": True}, {"indicador": "&nbsp;&nbsp;↳ Gastos - Iniciativas exclusivas", "mes": robust_currency_formatter(resumo.get("gastos_mes_exclusivo")), "ano": robust_currency_formatter(resumo.get("gastos_ano_exclusivo")), "is_total": False}, {"indicador": "&nbsp;&nbsp;↳ Gastos - Iniciativas compartilhadas", "mes": robust_currency_formatter(resumo.get("gastos_mes_compartilhado")), "ano": robust_currency_formatter(resumo.get("gastos_ano_compartilhado")), "is_total": False}, {"indicador": "Orçamento Planejado (a+b)", "mes": robust_currency_formatter(resumo.get("orcamento_mes_referencia")), "ano": robust_currency_formatter(resumo.get("orcamento_planejado_ano")), "is_total": True}, {"indicador": "&nbsp;&nbsp;↳ Orçamento - Iniciativas exclusivas (a)", "mes": robust_currency_formatter(resumo.get("orcamento_mes_exclusivo")), "ano": robust_currency_formatter(resumo.get("orcamento_total_exclusivo")), "is_total": False}, {"indicador": "&nbsp;&nbsp;↳ Orçamento - Iniciativas compartilhadas (b)", "mes": robust_currency_formatter(resumo.get("orcamento_mes_compartilhado")), "ano": robust_currency_formatter(resumo.get("orcamento_total_compartilhado")), "is_total": False}, {"indicador": "Total de Lançamentos", "mes": resumo.get("qtd_lancamentos_mes"), "ano": resumo.get("qtd_lancamentos_ano"), "is_total": True}]
     resumo_formatado = {"numero_unidade": resumo.get("numero_unidade"), "mes_referencia": resumo.get("mes_referencia"), "valor_mediano_mes_exclusivo": robust_currency_formatter(resumo.get("valor_mediano_mes_exclusivo")), "min_normal_mes_exclusivo": robust_currency_formatter(resumo.get("min_normal_mes_exclusivo")), "max_normal_mes_exclusivo": robust_currency_formatter(resumo.get("max_normal_mes_exclusivo")), "media_ano_exclusivo": robust_currency_formatter(resumo.get("media_ano_exclusivo")), "mediana_ano_exclusivo": robust_currency_formatter(resumo.get("mediana_ano_exclusivo")), "maior_ano_exclusivo": robust_currency_formatter(resumo.get("maior_ano_exclusivo")), "menor_ano_exclusivo": robust_currency_formatter(resumo.get("menor_ano_exclusivo")), "valor_mediano_mes_compartilhado": robust_currency_formatter(resumo.get("valor_mediano_mes_compartilhado")), "min_normal_mes_compartilhado": robust_currency_formatter(resumo.get("min_normal_mes_compartilhado")), "max_normal_mes_compartilhado": robust_currency_formatter(resumo.get("max_normal_mes_compartilhado")), "media_ano_compartilhado": robust_currency_formatter(resumo.get("media_ano_compartilhado")), "mediana_ano_compartilhado": robust_currency_formatter(resumo.get("mediana_ano_compartilhado")), "maior_ano_compartilhado": robust_currency_formatter(resumo.get("maior_ano_compartilhado")), "menor_ano_compartilhado": robust_currency_formatter(resumo.get("menor_ano_compartilhado"))}
     resumo_clusters_formatado = {name: {'valor_total': robust_currency_formatter(data.get('valor_total')), 'frequencia': robust_int_formatter(data.get('frequencia')), 'coef_variacao': robust_percent_formatter(data.get('coef_variacao')), 'description': data.get('description', 'Descrição não disponível.')} for name, data in resumo_clusters_folha.items()}
-    formatters = {'projeto': {'Criticidade': lambda x: x, 'Orçado': robust_currency_formatter, 'Realizado': robust_currency_formatter, '% Execução': robust_percent_formatter}, 'fornecedor': {'Realizado (Ano)': robust_currency_formatter}, 'ocorrencia': {'Realizado': robust_currency_formatter, 'Justificativa IA': lambda x: x}, 'mes': {'Mês': lambda x: x, 'Realizado (Exclusivo)': robust_currency_formatter, 'Realizado (Compartilhado)': robust_currency_formatter, 'Sinalização da IA': lambda x: x}, 'folha_cluster': {'Agrupamento Contábil (Nível 4)': lambda x: x, 'Valor Total (Ano)': robust_currency_formatter, 'Qtd. Lançamentos (Ano)': robust_int_formatter, 'Coeficiente de Variação (CV)': robust_percent_formatter}}
-    tabelas_html = {'tabela_orc_exclusivo': df_orcamento_exclusivo.to_html(index=False, na_rep='N/A', classes='table', formatters=formatters['projeto']), 'tabela_orc_compartilhado': df_orcamento_compartilhado.to_html(index=False, na_rep='N/A', classes='table', formatters=formatters['projeto']), 'tabela_forn_exclusivo': df_fornecedores_exclusivo.to_html(index=False, na_rep='N/A', classes='table', formatters=formatters['fornecedor']), 'tabela_forn_compartilhado': df_fornecedores_compartilhado.to_html(index=False, na_rep='N/A', classes='table', formatters=formatters['fornecedor']), 'tabela_mes_agregado': df_mes_agregado.to_html(index=False, na_rep='N/A', classes='table', formatters=formatters['mes']), 'tabela_ocorrencias_atipicas': df_ocorrencias_atipicas.to_html(index=False, na_rep='N/A', classes='table', formatters=formatters['ocorrencia'])}
-    clusters_folha_html = {name: df.to_html(index=False, na_rep='-', classes='table', formatters=formatters['folha_cluster']) for name, df in df_clusters_folha.items()}
+    formatos = {'projeto': {'Criticidade': 'texto', 'Orçado': 'moeda', 'Realizado': 'moeda', '% Execução': 'percentual'}, 'fornecedor': {'Realizado (Ano)': 'moeda'}, 'ocorrencia': {'Realizado': 'moeda', 'Justificativa IA': 'texto'}, 'mes': {'Mês': 'texto', 'Realizado (Exclusivo)': 'moeda', 'Realizado (Compartilhado)': 'moeda', 'Sinalização da IA': 'texto'}, 'folha_cluster': {'Agrupamento Contábil (Nível 4)': 'texto', 'Valor Total (Ano)': 'moeda', 'Qtd. Lançamentos (Ano)': 'inteiro', 'Coeficiente de Variação (CV)': 'percentual'}}
+    tabelas_html = {'tabela_orc_exclusivo': tabelas.renderizar_tabela(df_orcamento_exclusivo, formatos['projeto']), 'tabela_orc_compartilhado': tabelas.renderizar_tabela(df_orcamento_compartilhado, formatos['projeto']), 'tabela_forn_exclusivo': tabelas.renderizar_tabela(df_fornecedores_exclusivo, formatos['fornecedor']), 'tabela_forn_compartilhado': tabelas.renderizar_tabela(df_fornecedores_compartilhado, formatos['fornecedor']), 'tabela_mes_agregado': tabelas.renderizar_tabela(df_mes_agregado, formatos['mes']), 'tabela_ocorrencias_atipicas': tabelas.renderizar_tabela(df_ocorrencias_atipicas, formatos['ocorrencia'])}
+    clusters_folha_html = {name: tabelas.renderizar_tabela(df, formatos['folha_cluster'], na_rep='-') for name, df in df_clusters_folha.items()}
     return template.render(unidade_gestora=unidade_gestora, data_relatorio=data_relatorio, resumo=resumo_formatado, itens_resumo=itens_resumo, tem_exclusivos=not df_orcamento_exclusivo.empty, tem_compartilhados=not df_orcamento_compartilhado.empty, tem_fornecedores_exclusivos=not df_fornecedores_exclusivo.empty, tem_fornecedores_compartilhados=not df_fornecedores_compartilhado.empty, tem_ocorrencias_atipicas=not df_ocorrencias_atipicas.empty, tem_contexto_exclusivo=resumo.get("valor_mediano_mes_exclusivo") is not None, tem_contexto_compartilhado=resumo.get("valor_mediano_mes_compartilhado") is not None, tem_clusters_folha=bool(df_clusters_folha), clusters_folha=clusters_folha_html, resumo_clusters_folha=resumo_clusters_formatado, **tabelas_html)
 
-def enviar_email_via_smtp(assunto: str, corpo_html: str, destinatario: str, caminho_anexo: str = None):
-    logger.info(f"Iniciando envio de e-mail para {destinatario} via SMTP...")
+def obter_configuracao_smtp() -> Optional[Dict[str, Any]]:
+    """Lê o servidor e as credenciais SMTP do ambiente (.env). Retorna None se estiverem incompletos."""
     smtp_host = os.getenv("SMTP_HOST")
     smtp_port = int(os.getenv("SMTP_PORT", 587))
     smtp_user = os.getenv("SMTP_USER")
     smtp_pass = os.getenv("SMTP_PASSWORD")
     if not all([smtp_host, smtp_port, smtp_user, smtp_pass]):
-        logger.error("Credenciais SMTP não configuradas. O e-mail não pode ser enviado.")
-        return
+        return None
+    return {"host": smtp_host, "porta": smtp_port, "usuario": smtp_user, "senha": smtp_pass,
+            "usar_starttls": PARAMETROS_ENTREGA["USAR_STARTTLS"], "timeout": PARAMETROS_ENTREGA["TIMEOUT_S"]}
+
+def conectar_smtp(configuracao: Dict[str, Any]) -> smtplib.SMTP:
+    """Abre uma sessão SMTP autenticada (STARTTLS opcional), pronta para enviar várias mensagens."""
+    server = smtplib.SMTP(configuracao["host"], configuracao["porta"], timeout=configuracao.get("timeout"))
     try:
-        msg = MIMEMultipart()
-        msg['Subject'] = assunto
-        msg['From'] = smtp_user
-        msg['To'] = destinatario
+        if configuracao.get("usar_starttls", True):
+            server.starttls()
+        if configuracao.get("usuario"):
+            server.login(configuracao["usuario"], configuracao["senha"])
+    except Exception:
+        server.close()
+        raise
+    return server
 
-        msg.attach(MIMEText(corpo_html, 'html'))
+def _tipo_mime(caminho: str) -> str:
+    tipo, compactacao = mimetypes.guess_type(caminho)
+    if compactacao == "gzip":
+        return "application/gzip"
+    return tipo or "application/octet-stream"
+
+def montar_mensagem(assunto: str, corpo_html: str, destinatario: str, remetente: str, caminho_anexo: str = None) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg['Subject'] = assunto
+    msg['From'] = remetente
+    msg['To'] = destinatario
+
+    msg.attach(MIMEText(corpo_html, 'html'))
+    
+    # --- LÓGICA PARA ANEXAR O ARQUIVO ---
+    if caminho_anexo:
+        logger.info(f"Anexando arquivo: {caminho_anexo}")
         
-        # --- LÓGICA PARA ANEXAR O ARQUIVO ---
-        if caminho_anexo:
-            logger.info(f"Anexando arquivo: {caminho_anexo}")
-            
-            # --- CORREÇÃO AQUI ---
-            # Abrimos o arquivo em modo texto e usamos MIMEText com o subtipo 'csv'
-            with open(caminho_anexo, "r", encoding="utf-8-sig") as attachment:
-                part = MIMEText(attachment.read(), "csv", "utf-8")
+        # O arquivo (em geral já compactado) segue como parte binária, sem decodificar o conteúdo para texto.
+        part = MIMEBase(*_tipo_mime(caminho_anexo).split("/"))
+        with open(caminho_anexo, "rb") as attachment:
+            part.set_payload(attachment.read())
+        tamanho_arquivo = len(part.get_payload())
+        encoders.encode_base64(part)
 
-            # Adicionamos o cabeçalho para garantir que ele seja tratado como um anexo para download
-            part.add_header(
-                "Content-Disposition",
-                f"attachment; filename={os.path.basename(caminho_anexo)}",
-            )
-            msg.attach(part)
-            logger.info("Arquivo anexado com sucesso.")
+        # Adicionamos o cabeçalho para garantir que ele seja tratado como um anexo para download
+        part.add_header(
+            "Content-Disposition",
+            f"attachment; filename={os.path.basename(caminho_anexo)}",
+        )
+        msg.attach(part)
+        logger.info(f"Arquivo anexado com sucesso ({tamanho_arquivo / 1024:.1f} KB; {len(part.get_payload()) / 1024:.1f} KB enviados em base64).")
+    return msg
 
-        with smtplib.SMTP(smtp_host, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_user, smtp_pass)
+def enviar_email_via_smtp(assunto: str, corpo_html: str, destinatario: str, caminho_anexo: str = None):
+    logger.info(f"Iniciando envio de e-mail para {destinatario} via SMTP...")
+    configuracao = obter_configuracao_smtp()
+    if configuracao is None:
+        logger.error("Credenciais SMTP não configuradas. O e-mail não pode ser enviado.")
+        return
+    try:
+        msg = montar_mensagem(assunto, corpo_html, destinatario, configuracao["usuario"], caminho_anexo)
+        with conectar_smtp(configuracao) as server:
             server.send_message(msg)
         logger.info(f"✅ E-mail para '{destinatario}' enviado com sucesso!")
     except Exception as e:
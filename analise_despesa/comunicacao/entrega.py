@@ -0,0 +1,149 @@
+# analise_despesa/comunicacao/entrega.py
+"""
+Fila de entrega dos relatórios por e-mail em segundo plano.
+
+Cada thread de envio mantém sua própria sessão SMTP autenticada (smtplib não é thread-safe) e a reaproveita
+entre mensagens, reconectando quando o servidor encerra a sessão. Falhas temporárias são repetidas com
+espera exponencial; recusas definitivas do servidor (códigos 5xx) não são repetidas.
+"""
+import logging
+import queue
+import smtplib
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from ..config import PARAMETROS_ENTREGA
+from . import email
+
+logger = logging.getLogger(__name__)
+
+_FIM = object()
+
+def _erro_definitivo(erro: Exception) -> bool:
+    """Recusas 5xx (destinatário inválido, autenticação negada...) não se resolvem com nova tentativa."""
+    if isinstance(erro, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(erro, smtplib.SMTPResponseException) and erro.smtp_code >= 500
+
+def _encerrar_sessao(sessao: Any) -> None:
+    try:
+        sessao.quit()
+    except Exception:
+        try:
+            sessao.close()
+        except Exception:
+            pass
+
+class FilaDeEntrega:
+    """
+    Envia e-mails a partir de uma fila limitada, com até 'workers' sessões SMTP simultâneas.
+    'fabrica_conexao' devolve uma sessão pronta para send_message (padrão: email.conectar_smtp com a
+    configuração do .env). Uso: 'with FilaDeEntrega() as fila: fila.enviar(...)'; a saída do bloco aguarda a fila esvaziar.
+    """
+    def __init__(self, configuracao: Optional[Dict[str, Any]] = None, fabrica_conexao: Optional[Callable[[], Any]] = None,
+                 workers: Optional[int] = None, tentativas: Optional[int] = None, espera_inicial_s: Optional[float] = None):
+        self.configuracao = configuracao if configuracao is not None else email.obter_configuracao_smtp()
+        if fabrica_conexao is None and self.configuracao is not None:
+            fabrica_conexao = lambda: email.conectar_smtp(self.configuracao)
+        self.fabrica_conexao = fabrica_conexao
+        self.workers = max(1, int(workers if workers is not None else PARAMETROS_ENTREGA["WORKERS"]))
+        self.tentativas = max(1, int(tentativas if tentativas is not None else PARAMETROS_ENTREGA["TENTATIVAS"]))
+        self.espera_inicial_s = float(espera_inicial_s if espera_inicial_s is not None else PARAMETROS_ENTREGA["ESPERA_INICIAL_S"])
+        self.remetente = (self.configuracao or {}).get("usuario", "")
+        self.resultados: List[Dict[str, Any]] = []
+        self._fila: "queue.Queue" = queue.Queue(maxsize=int(PARAMETROS_ENTREGA["TAMANHO_FILA"]))
+        self._trava = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def iniciar(self) -> "FilaDeEntrega":
+        if self.fabrica_conexao is None:
+            logger.error("Credenciais SMTP não configuradas. Os e-mails da fila não serão enviados.")
+            return self
+        self._threads = [threading.Thread(target=self._trabalhar, name=f"entrega-smtp-{i + 1}", daemon=True) for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"📨 Fila de entrega de e-mails iniciada com {self.workers} sessões SMTP.")
+        return self
+
+    def enviar(self, assunto: str, corpo_html: str, destinatario: str, caminho_anexo: str = None, identificador: str = None) -> None:
+        """Enfileira um e-mail. Bloqueia apenas se a fila estiver cheia."""
+        item = {"assunto": assunto, "corpo_html": corpo_html, "destinatario": destinatario, "caminho_anexo": caminho_anexo,
+                "identificador": identificador or destinatario, "enfileirado_em": time.perf_counter()}
+        if not self._threads:
+            self._registrar(item, "falha", 0, "Credenciais SMTP não configuradas.")
+            return
+        self._fila.put(item)
+
+    def encerrar(self) -> List[Dict[str, Any]]:
+        """Aguarda o envio de tudo o que foi enfileirado, fecha as sessões e devolve o status de cada mensagem."""
+        for _ in self._threads:
+            self._fila.put(_FIM)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        enviados = sum(resultado["status"] == "enviado" for resultado in self.resultados)
+        if self.resultados:
+            logger.info(f"📨 Fila de entrega concluída: {enviados} de {len(self.resultados)} e-mails enviados.")
+        return self.resultados
+
+    def __enter__(self) -> "FilaDeEntrega":
+        return self.iniciar()
+
+    def __exit__(self, *exc) -> None:
+        self.encerrar()
+
+    def _registrar(self, item: Dict[str, Any], status: str, tentativas: int, erro: str = "") -> None:
+        with self._trava:
+            self.resultados.append({"identificador": item["identificador"], "destinatario": item["destinatario"], "assunto": item["assunto"],
+                                    "status": status, "tentativas": tentativas, "espera_s": time.perf_counter() - item["enfileirado_em"], "erro": erro})
+
+    def _trabalhar(self) -> None:
+        sessao, mensagens_na_sessao = None, 0
+        while True:
+            item = self._fila.get()
+            if item is _FIM:
+                break
+            if sessao is not None and mensagens_na_sessao >= PARAMETROS_ENTREGA["MENSAGENS_POR_SESSAO"]:
+                _encerrar_sessao(sessao)
+                sessao, mensagens_na_sessao = None, 0
+            sessao, mensagens_na_sessao = self._entregar(item, sessao, mensagens_na_sessao)
+        if sessao is not None:
+            _encerrar_sessao(sessao)
+
+    def _entregar(self, item: Dict[str, Any], sessao: Any, mensagens_na_sessao: int):
+        """Envia uma mensagem reaproveitando a sessão da thread. Devolve a sessão (ou None) e o contador atualizado."""
+        try:
+            mensagem = email.montar_mensagem(item["assunto"], item["corpo_html"], item["destinatario"], self.remetente, item["caminho_anexo"])
+        except Exception as e:
+            logger.error(f"❌ Não foi possível montar o e-mail para '{item['destinatario']}'. Erro: {e}", exc_info=True)
+            self._registrar(item, "falha", 0, str(e))
+            return sessao, mensagens_na_sessao
+
+        tentativa = 0
+        while True:
+            reaproveitada = sessao is not None
+            try:
+                if sessao is None:
+                    sessao, mensagens_na_sessao = self.fabrica_conexao(), 0
+                sessao.send_message(mensagem)
+                mensagens_na_sessao += 1
+                self._registrar(item, "enviado", tentativa + 1)
+                logger.info(f"✅ E-mail para '{item['destinatario']}' enviado com sucesso!")
+                return sessao, mensagens_na_sessao
+            except Exception as e:
+                if sessao is not None:
+                    _encerrar_sessao(sessao)
+                    sessao = None
+                # Sessão ociosa derrubada pelo servidor: reconecta na hora, sem consumir tentativa.
+                if reaproveitada and isinstance(e, (smtplib.SMTPServerDisconnected, ConnectionError)):
+                    logger.info(f"Sessão SMTP encerrada pelo servidor. Reconectando para enviar a '{item['destinatario']}'.")
+                    continue
+                tentativa += 1
+                if _erro_definitivo(e) or tentativa >= self.tentativas:
+                    logger.error(f"❌ Falha ao enviar e-mail para '{item['destinatario']}' após {tentativa} tentativa(s). Erro: {e}")
+                    self._registrar(item, "falha", tentativa, str(e))
+                    return None, 0
+                espera = self.espera_inicial_s * PARAMETROS_ENTREGA["FATOR_BACKOFF"] ** (tentativa - 1)
+                logger.warning(f"⚠️  Falha temporária ao enviar e-mail para '{item['destinatario']}' (tentativa {tentativa}). Nova tentativa em {espera:.1f}s. Erro: {e}")
+                time.sleep(espera)
@@ -0,0 +1,160 @@
+# analise_despesa/comunicacao/tabelas.py
+"""
+Renderização das tabelas HTML dos relatórios.
+
+Os valores de cada coluna são formatados de uma vez (moeda, inteiro, percentual) com operações do NumPy e o
+HTML é montado diretamente, com a mesma marcação de DataFrame.to_html(index=False, classes='table').
+Colunas de tipos não cobertos aqui fazem a tabela inteira cair no DataFrame.to_html com os formatadores escalares.
+"""
+import html
+import logging
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Maior magnitude formatada em lote: abaixo dela o arredondamento cabe em int64 sem perda.
+_LIMITE_LOTE = 1e15
+
+def formatar_moeda(value):
+    if pd.isna(value) or (isinstance(value, (int, float)) and value == 0): return "-"
+    if isinstance(value, str): return value
+    return f"R$ {value:,.0f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def formatar_inteiro(value):
+    if pd.isna(value): return "-"
+    return f"{int(value):,}".replace(",", ".")
+
+def formatar_percentual(value):
+    if pd.isna(value): return "N/A"
+    return f"{value:.0%}"
+
+def formatar_texto(value):
+    return value
+
+FORMATADORES: Dict[str, Callable[[Any], Any]] = {
+    "moeda": formatar_moeda, "inteiro": formatar_inteiro, "percentual": formatar_percentual, "texto": formatar_texto,
+}
+
+def _agrupar_milhares(absolutos: np.ndarray) -> np.ndarray:
+    """Inteiros não negativos como texto com '.' separando os milhares (1234567 -> '1.234.567')."""
+    restante = absolutos // 1000
+    texto = np.where(restante > 0, np.char.mod('%03d', absolutos % 1000), np.char.mod('%d', absolutos % 1000))
+    while (ativos := restante > 0).any():
+        grupo = restante % 1000
+        restante = restante // 1000
+        prefixo = np.where(restante > 0, np.char.mod('%03d', grupo), np.char.mod('%d', grupo))
+        texto = np.where(ativos, np.char.add(np.char.add(prefixo, '.'), texto), texto)
+    return texto
+
+def _com_sinal(arredondados: np.ndarray, agrupar: bool) -> np.ndarray:
+    """Valores já arredondados como texto; '-0' é preservado como na formatação do Python."""
+    absolutos = np.abs(arredondados).astype(np.int64)
+    texto = _agrupar_milhares(absolutos) if agrupar else np.char.mod('%d', absolutos)
+    return np.where(np.signbit(arredondados), np.char.add('-', texto), texto)
+
+def _em_lote(valores: np.ndarray, arredondar: Callable[[np.ndarray], np.ndarray], agrupar: bool,
+             formatador: Callable[[Any], Any], prefixo: str = '', sufixo: str = '') -> np.ndarray:
+    """Aplica a versão vetorizada; valores fora da faixa segura (inf, magnitudes enormes) usam o formatador escalar."""
+    arredondados = arredondar(valores)
+    seguros = np.isfinite(arredondados) & (np.abs(arredondados) < _LIMITE_LOTE)
+    texto = np.char.add(np.char.add(prefixo, _com_sinal(np.where(seguros, arredondados, 0.0), agrupar)), sufixo).astype(object)
+    for i in np.flatnonzero(~seguros):
+        texto[i] = formatador(valores[i])
+    return texto
+
+def _formatar_coluna_em_lote(valores: np.ndarray, formato: str) -> Optional[np.ndarray]:
+    """Formata os valores (sem nulos) de uma coluna numérica. Retorna None se a combinação tipo/formato não for coberta."""
+    if formato == "moeda" and valores.dtype.kind in "if":
+        texto = _em_lote(valores.astype(np.float64), np.rint, True, formatar_moeda, prefixo='R$ ')
+        if valores.dtype == np.float64:
+            texto[valores == 0] = "-"  # Apenas float/int do Python zerados viram '-'; np.int64(0) vira 'R$ 0'.
+        return texto
+    if formato == "inteiro" and valores.dtype.kind in "if":
+        return _em_lote(valores.astype(np.float64), lambda v: np.trunc(v) + 0.0, True, formatar_inteiro)
+    if formato == "percentual" and valores.dtype == np.float64:
+        return _em_lote(valores, lambda v: np.rint(v * 100), False, formatar_percentual, sufixo='%')
+    return None
+
+def _nulo_como_texto(valor: Any, na_rep: str) -> str:
+    """Representação dos nulos no DataFrame.to_html: None e pd.NA mantêm o nome; os demais usam 'na_rep'."""
+    if valor is None:
+        return "None"
+    if valor is pd.NA:
+        return "<NA>"
+    if valor is pd.NaT:
+        return "NaT"
+    return na_rep
+
+def _formatar_coluna(serie: pd.Series, formato: Optional[str], na_rep: str) -> Optional[np.ndarray]:
+    """Textos das células de uma coluna, ou None se a coluna exigir o DataFrame.to_html."""
+    tipo = serie.dtype
+    if isinstance(tipo, pd.CategoricalDtype) or tipo == object:
+        valores = np.asarray(serie, dtype=object)
+        nulos = pd.isna(valores)
+        if formato not in (None, "texto") or not all(isinstance(valor, str) for valor in valores[~nulos]):
+            return None
+        texto = valores.copy()
+        if formato is None:
+            # Sem formatador, o pandas escapa tabulações e quebras de linha.
+            texto[~nulos] = [valor.replace("\t", "\\t").replace("\r", "\\r").replace("\n", "\\n") for valor in valores[~nulos]]
+        texto[nulos] = [_nulo_como_texto(valor, na_rep) for valor in valores[nulos]]
+        return texto
+    if tipo.kind in "iu" and formato is None:
+        return np.char.mod('%d', serie.to_numpy()).astype(object)
+    if tipo.kind == "M" and formato is None and getattr(tipo, "tz", None) is None:
+        datas = serie.to_numpy()
+        nulos = np.isnat(datas)
+        if (datas[~nulos] != datas[~nulos].astype('datetime64[D]')).any():
+            return None
+        texto = np.datetime_as_string(datas, unit='D').astype(object)
+        texto[nulos] = "NaT"
+        return texto
+    if tipo.kind in "if" and formato is not None:
+        valores = serie.to_numpy()
+        nulos = pd.isna(valores)
+        texto = np.full(len(valores), na_rep, dtype=object)
+        formatados = _formatar_coluna_em_lote(valores[~nulos], formato)
+        if formatados is None:
+            return None
+        texto[~nulos] = formatados
+        return texto
+    return None
+
+def _escapar(texto: np.ndarray) -> np.ndarray:
+    """Escapa &, < e > célula a célula (como o to_html); np.char.replace truncaria o texto à largura original do dtype."""
+    return np.array([html.escape(str(valor), quote=False).strip() for valor in texto], dtype=object)
+
+def _montar_html(df: pd.DataFrame, colunas_formatadas: list) -> str:
+    cabecalho = "".join(f"      <th>{_escapar(np.array([str(coluna)]))[0]}</th>\n" for coluna in df.columns)
+    partes = ['<table border="1" class="dataframe table">\n', '  <thead>\n', '    <tr style="text-align: right;">\n',
+              cabecalho, '    </tr>\n', '  </thead>\n', '  <tbody>\n']
+    if len(df):
+        linhas = np.full(len(df), '    <tr>\n', dtype=object)
+        for texto in colunas_formatadas:
+            linhas = linhas + ('      <td>' + _escapar(texto) + '</td>\n')
+        partes.append("".join(linhas + '    </tr>\n'))
+    partes.extend(['  </tbody>\n', '</table>'])
+    return "".join(partes)
+
+def renderizar_tabela(df: pd.DataFrame, formatos: Dict[str, str], na_rep: str = 'N/A') -> str:
+    """
+    HTML da tabela com os formatos por coluna ('moeda', 'inteiro', 'percentual' ou 'texto').
+    Produz exatamente a marcação de df.to_html(index=False, na_rep=na_rep, classes='table', formatters=...).
+    """
+    if isinstance(df.columns, pd.MultiIndex) or not all(isinstance(coluna, str) for coluna in df.columns):
+        colunas_formatadas = None
+    else:
+        colunas_formatadas = []
+        for posicao, coluna in enumerate(df.columns):
+            texto = _formatar_coluna(df.iloc[:, posicao], formatos.get(coluna), na_rep)
+            if texto is None:
+                colunas_formatadas = None
+                break
+            colunas_formatadas.append(texto)
+    if colunas_formatadas is None:
+        formatadores = {coluna: FORMATADORES[formato] for coluna, formato in formatos.items()}
+        return df.to_html(index=False, na_rep=na_rep, classes='table', formatters=formatadores)
+    return _montar_html(df, colunas_formatadas)
@@ -18,10 +18,119 @@ OUTPUT_DIR = BASE_DIR / "output"
 OUTPUT_DIR.mkdir(exist_ok=True)
 
 # --- PARÂMETROS GLOBAIS DA ANÁLISE (NÃO SÃO SEGREDOS) ---
-PARAMETROS_ANALISE: Dict[str, Union[int, str]] = {
+PARAMETROS_ANALISE: Dict[str, Union[int, str, bool]] = {
     "ANO_REFERENCIA": 2025,
     "ID_PERIODO_ORCAMENTO": "27",
-    "ARQUIVO_CSV_VERIFICACAO": str(OUTPUT_DIR / "base_completa_extraida.csv")
+    "ARQUIVO_CSV_VERIFICACAO": str(OUTPUT_DIR / "base_completa_extraida.csv"),
+    # "completo": lê o ano inteiro da view. "incremental": sincroniza a base local particionada (ver PARAMETROS_SINCRONIZACAO).
+    "MODO_EXTRACAO_REALIZADO": "completo",
+    # Extração do Realizado em lotes tipados (reduz o pico de memória em anos completos).
+    "EXTRACAO_EM_LOTES": False,
+    # Quantidade de linhas por lote na extração em modo streaming.
+    "TAMANHO_LOTE_EXTRACAO": 50000,
+    # Threads da extração paralela por intervalos mensais de DATA (1 = consulta única).
+    "WORKERS_EXTRACAO": 1,
+    # Processos para gerar os relatórios das unidades em paralelo (1 = sequencial).
+    "WORKERS_UNIDADES": 1,
+    # Threads para ajustar os modelos de anomalia de todas as unidades em lote (-1 = todos os núcleos).
+    "WORKERS_ANOMALIAS": -1,
+    # Detector das séries curtas (tendência mensal e faixa normal do mês): "modelo" (IsolationForest), "mad" ou "iqr".
+    "DETECTOR_SERIES_CURTAS": "modelo",
+    # Detecção de contexto: "completo" (reajusta o ano inteiro a cada execução) ou "incremental" (pontua só o mês novo).
+    "MODO_DETECCAO_CONTEXTO": "completo",
+    # Modo incremental: meses entre reajustes completos e deriva máxima do score médio (em desvios do score de treino).
+    "REAJUSTE_CONTEXTO_MESES": 3,
+    "LIMITE_DERIVA_CONTEXTO": 0.5
+}
+
+# --- CACHE LOCAL DE CONSULTAS (Parquet em OUTPUT_DIR/cache) ---
+# TTL_HORAS: validade de cada entrada. TAMANHO_MAXIMO_MB: acima disso, as entradas menos usadas são removidas.
+PARAMETROS_CACHE: Dict[str, Any] = {
+    "ATIVO": True,
+    "DIRETORIO": OUTPUT_DIR / "cache",
+    "TTL_HORAS": 12,
+    "TAMANHO_MAXIMO_MB": 2048
+}
+
+# --- BASE LOCAL DO REALIZADO (SINCRONIZAÇÃO INCREMENTAL) ---
+# DIAS_RETROATIVOS: janela reextraída antes da marca d'água para capturar lançamentos tardios.
+PARAMETROS_SINCRONIZACAO: Dict[str, Any] = {
+    "DIRETORIO": OUTPUT_DIR / "realizado_local",
+    "DIAS_RETROATIVOS": 45
+}
+
+# --- REPOSITÓRIO DE FEATURES DOS MODELOS DE IA (memória + joblib em OUTPUT_DIR/features) ---
+# As features são identificadas pela impressão digital da base analisada; uma base diferente gera um novo arquivo.
+# Arquivos mais antigos que IDADE_MAXIMA_DIAS e, depois, os menos usados acima de TAMANHO_MAXIMO_MB são removidos ao fim da execução.
+PARAMETROS_FEATURES: Dict[str, Any] = {
+    "CACHE_EM_DISCO": True,
+    "DIRETORIO": OUTPUT_DIR / "features",
+    "IDADE_MAXIMA_DIAS": 30,
+    "TAMANHO_MAXIMO_MB": 1024
+}
+
+# --- REGISTRO DE MODELOS AJUSTADOS (joblib em OUTPUT_DIR/modelos) ---
+# Modelos com a mesma impressão digital dos dados são reutilizados sem novo treino.
+# WARM_START_KMEANS: quando os dados mudam, o KMeans parte dos centróides do último modelo da unidade.
+PARAMETROS_MODELOS: Dict[str, Any] = {
+    "ATIVO": True,
+    "DIRETORIO": OUTPUT_DIR / "modelos",
+    "IDADE_MAXIMA_DIAS": 90,
+    "TAMANHO_MAXIMO_MB": 512,
+    "WARM_START_KMEANS": True
+}
+
+# --- HISTÓRICO DAS EXECUÇÕES (tempos por unidade e telemetria das conexões) ---
+# Cada execução acrescenta linhas ao CSV do dia em OUTPUT_DIR/execucoes (coluna EXECUCAO = início da execução).
+# Arquivos mais antigos que IDADE_MAXIMA_DIAS e, depois, os menos usados acima de TAMANHO_MAXIMO_MB são removidos.
+PARAMETROS_EXECUCOES: Dict[str, Any] = {
+    "DIRETORIO": OUTPUT_DIR / "execucoes",
+    "IDADE_MAXIMA_DIAS": 30,
+    "TAMANHO_MAXIMO_MB": 50
+}
+
+# --- PREVISÃO EM LOTE (analise/previsao.py) ---
+# Séries com MIN_PONTOS_SARIMAX meses ou mais usam SARIMAX (em WORKERS processos); as demais, a forma fechada
+# de METODO_SERIES_CURTAS: "suavizacao" (exponencial simples, ALFA_SUAVIZACAO) ou "sazonal_ingenuo" (12+ meses).
+PARAMETROS_PREVISAO: Dict[str, Any] = {
+    "MESES_A_PREVER": 3,
+    "MIN_PONTOS_SARIMAX": 8,
+    "METODO_SERIES_CURTAS": "suavizacao",
+    "ALFA_SUAVIZACAO": 0.5,
+    "WORKERS": 4
+}
+
+# --- ENTREGA DOS RELATÓRIOS POR E-MAIL (comunicacao/entrega.py) ---
+# EM_SEGUNDO_PLANO: os relatórios entram em uma fila e são enviados por WORKERS threads enquanto as unidades seguintes
+# são processadas; cada thread mantém sua sessão SMTP autenticada aberta por até MENSAGENS_POR_SESSAO mensagens.
+# Falhas temporárias são repetidas até TENTATIVAS vezes, com espera de ESPERA_INICIAL_S multiplicada por FATOR_BACKOFF.
+PARAMETROS_ENTREGA: Dict[str, Any] = {
+    "EM_SEGUNDO_PLANO": True,
+    "WORKERS": 2,
+    "TAMANHO_FILA": 50,
+    "MENSAGENS_POR_SESSAO": 100,
+    "TENTATIVAS": 3,
+    "ESPERA_INICIAL_S": 2.0,
+    "FATOR_BACKOFF": 2.0,
+    "TIMEOUT_S": 60,
+    "USAR_STARTTLS": True
+}
+
+# --- ANEXO DOS RELATÓRIOS (analise/exportacao.py) ---
+# FORMATO: "zip" ou "gzip" (CSV compactado enquanto é gravado), "parquet", "xlsx" (exige openpyxl) ou "csv" (sem compactação).
+PARAMETROS_ANEXO: Dict[str, Any] = {
+    "FORMATO": "zip",
+    "NIVEL_COMPRESSAO": 6
+}
+
+# --- LEITOR LOCAL DE CSV (leitor_local.py) ---
+# Cada CSV exportado é convertido uma vez em um snapshot Arrow IPC (DIRETORIO_SNAPSHOTS), ordenado por UNIDADE e DATA,
+# gravado em lotes de LINHAS_POR_LOTE linhas e acompanhado do índice de posições por unidade.
+# Até ARQUIVOS_EM_CACHE snapshots ficam mapeados em memória (LRU).
+PARAMETROS_LEITOR_LOCAL: Dict[str, Any] = {
+    "DIRETORIO_SNAPSHOTS": OUTPUT_DIR / "snapshots",
+    "ARQUIVOS_EM_CACHE": 4,
+    "LINHAS_POR_LOTE": 65536
 }
 
 # --- PARÂMETROS PARA MÓDULOS ESPECÍFICOS (NÃO SÃO SEGREDOS) ---
@@ -43,7 +152,37 @@ MAPA_GESTORES: Dict[str, str] = {
     "SP - Administração": "cesargl@sebraesp.com.br"
 }
 
+# --- POOL DE CONEXÕES DOS ENGINES (database.obter_conexao) ---
+# Padrões para todas as conexões; uma entrada de CONEXOES pode sobrescrever qualquer chave em "pool": {...}.
+# RECICLAR_S: idade máxima de uma conexão no pool. PRE_PING: testa a conexão antes de entregá-la.
+# AQUECER: conexões abertas já no início da execução (database.aquecer_conexoes), fora do caminho da primeira consulta.
+PARAMETROS_POOL: Dict[str, Any] = {
+    "TAMANHO": 5,
+    "OVERFLOW": 10,
+    "TIMEOUT_S": 30,
+    "RECICLAR_S": 1800,
+    "PRE_PING": True,
+    "AQUECER": 0
+}
+
+# --- GRAVAÇÃO EM MASSA (database.salvar_dataframe) ---
+# O DataFrame é gravado em uma tabela de staging em lotes de LINHAS_POR_LOTE linhas, por até WORKERS conexões em paralelo,
+# e movido para a tabela final em uma única instrução (com bloqueio de tabela no SQL Server) ou mesclado pela chave.
+PARAMETROS_CARGA: Dict[str, Any] = {
+    "LINHAS_POR_LOTE": 10000,
+    "WORKERS": 4
+}
+
+# --- EXECUÇÃO ASSÍNCRONA DE CONSULTAS (query_executor.ExecutorAssincrono) ---
+# Cada conexão tem seu próprio pool de threads, com WORKERS_POR_CONEXAO threads (0 = o TAMANHO do pool de conexões).
+# TIMEOUT_S conta a partir do início da execução de cada consulta; ao estourar, a consulta é interrompida no banco.
+PARAMETROS_CONSULTAS: Dict[str, Any] = {
+    "WORKERS_POR_CONEXAO": 0,
+    "TIMEOUT_S": 300
+}
+
 # --- CONFIGURAÇÕES DE CONEXÃO (LÊ OS SEGREDOS DO .env) ---
+# "tipo": "sql"/"azure_sql" (SQL Server via pyodbc), "sqlite" (arquivo local em "caminho") ou "mdx".
 CONEXOES: Dict[str, Dict[str, Any]] = {
     "SPSVSQL39_FINANCA": {
         "tipo": "sql",
@@ -1,20 +1,138 @@
 # analise_despesa/database.py
 import logging
+import threading
 import time
-from typing import Union, Dict
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Union
 import pandas as pd
 import sqlalchemy
+from sqlalchemy import event
 from sqlalchemy.engine import Engine
-from .config import CONEXOES
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.types import TypeEngine
+from .config import CONEXOES, PARAMETROS_CARGA, PARAMETROS_POOL
 
 logger = logging.getLogger(__name__)
 
 _ENGINES: Dict[str, Engine] = {}
+_TRAVA_ENGINES = threading.Lock()
+
+class _Telemetria:
+    """Contadores de tempo (quantidade, total e máximo, em segundos) de um engine, seguros entre threads."""
+
+    METRICAS = ("espera_checkout", "conexao", "consulta")
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._tempos = {metrica: [0, 0.0, 0.0] for metrica in self.METRICAS}
+        self.erros_consulta = 0
+        self.invalidacoes = 0
+        # Tempo gasto abrindo conexões dentro do checkout atual da thread (descontado da espera).
+        self.local = threading.local()
+
+    def registrar(self, metrica: str, segundos: float) -> None:
+        with self._trava:
+            contagem = self._tempos[metrica]
+            contagem[0] += 1
+            contagem[1] += segundos
+            contagem[2] = max(contagem[2], segundos)
+
+    def contar(self, contador: str) -> None:
+        with self._trava:
+            setattr(self, contador, getattr(self, contador) + 1)
+
+    def resumo(self) -> Dict[str, List[float]]:
+        with self._trava:
+            return {metrica: list(contagem) for metrica, contagem in self._tempos.items()}
+
+class _PoolComTelemetria(QueuePool):
+    """QueuePool que mede quanto cada checkout esperou por uma conexão livre."""
+
+    telemetria: Optional[_Telemetria] = None
+
+    def _do_get(self):
+        telemetria = self.telemetria
+        if telemetria is None:
+            return super()._do_get()
+        telemetria.local.conexao_s = 0.0
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            # Abrir uma conexão nova acontece dentro do checkout, mas é medido à parte (métrica 'conexao').
+            telemetria.registrar("espera_checkout", max(0.0, time.perf_counter() - inicio - telemetria.local.conexao_s))
+
+def _parametros_pool(info: Dict[str, Any]) -> Dict[str, Any]:
+    """PARAMETROS_POOL com as chaves sobrescritas na entrada da conexão ("pool": {...})."""
+    parametros = {**PARAMETROS_POOL, **info.get("pool", {})}
+    chaves_invalidas = set(parametros) - set(PARAMETROS_POOL)
+    if chaves_invalidas:
+        raise ValueError(f"Parâmetros de pool desconhecidos: {sorted(chaves_invalidas)}")
+    return parametros
+
+def obter_parametros_pool(nome_conexao: str) -> Dict[str, Any]:
+    """Parâmetros efetivos do pool de uma conexão de CONEXOES (PARAMETROS_POOL com as sobrescritas da entrada)."""
+    return _parametros_pool(CONEXOES.get(nome_conexao, {}))
+
+def _registrar_eventos(engine: Engine, telemetria: _Telemetria) -> None:
+    """Liga a telemetria aos eventos de conexão e de execução do engine."""
+
+    @event.listens_for(engine, "do_connect")
+    def _inicio_conexao(dialect, conn_rec, cargs, cparams):
+        conn_rec.info["_inicio_conexao"] = time.perf_counter()
+
+    @event.listens_for(engine, "connect")
+    def _fim_conexao(dbapi_connection, conn_rec):
+        inicio = conn_rec.info.pop("_inicio_conexao", None)
+        if inicio is not None:
+            duracao = time.perf_counter() - inicio
+            telemetria.registrar("conexao", duracao)
+            telemetria.local.conexao_s = getattr(telemetria.local, "conexao_s", 0.0) + duracao
+
+    @event.listens_for(engine, "invalidate")
+    def _invalidacao(dbapi_connection, conn_rec, exception):
+        telemetria.contar("invalidacoes")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _inicio_consulta(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_inicios_consulta", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _fim_consulta(conn, cursor, statement, parameters, context, executemany):
+        telemetria.registrar("consulta", time.perf_counter() - conn.info["_inicios_consulta"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _erro_consulta(contexto):
+        inicios = contexto.connection.info.get("_inicios_consulta") if contexto.connection is not None else None
+        if inicios:
+            inicios.pop()
+        telemetria.contar("erros_consulta")
+
+def _criar_engine(url: Union[str, sqlalchemy.engine.URL], info: Dict[str, Any], **kwargs) -> Engine:
+    """Engine com o pool configurado (tamanho, overflow, reciclagem e pre-ping) e a telemetria ligada."""
+    parametros = _parametros_pool(info)
+    telemetria = _Telemetria()
+    # Uma classe por engine: o pool recriado em um dispose() continua apontando para a mesma telemetria.
+    classe_pool = type("_PoolComTelemetria", (_PoolComTelemetria,), {"telemetria": telemetria})
+    engine = sqlalchemy.create_engine(
+        url,
+        poolclass=classe_pool,
+        pool_size=int(parametros["TAMANHO"]),
+        max_overflow=int(parametros["OVERFLOW"]),
+        pool_timeout=float(parametros["TIMEOUT_S"]),
+        pool_recycle=int(parametros["RECICLAR_S"]),
+        pool_pre_ping=bool(parametros["PRE_PING"]),
+        **kwargs
+    )
+    _registrar_eventos(engine, telemetria)
+    return engine
 
 def obter_conexao(nome_conexao: str) -> Union[Engine, str]:
     """
     Cria ou retorna do cache um objeto de conexão.
     Para SQL Server, habilita 'fast_executemany' para performance máxima em inserções.
+    O pool de cada engine segue PARAMETROS_POOL (ou o "pool" da entrada em CONEXOES) e registra telemetria.
     """
     if nome_conexao in _ENGINES:
         logger.debug(f"Retornando engine do cache para '{nome_conexao}'")
@@ -25,24 +143,77 @@ def obter_conexao(nome_conexao: str) -> Union[Engine, str]:
         raise ValueError(f"Configuração de conexão '{nome_conexao}' não encontrada em config.py")
 
     tipo = info.get("tipo", "sql").lower()
-    logger.info(f"Criando novo objeto de conexão para '{nome_conexao}' (tipo: {tipo})")
-
-    if tipo in ("sql", "azure_sql"):
-        url = sqlalchemy.engine.URL.create(
-            drivername="mssql+pyodbc",
-            query={"odbc_connect": _construir_odbc_str(info)}
-        )
-        # --- CORREÇÃO DE PERFORMANCE E ERRO ---
-        # Habilita o modo de inserção em massa otimizado do pyodbc.
-        # Isso é muito mais rápido e evita o limite de 2100 parâmetros do método 'multi'.
-        engine = sqlalchemy.create_engine(url, fast_executemany=True)
+    if tipo == "mdx":
+        return info["str_conexao"]
+
+    with _TRAVA_ENGINES:
+        # Extrações concorrentes podem pedir o mesmo engine ao mesmo tempo: só a primeira o cria.
+        if nome_conexao in _ENGINES:
+            return _ENGINES[nome_conexao]
+        logger.info(f"Criando novo objeto de conexão para '{nome_conexao}' (tipo: {tipo})")
+
+        if tipo in ("sql", "azure_sql"):
+            url = sqlalchemy.engine.URL.create(
+                drivername="mssql+pyodbc",
+                query={"odbc_connect": _construir_odbc_str(info)}
+            )
+            # --- CORREÇÃO DE PERFORMANCE E ERRO ---
+            # Habilita o modo de inserção em massa otimizado do pyodbc.
+            # Isso é muito mais rápido e evita o limite de 2100 parâmetros do método 'multi'.
+            engine = _criar_engine(url, info, fast_executemany=True)
+        elif tipo == "sqlite":
+            engine = _criar_engine(sqlalchemy.engine.URL.create("sqlite", database=str(info["caminho"])), info)
+        else:
+            raise ValueError(f"Tipo de conexão '{tipo}' não suportado.")
+
         _ENGINES[nome_conexao] = engine
         return engine
-    
-    elif tipo == "mdx":
-        return info["str_conexao"]
-    
-    raise ValueError(f"Tipo de conexão '{tipo}' não suportado.")
+
+def aquecer_conexoes(nomes_conexoes: Optional[Iterable[str]] = None) -> None:
+    """
+    Abre de antemão as conexões configuradas em "AQUECER" (limitado ao tamanho do pool), para que a primeira consulta
+    não pague o custo de conexão. Falhas apenas geram aviso: a conexão será aberta normalmente na primeira consulta.
+    """
+    for nome_conexao in (CONEXOES if nomes_conexoes is None else nomes_conexoes):
+        info = CONEXOES.get(nome_conexao, {})
+        if info.get("tipo", "sql").lower() == "mdx":
+            continue
+        try:
+            parametros = _parametros_pool(info)
+            quantidade = min(int(parametros["AQUECER"]), int(parametros["TAMANHO"]))
+            if quantidade <= 0:
+                continue
+            inicio = time.perf_counter()
+            engine = obter_conexao(nome_conexao)
+            conexoes = []
+            try:
+                for _ in range(quantidade):
+                    conexoes.append(engine.connect())
+            finally:
+                for conexao in conexoes:
+                    conexao.close()
+            logger.info(f"🔥 {len(conexoes)} conexão(ões) de '{nome_conexao}' aquecida(s) em {time.perf_counter() - inicio:.2f}s.")
+        except Exception as e:
+            logger.warning(f"⚠️  Não foi possível aquecer as conexões de '{nome_conexao}'. Erro: {e}")
+
+def obter_metricas_conexoes() -> pd.DataFrame:
+    """
+    Telemetria dos engines criados nesta execução: uma linha por conexão e métrica ('espera_checkout', 'conexao',
+    'consulta'), com quantidade, tempos total/médio/máximo em segundos, erros de consulta, invalidações e estado do pool.
+    """
+    linhas = []
+    for nome_conexao, engine in list(_ENGINES.items()):
+        telemetria = getattr(engine.pool, "telemetria", None)
+        if telemetria is None:
+            continue
+        estado_pool = {"pool_tamanho": engine.pool.size(), "pool_em_uso": engine.pool.checkedout(),
+                       "pool_livres": engine.pool.checkedin(), "pool_overflow": engine.pool.overflow()}
+        for metrica, (quantidade, total, maximo) in telemetria.resumo().items():
+            linhas.append({"conexao": nome_conexao, "metrica": metrica, "quantidade": quantidade, "total_s": total,
+                           "media_s": total / quantidade if quantidade else 0.0, "max_s": maximo,
+                           "erros_consulta": telemetria.erros_consulta, "invalidacoes": telemetria.invalidacoes, **estado_pool})
+    return pd.DataFrame(linhas, columns=["conexao", "metrica", "quantidade", "total_s", "media_s", "max_s", "erros_consulta",
+                                         "invalidacoes", "pool_tamanho", "pool_em_uso", "pool_livres", "pool_overflow"])
 
 def _construir_odbc_str(info: dict) -> str:
     driver = info["driver"]
@@ -61,34 +232,176 @@ def _construir_odbc_str(info: dict) -> str:
 
     return ";".join(odbc_parts)
 
-def salvar_dataframe(df: pd.DataFrame, nome_tabela: str, nome_conexao: str, if_exists: str = "replace"):
+_MAIOR_NVARCHAR = 4000
+
+def _tipo_da_coluna(serie: pd.Series) -> TypeEngine:
+    """
+    Tipo SQL da coluna a partir do dtype. Textos usam o comprimento máximo observado arredondado para potência de 2,
+    limitado a 4000 (maior NVARCHAR(n) do SQL Server); acima disso, texto sem limite (NVARCHAR(max)).
     """
-    Salva um DataFrame em uma tabela de banco de dados usando um bloco de transação explícito
-    e a otimização 'fast_executemany' do engine.
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        if serie.cat.categories.dtype != object:
+            return _tipo_da_coluna(pd.Series(serie.cat.categories))
+        serie = serie.astype(object)
+    if pd.api.types.is_bool_dtype(serie):
+        return sqlalchemy.Boolean()
+    if pd.api.types.is_integer_dtype(serie):
+        return sqlalchemy.BigInteger()
+    if pd.api.types.is_float_dtype(serie):
+        return sqlalchemy.Float(precision=53)
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return sqlalchemy.DateTime()
+    inferido = pd.api.types.infer_dtype(serie, skipna=True)
+    if inferido in ("datetime", "datetime64"):
+        return sqlalchemy.DateTime()
+    if inferido == "date":
+        return sqlalchemy.Date()
+    comprimento = int(serie.dropna().astype(str).str.len().max()) if serie.notna().any() else 0
+    if comprimento > 4000:
+        return sqlalchemy.Unicode()
+    return sqlalchemy.Unicode(min(_MAIOR_NVARCHAR, max(16, 1 << (comprimento - 1).bit_length())))
+
+def _registros(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Linhas do DataFrame como dicionários de tipos Python (datas como datetime e nulos como None), prontas para executemany."""
+    valores = []
+    for coluna in df.columns:
+        serie = df[coluna]
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            valores.append(serie.to_numpy(dtype='datetime64[us]').astype(object))
+        else:
+            convertidos = serie.astype(object).to_numpy()
+            convertidos[pd.isna(convertidos)] = None
+            valores.append(convertidos)
+    nomes = [str(coluna) for coluna in df.columns]
+    return [dict(zip(nomes, linha)) for linha in zip(*valores)]
+
+def _mover_generico(preparador, destino: str, staging: str, colunas: List[str], dica: str) -> List[str]:
+    lista = ", ".join(preparador.quote(coluna) for coluna in colunas)
+    return [f"INSERT INTO {destino}{dica} ({lista}) SELECT {lista} FROM {staging}"]
+
+def _mesclar_generico(preparador, destino: str, staging: str, colunas: List[str], chaves: List[str], dica: str) -> List[str]:
+    """Upsert portável: remove do destino as chaves presentes no staging e insere todas as linhas do staging."""
+    condicao = " AND ".join(f"s.{preparador.quote(chave)} = {destino}.{preparador.quote(chave)}" for chave in chaves)
+    return [f"DELETE FROM {destino} WHERE EXISTS (SELECT 1 FROM {staging} s WHERE {condicao})",
+            *_mover_generico(preparador, destino, staging, colunas, dica)]
+
+def _mesclar_sql_server(preparador, destino: str, staging: str, colunas: List[str], chaves: List[str], dica: str) -> List[str]:
+    """Upsert em uma única instrução MERGE, com a tabela de destino bloqueada durante a mesclagem."""
+    condicao = " AND ".join(f"d.{preparador.quote(chave)} = s.{preparador.quote(chave)}" for chave in chaves)
+    lista = ", ".join(preparador.quote(coluna) for coluna in colunas)
+    atualizacoes = ", ".join(f"d.{preparador.quote(coluna)} = s.{preparador.quote(coluna)}" for coluna in colunas if coluna not in chaves)
+    quando_existe = f" WHEN MATCHED THEN UPDATE SET {atualizacoes}" if atualizacoes else ""
+    return [f"MERGE INTO {destino}{dica} AS d USING {staging} AS s ON {condicao}{quando_existe}"
+            f" WHEN NOT MATCHED BY TARGET THEN INSERT ({lista}) VALUES ({', '.join('s.' + preparador.quote(c) for c in colunas)});"]
+
+# Instruções de carga por dialeto (engine.dialect.name); dialetos não listados usam "padrao".
+# "dica_bloqueio" é aplicada à tabela de destino na movimentação final a partir do staging.
+DIALETOS_CARGA: Dict[str, Dict[str, Any]] = {
+    "mssql": {"dica_bloqueio": " WITH (TABLOCK)", "mover": _mover_generico, "mesclar": _mesclar_sql_server},
+    "padrao": {"dica_bloqueio": "", "mover": _mover_generico, "mesclar": _mesclar_generico},
+}
+
+def _gravar_lotes(engine: Engine, staging: sqlalchemy.Table, lotes: List[pd.DataFrame]) -> int:
+    """Grava os lotes de um worker no staging usando uma única conexão e transação."""
+    with engine.begin() as connection:
+        for df_lote in lotes:
+            connection.execute(staging.insert(), _registros(df_lote))
+    return sum(len(df_lote) for df_lote in lotes)
+
+def _tipos_das_colunas(engine: Engine, df: pd.DataFrame, nome_tabela: str, reaproveitar_destino: bool,
+                       tipos: Optional[Dict[str, TypeEngine]] = None) -> Dict[str, TypeEngine]:
     """
+    Tipo SQL de cada coluna: o informado em 'tipos', o da tabela de destino já existente (acréscimo ou mesclagem,
+    para que textos mais longos que os do DataFrame atual não sejam truncados) ou o inferido do dtype.
+    """
+    tipos = tipos or {}
+    tipos_destino: Dict[str, TypeEngine] = {}
+    if reaproveitar_destino:
+        inspetor = sqlalchemy.inspect(engine)
+        if inspetor.has_table(nome_tabela):
+            tipos_destino = {coluna["name"]: coluna["type"] for coluna in inspetor.get_columns(nome_tabela)}
+    return {str(coluna): tipos.get(coluna) or tipos_destino.get(str(coluna)) or _tipo_da_coluna(df[coluna]) for coluna in df.columns}
+
+def salvar_dataframe(df: pd.DataFrame, nome_tabela: str, nome_conexao: str, if_exists: str = "replace",
+                     chave: Optional[Union[str, List[str]]] = None, tipos: Optional[Dict[str, TypeEngine]] = None,
+                     workers: Optional[int] = None, linhas_por_lote: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Salva um DataFrame em uma tabela em massa: os lotes são gravados em paralelo em uma tabela de staging e movidos
+    para a tabela final em uma única transação (com bloqueio de tabela no SQL Server).
+    - if_exists: "replace" (recria a tabela), "append" ou "fail", como no DataFrame.to_sql.
+    - chave: coluna(s) de mesclagem (ex.: 'LCTREF'). As linhas com chave já existente são atualizadas e as demais inseridas;
+      a tabela nunca é recriada nesse modo.
+    - tipos: tipos SQLAlchemy por coluna; as demais colunas são mapeadas a partir do dtype.
+    Retorna as linhas gravadas, o tempo total e a vazão (linhas/s).
+    """
+    if if_exists not in ("replace", "append", "fail"):
+        raise ValueError(f"if_exists inválido: '{if_exists}'. Use 'replace', 'append' ou 'fail'.")
+    chaves = [chave] if isinstance(chave, str) else list(chave or [])
+    chaves_faltando = [coluna for coluna in chaves if coluna not in df.columns]
+    if chaves_faltando:
+        raise ValueError(f"Colunas de chave não encontradas no DataFrame: {chaves_faltando}")
     if df.empty:
         logger.warning(f"⚠️  DataFrame está vazio. Nada será salvo na tabela '{nome_tabela}'.")
-        return
+        return {"linhas": 0, "segundos": 0.0, "linhas_por_segundo": 0.0}
+    if chaves and df.duplicated(chaves).any():
+        logger.warning(f"⚠️  Chaves {chaves} duplicadas no DataFrame: apenas a última ocorrência de cada chave será gravada.")
+        df = df.drop_duplicates(chaves, keep="last")
 
     logger.info(f"📀 Iniciando salvamento de {len(df)} linhas na tabela '{nome_tabela}'...")
     inicio = time.perf_counter()
-    
+
     engine = obter_conexao(nome_conexao)
+    dialeto = DIALETOS_CARGA.get(engine.dialect.name, DIALETOS_CARGA["padrao"])
+    preparador = engine.dialect.identifier_preparer
+    colunas = [str(coluna) for coluna in df.columns]
+    tipos_colunas = _tipos_das_colunas(engine, df, nome_tabela, reaproveitar_destino=if_exists != "replace" or bool(chaves), tipos=tipos)
+
+    def _tabela(nome: str) -> sqlalchemy.Table:
+        return sqlalchemy.Table(nome, sqlalchemy.MetaData(), *[sqlalchemy.Column(c, tipos_colunas[c]) for c in colunas])
+
+    staging = _tabela(f"{nome_tabela}__carga_{uuid.uuid4().hex[:8]}")
+    linhas_por_lote = int(linhas_por_lote or PARAMETROS_CARGA["LINHAS_POR_LOTE"])
+    lotes = [df.iloc[posicao:posicao + linhas_por_lote] for posicao in range(0, len(df), linhas_por_lote)]
+    workers = max(1, min(int(workers or PARAMETROS_CARGA["WORKERS"]), len(lotes)))
 
     try:
+        staging.create(engine)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda parte: _gravar_lotes(engine, staging, lotes[parte::workers]), range(workers)))
+        if chaves:
+            sqlalchemy.Index(f"ix_{staging.name}", *[staging.c[coluna] for coluna in map(str, chaves)]).create(engine)
+        tempo_staging = time.perf_counter() - inicio
+
         with engine.begin() as connection:
-            df.to_sql(
-                name=nome_tabela,
-                con=connection,
-                if_exists=if_exists,
-                index=False,
-                chunksize=1000 # chunksize continua sendo uma boa prática
-                # Removemos `method='multi'` porque `fast_executemany` no engine é superior
-            )
-            fim = time.perf_counter()
-            tempo = fim - inicio
-            logger.info(f"✅ Salvamento na tabela '{nome_tabela}' concluído com sucesso em {tempo:.2f} segundos.")
-    
+            destino = _tabela(nome_tabela)
+            existe = sqlalchemy.inspect(connection).has_table(nome_tabela)
+            if existe and if_exists == "fail":
+                raise ValueError(f"A tabela '{nome_tabela}' já existe.")
+            if existe and if_exists == "replace" and not chaves:
+                destino.drop(connection)
+                existe = False
+            if not existe:
+                destino.create(connection)
+            nome_destino, nome_staging = preparador.format_table(destino), preparador.format_table(staging)
+            if chaves and existe:
+                instrucoes = dialeto["mesclar"](preparador, nome_destino, nome_staging, colunas, chaves, dialeto["dica_bloqueio"])
+            else:
+                instrucoes = dialeto["mover"](preparador, nome_destino, nome_staging, colunas, dialeto["dica_bloqueio"])
+            for instrucao in instrucoes:
+                connection.exec_driver_sql(instrucao)
+
+        tempo = time.perf_counter() - inicio
+        vazao = len(df) / tempo if tempo > 0 else float('inf')
+        logger.info(f"✅ Salvamento na tabela '{nome_tabela}' concluído com sucesso em {tempo:.2f} segundos "
+                    f"({vazao:,.0f} linhas/s; staging em {len(lotes)} lotes/{workers} conexões: {tempo_staging:.2f}s"
+                    f"{'; mesclado por ' + ', '.join(chaves) if chaves else ''}).")
+        return {"linhas": len(df), "segundos": tempo, "linhas_por_segundo": vazao}
+
     except Exception as e:
         logger.error(f"❌ Erro ao salvar dados na tabela '{nome_tabela}'. A transação foi desfeita (rollback). Erro: {e}", exc_info=True)
         raise
+    finally:
+        try:
+            staging.drop(engine, checkfirst=True)
+        except Exception as e:
+            logger.warning(f"⚠️  Não foi possível remover a tabela de staging '{staging.name}'. Erro: {e}")
@@ -1,17 +1,163 @@
 # analise_despesa/extracao.py (VERSÃO FINAL COM QUERY OTIMIZADA)
 
+import datetime
 import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
-from . import database
+from . import cache, database
+from .config import PARAMETROS_ANALISE
 from .exceptions import AnaliseDespesaError
 from .utils import carregar_sql
-from typing import List
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import re
 
 logger = logging.getLogger(__name__)
 
-def buscar_dados_realizado(ano: int) -> pd.DataFrame:
-    """Lê os dados BRUTOS de despesas do arquivo SQL."""
+COLUNAS_NECESSARIAS = ['VALOR', 'DATA', 'PROJETO', 'FORNECEDOR', 'CC', 'UNIDADE', 'COD_CONTA', 'DESC_NIVEL_4']
+
+# Contrato de tipos aplicado a cada lote assim que ele chega do servidor.
+# As colunas categóricas reduzem drasticamente a memória das colunas de texto repetitivas.
+CONTRATO_DTYPES: Dict[str, str] = {
+    'VALOR': 'float64',
+    'DATA': 'datetime64[ns]',
+    'UNIDADE': 'category',
+    'PROJETO': 'category',
+    'FORNECEDOR': 'category',
+    'CC': 'category',
+    'COD_CONTA': 'category',
+}
+
+def _validar_colunas(df: pd.DataFrame) -> None:
+    colunas_faltando = [col for col in COLUNAS_NECESSARIAS if col not in df.columns]
+    if colunas_faltando:
+        logger.error(f"ERRO FATAL: As seguintes colunas essenciais não foram encontradas no resultado da query: {colunas_faltando}. Verifique o script em 'sql/extracao_realizado.sql'.")
+        raise AnaliseDespesaError(f"Extração falhou em trazer colunas essenciais: {colunas_faltando}")
+
+def _memoria_pico_processo_mb() -> Optional[float]:
+    """Retorna o pico de memória do processo em MB, quando o sistema operacional permite medir."""
+    if sys.platform == 'win32':
+        # No Windows não há 'resource'; o pico vem de 'peak_wset' do psutil (opcional).
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é reportado em bytes no macOS e em KB no Linux.
+    return pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024
+
+def aplicar_contrato_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte as colunas presentes no DataFrame para os tipos definidos em CONTRATO_DTYPES."""
+    for coluna, dtype in CONTRATO_DTYPES.items():
+        if coluna not in df.columns:
+            continue
+        if dtype == 'float64':
+            df[coluna] = pd.to_numeric(df[coluna], errors='coerce').astype('float64')
+        elif dtype.startswith('datetime64'):
+            df[coluna] = pd.to_datetime(df[coluna])
+        else:
+            df[coluna] = df[coluna].astype(dtype)
+    return df
+
+def concatenar_lotes(lotes: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatena lotes já tipados preservando as colunas categóricas.
+    Cada lote chega com suas próprias categorias; unificamos antes do concat para
+    que o pandas não as converta de volta para 'object'.
+    """
+    if not lotes:
+        return pd.DataFrame()
+    colunas_categoricas = [col for col, dtype in CONTRATO_DTYPES.items() if dtype == 'category' and col in lotes[0].columns]
+    for coluna in colunas_categoricas:
+        categorias = sorted(set().union(*(lote[coluna].cat.categories for lote in lotes)))
+        for lote in lotes:
+            lote[coluna] = lote[coluna].cat.set_categories(categorias)
+    return pd.concat(lotes, ignore_index=True)
+
+def _intervalo_do_ano(ano: int) -> Tuple[datetime.datetime, datetime.datetime]:
+    return datetime.datetime(ano, 1, 1), datetime.datetime(ano + 1, 1, 1)
+
+def iterar_dados_realizado(ano: int, tamanho_lote: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Lê os dados BRUTOS de despesas em lotes, aplicando o contrato de tipos a cada lote.
+    Registra no log a memória de cada lote e o pico de memória do processo.
+    """
+    tamanho_lote = tamanho_lote or int(PARAMETROS_ANALISE["TAMANHO_LOTE_EXTRACAO"])
+    logger.info(f"Iniciando extração em lotes do Realizado (lotes de {tamanho_lote} linhas).")
+
+    engine = database.obter_conexao("SPSVSQL39_FINANCA")
+    sql_query_str = carregar_sql('sql/extracao_realizado.sql')
+
+    try:
+        memoria_acumulada_mb = 0.0
+        for numero_lote, lote in enumerate(pd.read_sql(sql_query_str, engine, params=_intervalo_do_ano(ano), chunksize=tamanho_lote), start=1):
+            if numero_lote == 1:
+                _validar_colunas(lote)
+            lote = aplicar_contrato_dtypes(lote)
+            memoria_lote_mb = lote.memory_usage(deep=True).sum() / 1024 ** 2
+            memoria_acumulada_mb += memoria_lote_mb
+            pico_processo_mb = _memoria_pico_processo_mb()
+            pico_str = f"{pico_processo_mb:.1f} MB" if pico_processo_mb is not None else "indisponível"
+            logger.info(f"Lote {numero_lote}: {len(lote)} linhas | memória do lote: {memoria_lote_mb:.1f} MB | acumulado: {memoria_acumulada_mb:.1f} MB | pico do processo: {pico_str}")
+            yield lote
+    except AnaliseDespesaError:
+        raise
+    except Exception as e:
+        logger.error(f"Falha ao ler dados do Realizado em lotes. Erro detalhado: {e}", exc_info=True)
+        raise AnaliseDespesaError("Falha ao ler dados do Realizado.") from e
+
+def planejar_intervalos_mensais(ano: int) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+    """Divide o ano em 12 intervalos semiabertos [início do mês, início do mês seguinte)."""
+    inicios = [datetime.datetime(ano, mes, 1) for mes in range(1, 13)]
+    return list(zip(inicios, inicios[1:] + [datetime.datetime(ano + 1, 1, 1)]))
+
+def buscar_dados_realizado_paralelo(ano: int, max_workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Lê o ano do Realizado como 12 consultas mensais por intervalo de DATA, executadas em um pool
+    limitado de threads sobre o mesmo engine (cacheado em database.obter_conexao).
+    Os meses são concatenados em ordem cronológica.
+    """
+    max_workers = max_workers or int(PARAMETROS_ANALISE["WORKERS_EXTRACAO"])
+    intervalos = planejar_intervalos_mensais(ano)
+    logger.info(f"Iniciando extração paralela do Realizado {ano}: {len(intervalos)} intervalos mensais com {max_workers} workers.")
+    inicio = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extracao") as executor:
+        # 'map' devolve os resultados na ordem dos intervalos, independentemente da ordem de conclusão.
+        lotes = list(executor.map(lambda intervalo: buscar_dados_realizado_intervalo(*intervalo), intervalos))
+
+    df = concatenar_lotes(lotes)
+    logger.info(f"Extração paralela concluída ({len(df)} linhas em {time.perf_counter() - inicio:.2f}s).")
+    return df
+
+def buscar_dados_realizado(ano: int, modo_streaming: bool = False, tamanho_lote: Optional[int] = None,
+                           atualizar_cache: bool = False, max_workers: int = 1) -> pd.DataFrame:
+    """
+    Lê os dados BRUTOS de despesas do arquivo SQL, reaproveitando o cache local quando válido.
+    Com 'modo_streaming', a leitura é feita em lotes tipados e devolvida como um único DataFrame compacto.
+    Com 'max_workers' > 1, o ano é lido em intervalos mensais paralelos (ver buscar_dados_realizado_paralelo).
+    """
+    sql_query_str = carregar_sql('sql/extracao_realizado.sql')
+    return cache.obter_ou_executar(
+        sql_query_str, {"ano": ano, "em_lotes": modo_streaming, "paralelo": max_workers > 1}, "SPSVSQL39_FINANCA",
+        lambda: _ler_dados_realizado(ano, modo_streaming, tamanho_lote, max_workers), atualizar=atualizar_cache
+    )
+
+def _ler_dados_realizado(ano: int, modo_streaming: bool, tamanho_lote: Optional[int], max_workers: int) -> pd.DataFrame:
+    if max_workers > 1:
+        return buscar_dados_realizado_paralelo(ano, max_workers)
+
+    if modo_streaming:
+        df = concatenar_lotes(list(iterar_dados_realizado(ano, tamanho_lote)))
+        logger.info(f"Leitura do REALIZADO BRUTO em lotes concluída ({len(df)} linhas, {df.memory_usage(deep=True).sum() / 1024 ** 2:.1f} MB).")
+        return df
+
     logger.info("Iniciando extração de dados BRUTOS do Realizado.")
     
     engine = database.obter_conexao("SPSVSQL39_FINANCA")
@@ -19,28 +165,69 @@ def buscar_dados_realizado(ano: int) -> pd.DataFrame:
     try:
         sql_query_str = carregar_sql('sql/extracao_realizado.sql')
         
-        df = pd.read_sql(sql_query_str, engine, params=(ano,))
+        df = pd.read_sql(sql_query_str, engine, params=_intervalo_do_ano(ano))
         
         logger.info(f"Leitura do REALIZADO BRUTO concluída ({len(df)} linhas).")
         logger.debug(f"Colunas extraídas: {df.columns.tolist()}")
 
-        colunas_necessarias = ['VALOR', 'DATA', 'PROJETO', 'FORNECEDOR', 'CC', 'UNIDADE', 'COD_CONTA', 'DESC_NIVEL_4']
-        colunas_faltando = [col for col in colunas_necessarias if col not in df.columns]
-        if colunas_faltando:
-            logger.error(f"ERRO FATAL: As seguintes colunas essenciais não foram encontradas no resultado da query: {colunas_faltando}. Verifique o script em 'sql/extracao_realizado.sql'.")
-            raise AnaliseDespesaError(f"Extração falhou em trazer colunas essenciais: {colunas_faltando}")
+        _validar_colunas(df)
 
         return df
     except Exception as e:
         logger.error(f"Falha ao ler dados do Realizado. Verifique a conexão e o script SQL. Erro detalhado: {e}", exc_info=True)
         raise AnaliseDespesaError("Falha ao ler dados do Realizado.") from e
 
-def buscar_dados_orcamento(id_periodo: str) -> pd.DataFrame:
-    """Lê os dados de OR��AMENTO."""
+def buscar_dados_realizado_intervalo(data_inicio: datetime.datetime, data_fim: datetime.datetime) -> pd.DataFrame:
+    """Lê os dados BRUTOS de despesas no intervalo semiaberto [data_inicio, data_fim), já com o contrato de tipos."""
+    logger.info(f"Extraindo Realizado de {data_inicio:%d/%m/%Y} até {data_fim:%d/%m/%Y} (exclusivo).")
+    engine = database.obter_conexao("SPSVSQL39_FINANCA")
+    sql_query_str = carregar_sql('sql/extracao_realizado_intervalo.sql')
+
+    try:
+        df = pd.read_sql(sql_query_str, engine, params=(data_inicio, data_fim))
+        _validar_colunas(df)
+        logger.info(f"Leitura do intervalo concluída ({len(df)} linhas).")
+        return aplicar_contrato_dtypes(df)
+    except AnaliseDespesaError:
+        raise
+    except Exception as e:
+        logger.error(f"Falha ao ler o intervalo do Realizado. Erro detalhado: {e}", exc_info=True)
+        raise AnaliseDespesaError("Falha ao ler dados do Realizado.") from e
+
+def buscar_dados_realizado_incremental(inicio_ano: datetime.datetime, fim_ano: datetime.datetime,
+                                       corte: datetime.datetime, lctref: int) -> pd.DataFrame:
+    """
+    Lê os dados BRUTOS do ano [inicio_ano, fim_ano) de cada LCTREF com alguma linha a partir do corte ou acima
+    da marca d'água (lançamentos novos com data retroativa), já com o contrato de tipos. Todas as linhas do
+    LCTREF são trazidas, inclusive as anteriores ao corte, pois a base local substitui o LCTREF inteiro.
+    """
+    logger.info(f"Extraindo Realizado a partir de {corte:%d/%m/%Y} e LCTREF acima de {lctref} (até {fim_ano:%d/%m/%Y}, exclusivo).")
+    engine = database.obter_conexao("SPSVSQL39_FINANCA")
+    sql_query_str = carregar_sql('sql/extracao_realizado_incremental.sql')
+
+    try:
+        df = pd.read_sql(sql_query_str, engine, params=(inicio_ano, fim_ano, inicio_ano, fim_ano, corte, int(lctref)))
+        _validar_colunas(df)
+        logger.info(f"Leitura incremental concluída ({len(df)} linhas).")
+        return aplicar_contrato_dtypes(df)
+    except AnaliseDespesaError:
+        raise
+    except Exception as e:
+        logger.error(f"Falha na leitura incremental do Realizado. Erro detalhado: {e}", exc_info=True)
+        raise AnaliseDespesaError("Falha ao ler dados do Realizado.") from e
+
+def buscar_dados_orcamento(id_periodo: str, atualizar_cache: bool = False) -> pd.DataFrame:
+    """Lê os dados de ORÇAMENTO, reaproveitando o cache local quando válido."""
+    sql_query_str = carregar_sql('sql/extracao_orcamento.sql')
+    return cache.obter_ou_executar(
+        sql_query_str, {"id_periodo": id_periodo}, "SPSVSQL39_HubDados",
+        lambda: _ler_dados_orcamento(sql_query_str, id_periodo), atualizar=atualizar_cache
+    )
+
+def _ler_dados_orcamento(sql_query_str: str, id_periodo: str) -> pd.DataFrame:
     logger.info("Iniciando extração de dados de ORÇAMENTO.")
 
     engine = database.obter_conexao("SPSVSQL39_HubDados")
-    sql_query_str = carregar_sql('sql/extracao_orcamento.sql')
     
     try:
         df = pd.read_sql(sql_query_str, engine, params=(id_periodo,))
@@ -80,3 +267,39 @@ def buscar_unidades_disponiveis() -> List[str]:
     except Exception as e:
         logger.error(f"Não foi possível buscar a lista de unidades. Verifique se o script 'extracao_realizado.sql' está correto e se o nome do objeto é válido. Erro: {e}")
         return []
+
+def carregar_bases_concorrentes(tarefas: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+    """
+    Executa cargas independentes (ex.: Realizado, Orçamento e catálogo de unidades) ao mesmo tempo,
+    uma thread por carga. O tempo total passa a ser o da carga mais lenta, e não a soma de todas.
+    Qualquer falha cancela as cargas pendentes e é propagada como AnaliseDespesaError.
+    """
+    logger.info(f"Iniciando carga concorrente de {len(tarefas)} bases: {list(tarefas)}")
+    inicio = time.perf_counter()
+    duracoes: Dict[str, float] = {}
+
+    def executar_cronometrado(nome: str, tarefa: Callable[[], Any]) -> Any:
+        inicio_tarefa = time.perf_counter()
+        resultado = tarefa()
+        duracoes[nome] = time.perf_counter() - inicio_tarefa
+        return resultado
+
+    resultados: Dict[str, Any] = {}
+    with ThreadPoolExecutor(max_workers=len(tarefas), thread_name_prefix="carga") as executor:
+        futuros = {executor.submit(executar_cronometrado, nome, tarefa): nome for nome, tarefa in tarefas.items()}
+        for futuro in as_completed(futuros):
+            nome = futuros[futuro]
+            try:
+                resultados[nome] = futuro.result()
+            except Exception as e:
+                for pendente in futuros:
+                    pendente.cancel()
+                logger.error(f"❌ Falha na carga concorrente da base '{nome}'. Erro: {e}")
+                if isinstance(e, AnaliseDespesaError):
+                    raise
+                raise AnaliseDespesaError(f"Falha na carga da base '{nome}'.") from e
+
+    total = time.perf_counter() - inicio
+    detalhes = ", ".join(f"{nome}: {duracao:.2f}s" for nome, duracao in duracoes.items())
+    logger.info(f"Carga concorrente concluída em {total:.2f}s (soma sequencial seria {sum(duracoes.values()):.2f}s) [{detalhes}].")
+    return resultados
@@ -1,23 +1,180 @@
 # analise_despesa/leitor_local.py
 # VERSÃO FINAL: Corrigido para usar a coluna 'UNIDADE'
+"""
+Leitura do CSV exportado com fatiamento por UNIDADE e período.
 
+O CSV é convertido uma única vez em um snapshot Arrow IPC (PARAMETROS_LEITOR_LOCAL["DIRETORIO_SNAPSHOTS"]),
+ordenado por UNIDADE e DATA. Junto ao snapshot são persistidos o índice de posições de cada unidade (nos metadados)
+e a coluna DATA ordenada em um arquivo binário ('.datas'). Cada fatia é uma busca binária nesse arquivo, mapeado em
+memória, seguida de um recorte contíguo (sem cópia) do snapshot: o custo não cresce com o tamanho do arquivo.
+Os snapshots abertos ficam em um cache LRU por arquivo, invalidado quando a data de modificação ou o tamanho do CSV mudam.
+"""
+import hashlib
+import json
 import logging
+import os
 import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
 import pandas as pd
-from typing import Optional, Dict, Any
+import pyarrow as pa
+
+from .config import PARAMETROS_LEITOR_LOCAL
 from .exceptions import AnaliseDespesaError
 
 logger = logging.getLogger(__name__)
 
-_FULL_DATA_CACHE: Optional[pd.DataFrame] = None
-_LAST_FILE_PATH: Optional[str] = None
+_VERSAO_SNAPSHOT = 2
+_CHAVE_METADADOS = b"leitor_local"
+# Posição da linha no CSV: devolve as fatias na ordem e com o índice da leitura direta do arquivo.
+_COLUNA_LINHA = "__linha_csv"
 
-def carregar_e_fatiar_dados(params: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+_SNAPSHOTS: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+def _assinatura(caminho: Path) -> List[int]:
+    info = caminho.stat()
+    return [info.st_mtime_ns, info.st_size]
+
+def _caminho_snapshot(caminho_csv: Path) -> Path:
+    chave = hashlib.sha256(str(caminho_csv).encode("utf-8")).hexdigest()[:16]
+    return Path(PARAMETROS_LEITOR_LOCAL["DIRETORIO_SNAPSHOTS"]) / f"{caminho_csv.stem}_{chave}.arrow"
+
+def _caminho_datas(caminho_snapshot: Path) -> Path:
+    return caminho_snapshot.with_suffix(".datas")
+
+def _ler_metadados(caminho: Path) -> Dict[str, Any]:
+    try:
+        with pa.OSFile(str(caminho), 'rb') as arquivo:
+            metadados = pa.ipc.open_file(arquivo).schema.metadata or {}
+        return json.loads(metadados.get(_CHAVE_METADADOS, b"{}"))
+    except (pa.ArrowInvalid, OSError, ValueError):
+        return {}
+
+def _normalizar_colunas_mistas(df: pd.DataFrame) -> pd.DataFrame:
+    """Colunas de texto com valores de tipos misturados são gravadas como texto (o Arrow exige um tipo por coluna)."""
+    for coluna in df.columns[df.dtypes == object]:
+        if pd.api.types.infer_dtype(df[coluna], skipna=True) not in ("string", "empty"):
+            logger.warning(f"⚠️  Coluna '{coluna}' com tipos misturados no CSV: será lida como texto no snapshot.")
+            df[coluna] = df[coluna].where(df[coluna].isna(), df[coluna].astype(str))
+    return df
+
+def _indice_de_unidades(df_ordenado: pd.DataFrame) -> Dict[str, List[int]]:
+    """Para cada unidade: [primeira linha, fim das linhas com DATA, fim] no snapshot ordenado (datas nulas ficam no fim)."""
+    unidades = df_ordenado['UNIDADE'].to_numpy()
+    com_unidade = pd.notna(unidades)
+    posicoes = np.flatnonzero(com_unidade)
+    if not len(posicoes):
+        return {}
+    valores = unidades[posicoes]
+    inicios = posicoes[np.r_[True, valores[1:] != valores[:-1]]]
+    fins = np.r_[inicios[1:], posicoes[-1] + 1]
+    datas_validas = np.r_[0, np.cumsum(df_ordenado['DATA'].notna().to_numpy())]
+    return {str(unidades[inicio]): [int(inicio), int(inicio + datas_validas[fim] - datas_validas[inicio]), int(fim)]
+            for inicio, fim in zip(inicios, fins)}
+
+def converter_para_snapshot(arquivo_csv: str) -> Path:
     """
-    Lê o CSV, armazena em cache e fatia em memória pela coluna 'UNIDADE'.
+    Converte o CSV em snapshot Arrow IPC, se ainda não houver um para a versão atual do arquivo.
+    Retorna o caminho do snapshot.
     """
-    global _FULL_DATA_CACHE, _LAST_FILE_PATH
+    caminho_csv = Path(arquivo_csv).resolve()
+    assinatura = _assinatura(caminho_csv)
+    caminho = _caminho_snapshot(caminho_csv)
+    metadados = _ler_metadados(caminho) if caminho.exists() else {}
+    if metadados.get("versao") == _VERSAO_SNAPSHOT and metadados.get("assinatura") == assinatura and _caminho_datas(caminho).exists():
+        return caminho
+
+    logger.info(f"Convertendo o arquivo '{arquivo_csv}' em snapshot colunar: {caminho.name}")
+    inicio_leitura = time.perf_counter()
+    df = pd.read_csv(caminho_csv, sep=';', encoding='utf-8-sig', parse_dates=['DATA'], low_memory=False)
+    if 'UNIDADE' not in df.columns:
+        raise AnaliseDespesaError(f"A coluna 'UNIDADE' não foi encontrada no CSV. Colunas disponíveis: {df.columns.tolist()}")
+    df[_COLUNA_LINHA] = np.arange(len(df), dtype=np.int64)
+    df = _normalizar_colunas_mistas(df.sort_values(['UNIDADE', 'DATA'], kind='stable', na_position='last'))
+
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    lotes = tabela.to_batches(max_chunksize=int(PARAMETROS_LEITOR_LOCAL["LINHAS_POR_LOTE"]))
+    metadados = {"versao": _VERSAO_SNAPSHOT, "assinatura": assinatura, "linhas": len(df), "indice": _indice_de_unidades(df)}
+    esquema = tabela.schema.with_metadata({**(tabela.schema.metadata or {}), _CHAVE_METADADOS: json.dumps(metadados).encode("utf-8")})
 
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    # A coluna DATA (ns desde 1970) é gravada antes do snapshot: um snapshot válido sempre tem o seu arquivo de datas.
+    caminho_datas_temporario = _caminho_datas(caminho).with_suffix(".datas_tmp")
+    df['DATA'].to_numpy(dtype='datetime64[ns]').view(np.int64).tofile(caminho_datas_temporario)
+    os.replace(caminho_datas_temporario, _caminho_datas(caminho))
+    caminho_temporario = caminho.with_suffix(".tmp")
+    with pa.OSFile(str(caminho_temporario), 'wb') as destino, pa.ipc.new_file(destino, esquema) as escritor:
+        for lote in lotes:
+            escritor.write_batch(lote)
+    os.replace(caminho_temporario, caminho)
+    logger.info(f"Snapshot gravado ({len(df)} linhas em {len(lotes)} lotes, {time.perf_counter() - inicio_leitura:.2f}s).")
+    return caminho
+
+def _fechar(entrada: Dict[str, Any]) -> None:
+    entrada["tabela"] = entrada["datas"] = None
+    entrada["arquivo"].close()
+
+def limpar_cache() -> None:
+    """Fecha e descarta todos os snapshots mapeados em memória."""
+    while _SNAPSHOTS:
+        _fechar(_SNAPSHOTS.popitem()[1])
+
+def _abrir_snapshot(arquivo_csv: str) -> Dict[str, Any]:
+    """Snapshot mapeado em memória do CSV, a partir do cache LRU ou (re)convertido se o arquivo mudou."""
+    chave = str(Path(arquivo_csv).resolve())
+    assinatura = _assinatura(Path(chave))
+    entrada = _SNAPSHOTS.get(chave)
+    if entrada is not None and entrada["assinatura"] == assinatura:
+        _SNAPSHOTS.move_to_end(chave)
+        logger.info("Usando snapshot em cache do arquivo CSV.")
+        return entrada
+    if entrada is not None:
+        logger.info(f"O arquivo '{arquivo_csv}' mudou desde a última leitura. Atualizando o snapshot.")
+        _fechar(_SNAPSHOTS.pop(chave))
+
+    caminho = converter_para_snapshot(chave)
+    arquivo = pa.memory_map(str(caminho), 'r')
+    leitor = pa.ipc.open_file(arquivo)
+    metadados = json.loads(leitor.schema.metadata[_CHAVE_METADADOS])
+    datas = np.memmap(_caminho_datas(caminho), dtype=np.int64, mode='r') if metadados["linhas"] else np.empty(0, dtype=np.int64)
+    entrada = {"assinatura": assinatura, "arquivo": arquivo, "tabela": leitor.read_all(), "datas": datas, "indice": metadados["indice"]}
+    _SNAPSHOTS[chave] = entrada
+    while len(_SNAPSHOTS) > max(1, int(PARAMETROS_LEITOR_LOCAL["ARQUIVOS_EM_CACHE"])):
+        _fechar(_SNAPSHOTS.popitem(last=False)[1])
+    logger.info(f"Snapshot do arquivo CSV mapeado em memória ({metadados['linhas']} linhas).")
+    return entrada
+
+def _para_pandas(tabela: pa.Table) -> pd.DataFrame:
+    """Converte a fatia para pandas como a leitura direta do CSV: ordem e índice originais e NaN nos textos vazios."""
+    df = tabela.to_pandas()
+    df = df.sort_values(_COLUNA_LINHA, kind='stable')
+    df.index = pd.Index(df.pop(_COLUNA_LINHA).to_numpy())
+    for coluna in df.columns[df.dtypes == object]:
+        df[coluna] = df[coluna].where(df[coluna].notna(), np.nan)
+    return df
+
+def _faixa_de_linhas(entrada: Dict[str, Any], unidade: str, data_inicio: pd.Timestamp, data_fim: pd.Timestamp) -> Tuple[int, int]:
+    """Linhas [início, fim) da unidade no período: busca binária nas datas (ordenadas) da faixa da unidade."""
+    faixa = entrada["indice"].get(unidade) if isinstance(unidade, str) else None
+    if faixa is None:
+        return 0, 0
+    inicio, fim_datas, _ = faixa
+    datas = entrada["datas"][inicio:fim_datas]
+    primeira = inicio + int(np.searchsorted(datas, data_inicio.value, side='left'))
+    ultima = inicio + int(np.searchsorted(datas, data_fim.value, side='right'))
+    return primeira, max(primeira, ultima)
+
+def _fatiar(entrada: Dict[str, Any], unidade: str, data_inicio: pd.Timestamp, data_fim: pd.Timestamp) -> pd.DataFrame:
+    primeira, ultima = _faixa_de_linhas(entrada, unidade, data_inicio, data_fim)
+    return _para_pandas(entrada["tabela"].slice(primeira, ultima - primeira))
+
+def carregar_e_fatiar_dados(params: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """
+    Lê o CSV (via snapshot colunar em cache) e fatia pela coluna 'UNIDADE' e pelo período de 'DATA'.
+    """
     if not params: raise ValueError("Parâmetros são obrigatórios.")
 
     try:
@@ -29,32 +186,8 @@ def carregar_e_fatiar_dados(params: Optional[Dict[str, Any]] = None) -> pd.DataF
         raise ValueError(f"Parâmetro obrigatório não encontrado: {e}")
 
     try:
-        if _FULL_DATA_CACHE is None or _LAST_FILE_PATH != arquivo_csv:
-            logger.info(f"Carregando base de dados completa do arquivo: '{arquivo_csv}'")
-            inicio_leitura = time.perf_counter()
-            
-            _FULL_DATA_CACHE = pd.read_csv(
-                arquivo_csv, sep=';', encoding='utf-8-sig',
-                parse_dates=['DATA'], low_memory=False
-            )
-            
-            _LAST_FILE_PATH = arquivo_csv
-            fim_leitura = time.perf_counter()
-            logger.info(f"Arquivo CSV carregado e em cache. ({len(_FULL_DATA_CACHE)} linhas em {fim_leitura - inicio_leitura:.2f}s)")
-        else:
-            logger.info("Usando dados em cache do arquivo CSV.")
-
-        # --- PONTO CRÍTICO DA CORREÇÃO ---
-        coluna_unidade = 'UNIDADE' 
-
-        if coluna_unidade not in _FULL_DATA_CACHE.columns:
-            raise AnaliseDespesaError(f"A coluna '{coluna_unidade}' não foi encontrada no CSV. Colunas disponíveis: {_FULL_DATA_CACHE.columns.tolist()}")
-
-        df_unidade = _FULL_DATA_CACHE[
-            (_FULL_DATA_CACHE[coluna_unidade] == unidade_gestora) &
-            (_FULL_DATA_CACHE['DATA'] >= data_inicio) &
-            (_FULL_DATA_CACHE['DATA'] <= data_fim)
-        ].copy()
+        entrada = _abrir_snapshot(arquivo_csv)
+        df_unidade = _fatiar(entrada, unidade_gestora, data_inicio, data_fim)
 
         logger.info(f"Fatiamento concluído. {len(df_unidade)} linhas encontradas para a unidade '{unidade_gestora}'.")
         return df_unidade
@@ -62,7 +195,8 @@ def carregar_e_fatiar_dados(params: Optional[Dict[str, Any]] = None) -> pd.DataF
     except FileNotFoundError:
         logger.error(f"ERRO CRÍTICO: Arquivo '{arquivo_csv}' não foi encontrado.")
         raise
+    except AnaliseDespesaError:
+        raise
     except Exception as e:
         logger.error(f"Falha crítica ao processar o arquivo CSV local. Erro: {e}", exc_info=True)
         raise AnaliseDespesaError("Falha ao ler ou fatiar o arquivo CSV.") from e
-    
\ No newline at end of file
@@ -1,5 +1,7 @@
 import pandas as pd
+import numpy as np
 import logging
+from typing import Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -16,3 +18,57 @@ def adicionar_colunas_de_data(df: pd.DataFrame) -> pd.DataFrame:
     
     logger.info("Colunas de data adicionadas.")
     return df_enriquecido
+
+def normalizar_unidade(df: pd.DataFrame, coluna: str = 'UNIDADE') -> pd.DataFrame:
+    """Remove espaços nas bordas da coluna de unidade uma única vez (em colunas categóricas, só nas categorias)."""
+    if coluna not in df.columns:
+        return df
+    if isinstance(df[coluna].dtype, pd.CategoricalDtype):
+        categorias = df[coluna].cat.categories
+        categorias_normalizadas = categorias.str.strip()
+        if categorias_normalizadas.is_unique:
+            df[coluna] = df[coluna].cat.rename_categories(categorias_normalizadas)
+        else:
+            df[coluna] = df[coluna].astype(str).str.strip().astype('category')
+    else:
+        df[coluna] = df[coluna].str.strip()
+    return df
+
+def construir_indice_por_unidade(df: pd.DataFrame, coluna: str = 'UNIDADE') -> Dict[str, np.ndarray]:
+    """
+    Constrói, em uma única passada, o mapa unidade -> posições das suas linhas no DataFrame.
+    Espera a coluna já normalizada (ver normalizar_unidade).
+    """
+    logger.info(f"Construindo índice de partição por '{coluna}'...")
+    indice = df.groupby(coluna, observed=True, sort=False).indices
+    logger.info(f"Índice construído com {len(indice)} unidades.")
+    return indice
+
+def fatiar_por_unidade(df: pd.DataFrame, indice: Dict[str, np.ndarray], unidade: str) -> pd.DataFrame:
+    """Retorna as linhas da unidade usando o índice de partição (custo proporcional às linhas da unidade)."""
+    return df.take(indice.get(unidade, np.empty(0, dtype=np.intp)))
+
+COLUNAS_CATEGORICAS = ['UNIDADE', 'PROJETO', 'FORNECEDOR', 'CC', 'CODCCUSTO_JUNCAO', 'DESC_NIVEL_4', 'tipo_projeto']
+
+def compactar_colunas_categoricas(df: pd.DataFrame, colunas: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Converte as colunas de texto repetitivas para 'category', com categorias ordenadas (estáveis entre execuções).
+    Os groupbys seguintes passam a operar sobre os códigos das categorias em vez de re-hashear strings.
+    """
+    colunas = [col for col in (colunas or COLUNAS_CATEGORICAS) if col in df.columns]
+    logger.info(f"Compactando colunas categóricas: {colunas}")
+    memoria_antes = df.memory_usage(deep=True).sum()
+
+    df_compacto = df.copy()
+    for coluna in colunas:
+        serie = df_compacto[coluna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            categorias = sorted(serie.cat.remove_unused_categories().cat.categories)
+            df_compacto[coluna] = serie.cat.set_categories(categorias)
+        else:
+            df_compacto[coluna] = serie.astype(pd.CategoricalDtype(sorted(serie.dropna().unique())))
+
+    memoria_depois = df_compacto.memory_usage(deep=True).sum()
+    reducao = memoria_antes / memoria_depois if memoria_depois else 0
+    logger.info(f"Compactação concluída: {memoria_antes / 1024 ** 2:.1f} MB -> {memoria_depois / 1024 ** 2:.1f} MB ({reducao:.1f}x menor).")
+    return df_compacto
@@ -1,31 +1,103 @@
 # analise_despesa/query_executor.py
 # VERSÃO CORRIGIDA FINAL: Usa text() para traduzir os parâmetros.
 
+import asyncio
 import logging
-from typing import Union, Optional, Dict, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, Optional, Dict, Any, AsyncIterator
 import pandas as pd
-from sqlalchemy.engine import Engine
-from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy import event, text
+from . import cache, database
+from .config import PARAMETROS_CONSULTAS
 from .exceptions import AnaliseDespesaError
+from .queries import Consulta
 
 logger = logging.getLogger(__name__)
 
+class ControleExecucao:
+    """Permite interromper, a partir de outra thread, a consulta SQL em andamento de um CriadorDataFrame."""
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._conexao_dbapi = None
+        self._cursor = None
+        self.cancelada = False
+        self.inicio: Optional[float] = None
+
+    def vincular(self, conexao: Connection) -> None:
+        """Associa a conexão que vai executar a consulta (e, pelo evento de execução, o cursor)."""
+        with self._trava:
+            if self.cancelada:
+                raise AnaliseDespesaError("Consulta cancelada antes do início.")
+            self._conexao_dbapi = conexao.connection.dbapi_connection
+        event.listen(conexao, "before_cursor_execute", self._registrar_cursor)
+
+    def _registrar_cursor(self, conn, cursor, statement, parameters, context, executemany):
+        with self._trava:
+            if self.cancelada:
+                raise AnaliseDespesaError("Consulta cancelada antes da execução.")
+            self._cursor = cursor
+
+    def desvincular(self) -> None:
+        """Chamado ao fim da consulta: a conexão volta ao pool e não pode mais ser interrompida por este controle."""
+        with self._trava:
+            self._conexao_dbapi = self._cursor = None
+
+    def cancelar(self) -> None:
+        """Marca a consulta como cancelada e interrompe a execução no banco (cancel() do pyodbc, interrupt() do SQLite)."""
+        with self._trava:
+            self.cancelada = True
+            if self._cursor is not None and hasattr(self._cursor, "cancel"):
+                self._cursor.cancel()
+            elif self._conexao_dbapi is not None and hasattr(self._conexao_dbapi, "interrupt"):
+                self._conexao_dbapi.interrupt()
+
 class CriadorDataFrame:
     """Executa uma consulta e retorna um DataFrame do pandas."""
 
-    def __init__(self, conexao_obj: Union[Engine, str], consulta_sql: str, tipo: str, params: Optional[Dict[str, Any]] = None):
+    def __init__(self, conexao_obj: Union[Engine, str], consulta_sql: str, tipo: str, params: Optional[Dict[str, Any]] = None,
+                 nome_conexao: Optional[str] = None, usar_cache: bool = False, atualizar_cache: bool = False,
+                 controle: Optional[ControleExecucao] = None):
         self.conexao_obj = conexao_obj
         self.consulta_sql = consulta_sql
         self.tipo = tipo
         self.params = params
+        self.nome_conexao = nome_conexao
+        self.usar_cache = usar_cache
+        self.atualizar_cache = atualizar_cache
+        self.controle = controle
+
+    def _identificar_conexao(self) -> str:
+        """Nome usado na chave do cache: o nome da conexão, ou a URL do engine (sem senha)."""
+        if self.nome_conexao:
+            return self.nome_conexao
+        if isinstance(self.conexao_obj, Engine):
+            return self.conexao_obj.url.render_as_string(hide_password=True)
+        return str(self.conexao_obj)
 
     def executar(self) -> pd.DataFrame:
-        """Executa a consulta e retorna o resultado."""
+        """Executa a consulta e retorna o resultado, passando pelo cache local quando habilitado."""
+        if self.usar_cache:
+            return cache.obter_ou_executar(self.consulta_sql, self.params, self._identificar_conexao(),
+                                           self._executar_no_banco, atualizar=self.atualizar_cache)
+        return self._executar_no_banco()
+
+    def _executar_no_banco(self) -> pd.DataFrame:
         logger.info(f"Executando consulta do tipo '{self.tipo}' com parâmetros: {self.params}")
         try:
             if self.tipo in ("sql", "azure_sql"):
                 # CORREÇÃO FINAL: Usa pd.read_sql_query com text() e params.
-                return pd.read_sql_query(text(self.consulta_sql), self.conexao_obj, params=self.params)
+                if self.controle is None:
+                    return pd.read_sql_query(text(self.consulta_sql), self.conexao_obj, params=self.params)
+                with self.conexao_obj.connect() as conexao:
+                    self.controle.vincular(conexao)
+                    try:
+                        return pd.read_sql_query(text(self.consulta_sql), conexao, params=self.params)
+                    finally:
+                        self.controle.desvincular()
 
             elif self.tipo == "mdx":
                 from pyadomd import Pyadomd
@@ -36,3 +108,110 @@ class CriadorDataFrame:
 
         except Exception as e:
             raise AnaliseDespesaError(f"Erro ao executar a consulta: {e}") from e
+
+class ExecutorAssincrono:
+    """
+    Executa Consultas ao mesmo tempo a partir de código asyncio, entregando os resultados à medida que terminam.
+    Cada conexão tem o seu pool de threads (PARAMETROS_CONSULTAS["WORKERS_POR_CONEXAO"], ou o tamanho do pool de
+    conexões do engine), de modo que uma conexão lenta não ocupa as threads das outras.
+    Consultas SQL que excedem o timeout ou cuja tarefa é cancelada são interrompidas no banco; consultas MDX
+    apenas deixam de ser aguardadas.
+    """
+
+    def __init__(self, timeout_s: Optional[float] = None, workers_por_conexao: Optional[int] = None,
+                 usar_cache: bool = False, atualizar_cache: bool = False):
+        self.timeout_s = float(timeout_s if timeout_s is not None else PARAMETROS_CONSULTAS["TIMEOUT_S"])
+        self.workers_por_conexao = workers_por_conexao
+        self.usar_cache = usar_cache
+        self.atualizar_cache = atualizar_cache
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+
+    async def __aenter__(self) -> "ExecutorAssincrono":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.encerrar()
+
+    def encerrar(self) -> None:
+        """Libera os pools de threads (consultas ainda na fila são descartadas)."""
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._pools.clear()
+
+    def _pool_da_conexao(self, nome_conexao: str) -> ThreadPoolExecutor:
+        if nome_conexao not in self._pools:
+            workers = (self.workers_por_conexao or PARAMETROS_CONSULTAS["WORKERS_POR_CONEXAO"]
+                       or database.obter_parametros_pool(nome_conexao)["TAMANHO"])
+            self._pools[nome_conexao] = ThreadPoolExecutor(max_workers=int(workers), thread_name_prefix=f"consulta_{nome_conexao}")
+        return self._pools[nome_conexao]
+
+    def _executar_bloqueante(self, consulta: Consulta, params: Optional[Dict[str, Any]], controle: ControleExecucao) -> pd.DataFrame:
+        controle.inicio = time.perf_counter()
+        criador = CriadorDataFrame(database.obter_conexao(consulta.conexao), consulta.sql, consulta.tipo, params,
+                                   nome_conexao=consulta.conexao, usar_cache=self.usar_cache,
+                                   atualizar_cache=self.atualizar_cache, controle=controle)
+        return criador.executar()
+
+    async def executar(self, nome: str, consulta: Consulta, params: Optional[Dict[str, Any]] = None,
+                       timeout_s: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Executa uma consulta sem bloquear o loop de eventos. O timeout conta a partir do início da execução
+        (a espera por uma thread livre da conexão não conta).
+        Retorna {"nome", "status" ('ok', 'erro' ou 'timeout'), "df", "duracao_s", "erro"}; falhas não geram exceção.
+        """
+        timeout_s = self.timeout_s if timeout_s is None else float(timeout_s)
+        controle = ControleExecucao()
+        futuro = asyncio.get_running_loop().run_in_executor(self._pool_da_conexao(consulta.conexao),
+                                                            self._executar_bloqueante, consulta, params, controle)
+
+        def resultado(status: str, df: Optional[pd.DataFrame] = None, erro: str = "") -> Dict[str, Any]:
+            duracao = time.perf_counter() - controle.inicio if controle.inicio is not None else 0.0
+            return {"nome": nome, "status": status, "df": df, "duracao_s": duracao, "erro": erro}
+
+        try:
+            while not futuro.done():
+                restante = timeout_s if controle.inicio is None else controle.inicio + timeout_s - time.perf_counter()
+                if restante <= 0:
+                    controle.cancelar()
+                    futuro.cancel()
+                    logger.warning(f"⚠️  Consulta '{nome}' interrompida: tempo limite de {timeout_s:.1f}s excedido.")
+                    return resultado("timeout", erro=f"Tempo limite de {timeout_s:.1f}s excedido.")
+                await asyncio.wait({futuro}, timeout=restante)
+            df = futuro.result()
+        except asyncio.CancelledError:
+            controle.cancelar()
+            futuro.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"❌ Consulta '{nome}' falhou. Erro: {e}")
+            return resultado("erro", erro=str(e))
+        return resultado("ok", df)
+
+    async def executar_em_lote(self, consultas: Dict[str, Consulta], params: Optional[Dict[str, Dict[str, Any]]] = None,
+                               timeout_s: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Dispara todas as consultas ao mesmo tempo e entrega cada resultado (ver executar) assim que termina.
+        Se o consumidor interromper a iteração ou a tarefa for cancelada, as consultas pendentes são canceladas.
+        """
+        params = params or {}
+        logger.info(f"Iniciando lote assíncrono de {len(consultas)} consultas: {list(consultas)}")
+        inicio = time.perf_counter()
+        tarefas = [asyncio.create_task(self.executar(nome, consulta, params.get(nome), timeout_s)) for nome, consulta in consultas.items()]
+        soma_sequencial = 0.0
+        try:
+            for proxima in asyncio.as_completed(tarefas):
+                resultado = await proxima
+                soma_sequencial += resultado["duracao_s"]
+                yield resultado
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+        logger.info(f"Lote assíncrono concluído em {time.perf_counter() - inicio:.2f}s (soma sequencial seria {soma_sequencial:.2f}s).")
+
+def executar_consultas_em_paralelo(consultas: Dict[str, Consulta], params: Optional[Dict[str, Dict[str, Any]]] = None,
+                                   timeout_s: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+    """Atalho síncrono (scripts e diagnósticos): executa o lote com ExecutorAssincrono e retorna os resultados por nome."""
+    async def coletar() -> Dict[str, Dict[str, Any]]:
+        async with ExecutorAssincrono(timeout_s=timeout_s) as executor:
+            return {resultado["nome"]: resultado async for resultado in executor.executar_em_lote(consultas, params)}
+    return asyncio.run(coletar())
@@ -0,0 +1,136 @@
+# analise_despesa/sincronizacao.py
+"""
+Sincronização incremental do Realizado em uma base local particionada por ano/mês.
+
+A base fica em PARAMETROS_SINCRONIZACAO["DIRETORIO"], no formato 'ano=AAAA/mes=MM/dados.parquet',
+com uma marca d'água (maior DATA e maior LCTREF já sincronizados) por ano. Cada execução extrai
+os lançamentos a partir da DATA da marca d'água, recuando DIAS_RETROATIVOS para capturar lançamentos
+tardios, e também os LCTREF acima da marca (lançamentos novos com data retroativa, de qualquer mês do ano).
+Um LCTREF reextraído vem com todas as suas linhas do ano e substitui as anteriores (rateios e partidas incluídos).
+"""
+import datetime
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from .config import PARAMETROS_SINCRONIZACAO
+from .exceptions import AnaliseDespesaError
+from .extracao import buscar_dados_realizado_incremental, buscar_dados_realizado_intervalo, concatenar_lotes
+
+logger = logging.getLogger(__name__)
+
+def _diretorio_ano(ano: int) -> Path:
+    return Path(PARAMETROS_SINCRONIZACAO["DIRETORIO"]) / f"ano={ano}"
+
+def _caminho_particao(ano: int, mes: int) -> Path:
+    return _diretorio_ano(ano) / f"mes={mes:02d}" / "dados.parquet"
+
+def _caminho_marca_dagua(ano: int) -> Path:
+    return _diretorio_ano(ano) / "_marca_dagua.json"
+
+def ler_marca_dagua(ano: int) -> Optional[Dict[str, Any]]:
+    """Retorna a marca d'água do ano ({'data', 'lctref', 'sincronizado_em'}) ou None se o ano nunca foi sincronizado."""
+    caminho = _caminho_marca_dagua(ano)
+    if not caminho.exists():
+        return None
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _gravar_marca_dagua(ano: int, marca: Dict[str, Any]) -> None:
+    caminho = _caminho_marca_dagua(ano)
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(marca, f, ensure_ascii=False, indent=2)
+
+def _ler_particao(caminho: Path) -> Optional[pd.DataFrame]:
+    return pd.read_parquet(caminho) if caminho.exists() else None
+
+def _gravar_particao(caminho: Path, df: pd.DataFrame) -> None:
+    """Grava a partição de forma atômica; uma partição vazia é removida."""
+    if df.empty:
+        caminho.unlink(missing_ok=True)
+        return
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    caminho_temporario = caminho.with_suffix(".tmp")
+    df.to_parquet(caminho_temporario, index=False)
+    os.replace(caminho_temporario, caminho)
+
+def _nova_marca_dagua(df_novos: pd.DataFrame, marca_anterior: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    datas = [pd.Timestamp(marca_anterior["data"])] if marca_anterior else []
+    lctrefs = [int(marca_anterior["lctref"])] if marca_anterior else []
+    if not df_novos.empty:
+        datas.append(df_novos['DATA'].max())
+        lctrefs.append(int(df_novos['LCTREF'].max()))
+    if not datas:
+        return None
+    return {"data": max(datas).isoformat(), "lctref": max(lctrefs), "sincronizado_em": datetime.datetime.now().isoformat(timespec='seconds')}
+
+def sincronizar_realizado(ano: int, dias_retroativos: Optional[int] = None, recarga_completa: bool = False) -> Dict[str, Any]:
+    """
+    Atualiza a base local do ano com os lançamentos novos ou alterados desde a última sincronização.
+    Com 'recarga_completa', ignora a marca d'água e reextrai o ano inteiro.
+    Retorna um resumo com o corte usado, as linhas extraídas e as partições regravadas.
+    """
+    dias_retroativos = dias_retroativos if dias_retroativos is not None else PARAMETROS_SINCRONIZACAO["DIAS_RETROATIVOS"]
+    inicio_ano = pd.Timestamp(year=ano, month=1, day=1)
+    fim_ano = pd.Timestamp(year=ano + 1, month=1, day=1)
+
+    marca_anterior = None if recarga_completa else ler_marca_dagua(ano)
+    if marca_anterior is None:
+        corte = inicio_ano
+        logger.info(f"Sincronização do Realizado {ano}: carga completa do ano.")
+    else:
+        corte = max(inicio_ano, pd.Timestamp(marca_anterior["data"]).normalize() - pd.Timedelta(days=dias_retroativos))
+        logger.info(f"Sincronização do Realizado {ano}: marca d'água em {marca_anterior['data']} (LCTREF {marca_anterior['lctref']}). Reextraindo a partir de {corte:%d/%m/%Y}.")
+
+    if marca_anterior is None:
+        df_novos = buscar_dados_realizado_intervalo(corte.to_pydatetime(), fim_ano.to_pydatetime())
+    else:
+        df_novos = buscar_dados_realizado_incremental(inicio_ano.to_pydatetime(), fim_ano.to_pydatetime(),
+                                                      corte.to_pydatetime(), int(marca_anterior["lctref"]))
+    if 'LCTREF' not in df_novos.columns:
+        raise AnaliseDespesaError("A sincronização incremental exige a coluna 'LCTREF' no resultado da view.")
+
+    lctrefs_novos = df_novos['LCTREF'].unique()
+    meses_novos = df_novos['DATA'].dt.month
+    particoes_regravadas = 0
+
+    for mes in range(1, 13):
+        caminho = _caminho_particao(ano, mes)
+        df_existente = _ler_particao(caminho)
+        df_novos_mes = df_novos[meses_novos == mes]
+        if df_existente is None and df_novos_mes.empty:
+            continue
+
+        if df_existente is not None:
+            # Linhas dentro da janela reextraída, ou de LCTREFs que voltaram do banco, são substituídas.
+            obsoletas = (df_existente['DATA'] >= corte) | df_existente['LCTREF'].isin(lctrefs_novos)
+            if not obsoletas.any() and df_novos_mes.empty:
+                continue
+            df_existente = df_existente[~obsoletas]
+
+        partes = [parte.copy() for parte in (df_existente, df_novos_mes) if parte is not None and not parte.empty]
+        _gravar_particao(caminho, concatenar_lotes(partes) if partes else pd.DataFrame())
+        particoes_regravadas += 1
+
+    marca = _nova_marca_dagua(df_novos, marca_anterior)
+    if marca is not None:
+        _gravar_marca_dagua(ano, marca)
+
+    resumo = {"ano": ano, "corte": corte, "linhas_extraidas": len(df_novos), "particoes_regravadas": particoes_regravadas, "marca_dagua": marca}
+    logger.info(f"✅ Sincronização do Realizado {ano} concluída: {len(df_novos)} linhas extraídas, {particoes_regravadas} partições regravadas.")
+    return resumo
+
+def carregar_realizado_local(ano: int) -> pd.DataFrame:
+    """Lê todas as partições mensais do ano da base local e devolve um único DataFrame."""
+    particoes = [pd.read_parquet(caminho) for caminho in sorted(_diretorio_ano(ano).glob("mes=*/dados.parquet"))]
+    if not particoes:
+        logger.warning(f"⚠️  Nenhuma partição local encontrada para o ano {ano}. Execute a sincronização primeiro.")
+        return pd.DataFrame()
+    df = concatenar_lotes(particoes)
+    logger.info(f"Base local do Realizado {ano} carregada ({len(df)} linhas em {len(particoes)} partições).")
+    return df
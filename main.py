@@ -5,12 +5,19 @@ import datetime
 import pandas as pd
 import sys
 import re
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
 from analise_despesa.logging_config import setup_logging
-from analise_despesa.extracao import buscar_dados_realizado, buscar_dados_orcamento, buscar_unidades_disponiveis
-from analise_despesa.analise import agregacao, insights_ia
-from analise_despesa.comunicacao import email
-from analise_despesa.config import PARAMETROS_ANALISE, MAPA_GESTORES, PROJETOS_FOLHA_PAGAMENTO, OUTPUT_DIR
+from analise_despesa.extracao import buscar_dados_realizado, buscar_dados_orcamento, buscar_unidades_disponiveis, carregar_bases_concorrentes
+from analise_despesa.analise import agregacao, contexto_incremental, insights_ia, previsao, registro_modelos
+from analise_despesa.analise.exportacao import exportar_anexo, exportar_dataframe_para_csv
+from analise_despesa.analise.features import RepositorioFeatures, aplicar_retencao as aplicar_retencao_features, construir_repositorio_features
+from analise_despesa.comunicacao import email, entrega
+from analise_despesa.config import PARAMETROS_ANALISE, PARAMETROS_ANEXO, PARAMETROS_ENTREGA, PARAMETROS_EXECUCOES, MAPA_GESTORES, PROJETOS_FOLHA_PAGAMENTO, OUTPUT_DIR
 from analise_despesa.processamento import enriquecimento
+from analise_despesa import database, sincronizacao
 import os
 
 setup_logging()
@@ -68,7 +75,228 @@ def slugify(text):
     text = text.replace('ó', 'o').replace('ô', 'o').replace('õ', 'o').replace('ú', 'u')
     return re.sub(r'[^\w-]', '', text)
 
-def executar_analise_distribuida():
+def carregar_realizado(ano: int, atualizar_cache: bool = False) -> pd.DataFrame:
+    """Carrega o Realizado do ano conforme o modo de extração configurado."""
+    if PARAMETROS_ANALISE["MODO_EXTRACAO_REALIZADO"] == "incremental":
+        sincronizacao.sincronizar_realizado(ano, recarga_completa=atualizar_cache)
+        return sincronizacao.carregar_realizado_local(ano)
+    return buscar_dados_realizado(ano=ano, modo_streaming=bool(PARAMETROS_ANALISE["EXTRACAO_EM_LOTES"]), atualizar_cache=atualizar_cache, max_workers=int(PARAMETROS_ANALISE["WORKERS_EXTRACAO"]))
+
+def processar_unidade(unidade: str, email_gestor_final: str, df_unidade_bruto: pd.DataFrame, df_unidade_integrado: pd.DataFrame, ano: int, agregados: Optional[Dict[str, Any]] = None, features: Optional[RepositorioFeatures] = None,
+                      df_ocorrencias_atipicas_ano: Optional[pd.DataFrame] = None, enviar_email: bool = True) -> Dict[str, Any]:
+    """
+    Gera e envia o relatório de uma unidade. Executável em um processo separado.
+    'agregados' traz o resumo, fornecedores e tabela mensal já calculados em lote (agregar_unidades_em_lote);
+    sem ele, as agregações são calculadas aqui. 'features' é o recorte da unidade no repositório de features
+    dos modelos de IA e 'df_ocorrencias_atipicas_ano', as ocorrências de contexto já detectadas em lote. Falhas ficam isoladas na unidade e são devolvidas no status.
+    Sem 'enviar_email', o e-mail montado é devolvido em 'mensagem' para a fila de entrega do processo principal.
+    """
+    logger.info(f"================== PROCESSANDO UNIDADE: {unidade} ==================")
+    inicio = time.perf_counter()
+    try:
+        cod_unidade_analisada = "N/A"
+        if not df_unidade_bruto.empty:
+            cod_unidade_analisada = df_unidade_bruto['CC'].str[-3:].iloc[0]
+        if agregados is None:
+            mes_referencia_num = df_unidade_bruto['MES'].max()
+            resumo = agregacao.gerar_resumo_executivo(df_unidade_bruto, df_unidade_integrado, mes_referencia_num)
+        else:
+            mes_referencia_num, resumo = agregados['mes_referencia_num'], dict(agregados['resumo'])
+        resumo['numero_unidade'] = cod_unidade_analisada
+        
+        # --- CORREÇÃO: ANÁLISE DE CLUSTER MOVIDA PARA DENTRO DO LOOP ---
+        df_unidade_exclusivos = df_unidade_bruto[df_unidade_bruto['tipo_projeto'] == 'Exclusivo'].copy()
+        df_clusters, resumo_clusters = {}, {}
+        if not df_unidade_exclusivos.empty:
+            df_clusters, resumo_clusters = insights_ia.segmentar_contas_por_comportamento(df_unidade_exclusivos, features=features, unidade=unidade)
+
+        df_integrado_exclusivo = df_unidade_integrado[df_unidade_integrado['tipo_projeto'] == 'Exclusivo']
+        df_integrado_compartilhado = df_unidade_integrado[df_unidade_integrado['tipo_projeto'] == 'Compartilhado']
+        
+        if df_ocorrencias_atipicas_ano is None:
+            df_ocorrencias_atipicas_ano = insights_ia.detectar_anomalias_de_contexto(df_unidade_exclusivos, features=features)
+        df_orcamento_exclusivo = agregacao.agregar_realizado_vs_orcado_por_projeto(df_integrado_exclusivo, df_ocorrencias_atipicas_ano)
+        df_orcamento_compartilhado = agregacao.agregar_realizado_vs_orcado_por_projeto(df_integrado_compartilhado, df_ocorrencias_atipicas_ano)
+        if agregados is None:
+            df_fornecedores_exclusivo = agregacao.agregar_despesas_por_fornecedor(df_unidade_exclusivos, top_n=5)
+            df_fornecedores_compartilhado = agregacao.agregar_despesas_por_fornecedor(df_unidade_bruto[df_unidade_bruto['tipo_projeto'] == 'Compartilhado'], top_n=5)
+            df_mes_agregado = agregacao.agregar_despesas_por_mes(df_unidade_bruto)
+        else:
+            df_fornecedores_exclusivo, df_fornecedores_compartilhado = agregados['fornecedores']['Exclusivo'], agregados['fornecedores']['Compartilhado']
+            df_mes_agregado = agregados['mes_agregado']
+        
+        meses_map = {1:'Jan', 2:'Fev', 3:'Mar', 4:'Abr', 5:'Mai', 6:'Jun', 7:'Jul', 8:'Ago', 9:'Set', 10:'Out', 11:'Nov', 12:'Dez'}
+        resumo['mes_referencia'] = meses_map.get(mes_referencia_num, "N/A")
+        df_ocorrencias_filtradas = df_ocorrencias_atipicas_ano[df_ocorrencias_atipicas_ano['DATA'].dt.month == mes_referencia_num].copy()
+        df_ocorrencias_investigadas = insights_ia.investigar_causa_raiz_ocorrencia(df_ocorrencias_filtradas, df_unidade_bruto, features=features, unidade=unidade)
+        if not df_ocorrencias_investigadas.empty:
+            df_ocorrencias_investigadas.rename(columns={'VALOR': 'Realizado'}, inplace=True)
+
+        corpo_html = email.gerar_corpo_email_analise(unidade_gestora=unidade, data_relatorio=datetime.date.today().strftime('%d/%m/%Y'), resumo=resumo, df_orcamento_exclusivo=df_orcamento_exclusivo, df_orcamento_compartilhado=df_orcamento_compartilhado, df_fornecedores_exclusivo=df_fornecedores_exclusivo, df_fornecedores_compartilhado=df_fornecedores_compartilhado, df_mes_agregado=df_mes_agregado, df_ocorrencias_atipicas=df_ocorrencias_investigadas, df_clusters_folha=df_clusters, resumo_clusters_folha=resumo_clusters)
+        
+        unidade_para_assunto = unidade.replace("SP - ", "")
+        assunto = f"Análise de Despesas - {unidade_para_assunto} - Ref {resumo['mes_referencia']}/{ano}"
+        unidade_para_arquivo = slugify(unidade_para_assunto)
+        nome_arquivo_csv = f"despesa_{ano}{resumo['mes_referencia']}_{unidade_para_arquivo}.csv"
+        
+        logger.info(f"Gerando arquivo de despesas para anexo ({PARAMETROS_ANEXO['FORMATO']}) a partir de: {OUTPUT_DIR / nome_arquivo_csv}")
+        caminho_anexo = exportar_anexo(df_unidade_bruto, OUTPUT_DIR / nome_arquivo_csv)["caminho"]
+        
+        if not enviar_email:
+            logger.info(f"✅ Análise da unidade '{unidade}' concluída. E-mail para '{email_gestor_final}' encaminhado à fila de entrega.")
+            mensagem = {"assunto": assunto, "corpo_html": corpo_html, "destinatario": email_gestor_final, "caminho_anexo": str(caminho_anexo)}
+            return {"unidade": unidade, "status": "concluida", "duracao_s": time.perf_counter() - inicio, "erro": "", "mensagem": mensagem}
+        email.enviar_email_via_smtp(assunto, corpo_html, email_gestor_final, caminho_anexo=str(caminho_anexo))
+        logger.info(f"✅ Análise da unidade '{unidade}' concluída e e-mail enviado com anexo para '{email_gestor_final}'.")
+        return {"unidade": unidade, "status": "concluida", "duracao_s": time.perf_counter() - inicio, "erro": ""}
+    except Exception as e:
+        logger.critical(f"❌ Erro no processamento da unidade '{unidade}': {e}", exc_info=True)
+        return {"unidade": unidade, "status": "erro", "duracao_s": time.perf_counter() - inicio, "erro": str(e)}
+
+def _recortar_features(repositorio_features: Optional[RepositorioFeatures], unidade: str) -> Optional[RepositorioFeatures]:
+    """Recorte da unidade no repositório de features; sem repositório (ou se o recorte falhar), a unidade calcula as suas."""
+    if repositorio_features is None:
+        return None
+    try:
+        return repositorio_features.recortar(unidade)
+    except Exception as e:
+        logger.error(f"❌ Falha ao recortar as features da unidade '{unidade}'; serão recalculadas. Erro: {e}", exc_info=True)
+        return None
+
+def executar_unidades(mapa_execucao: Dict[str, str], df_analise_principal: pd.DataFrame, df_integrado: pd.DataFrame, ano: int) -> List[Dict[str, Any]]:
+    """
+    Distribui as unidades entre processos (PARAMETROS_ANALISE['WORKERS_UNIDADES']).
+    Com 1 worker, as unidades são processadas em sequência no próprio processo.
+    Com PARAMETROS_ENTREGA['EM_SEGUNDO_PLANO'], cada relatório pronto entra na fila de entrega e é enviado
+    enquanto as unidades seguintes são processadas; o status do envio volta na coluna 'entrega'.
+    """
+    max_workers = int(PARAMETROS_ANALISE["WORKERS_UNIDADES"])
+    # Índices de partição construídos uma única vez: cada fatia custa apenas as linhas da própria unidade.
+    indice_bruto = enriquecimento.construir_indice_por_unidade(df_analise_principal)
+    indice_integrado = enriquecimento.construir_indice_por_unidade(df_integrado)
+    # Resumo, fornecedores e tabela mensal de todas as unidades selecionadas em uma única passada de groupby.
+    filtro_bruto = df_analise_principal['UNIDADE'].isin(list(mapa_execucao)).to_numpy()
+    filtro_integrado = df_integrado['UNIDADE'].isin(list(mapa_execucao)).to_numpy()
+    # Os passos em lote abaixo não podem derrubar a execução: se falharem, cada unidade volta a calcular o seu
+    # próprio resultado em processar_unidade, onde uma falha fica isolada na unidade (status 'erro').
+    try:
+        agregados_por_unidade = agregacao.agregar_unidades_em_lote(df_analise_principal[filtro_bruto], df_integrado[filtro_integrado], top_n=5)
+    except Exception as e:
+        logger.error(f"❌ Falha na agregação em lote; as unidades serão agregadas individualmente. Erro: {e}", exc_info=True)
+        agregados_por_unidade = {}
+    # Features dos modelos de IA calculadas uma vez para todas as unidades; cada tarefa recebe só o seu recorte.
+    try:
+        repositorio_features = construir_repositorio_features(df_analise_principal[filtro_bruto])
+    except Exception as e:
+        logger.error(f"❌ Falha ao construir o repositório de features; cada unidade calculará as suas. Erro: {e}", exc_info=True)
+        repositorio_features = None
+    resultados, fatias = [], {}
+    for unidade, email_gestor_final in mapa_execucao.items():
+        try:
+            df_unidade_bruto = enriquecimento.fatiar_por_unidade(df_analise_principal, indice_bruto, unidade)
+            if df_unidade_bruto.empty: 
+                logger.warning(f"Nenhum dado encontrado para a unidade '{unidade}' no período selecionado. Pulando.")
+                resultados.append({"unidade": unidade, "status": "sem_dados", "duracao_s": 0.0, "erro": ""})
+                continue
+            fatias[unidade] = (email_gestor_final, df_unidade_bruto, enriquecimento.fatiar_por_unidade(df_integrado, indice_integrado, unidade))
+        except Exception as e:
+            logger.critical(f"❌ Erro ao separar os dados da unidade '{unidade}': {e}", exc_info=True)
+            resultados.append({"unidade": unidade, "status": "erro", "duracao_s": 0.0, "erro": str(e)})
+
+    # Ocorrências de contexto de todas as unidades: modelos ajustados em paralelo, ou só o mês novo no modo incremental.
+    # Unidades sem ocorrências calculadas aqui (falha no lote) são detectadas individualmente em processar_unidade.
+    exclusivos_por_unidade = {unidade: df_bruto[df_bruto['tipo_projeto'] == 'Exclusivo'] for unidade, (_, df_bruto, _) in fatias.items()}
+    ocorrencias_por_unidade: Dict[str, pd.DataFrame] = {}
+    if PARAMETROS_ANALISE["MODO_DETECCAO_CONTEXTO"] == "incremental":
+        for unidade, df_exclusivos in exclusivos_por_unidade.items():
+            try:
+                ocorrencias_por_unidade[unidade] = contexto_incremental.detectar_anomalias_incremental(df_exclusivos, unidade)
+            except Exception as e:
+                logger.error(f"❌ Falha na detecção incremental da unidade '{unidade}'; será feita a detecção completa. Erro: {e}", exc_info=True)
+    else:
+        try:
+            ocorrencias_por_unidade = insights_ia.detectar_anomalias_em_lote(exclusivos_por_unidade, features=repositorio_features)
+        except Exception as e:
+            logger.error(f"❌ Falha na detecção de ocorrências em lote; cada unidade será analisada individualmente. Erro: {e}", exc_info=True)
+    tarefas = [(unidade, email_gestor_final, df_unidade_bruto, df_unidade_integrado, ano, agregados_por_unidade.get(unidade),
+                _recortar_features(repositorio_features, unidade), ocorrencias_por_unidade.get(unidade))
+               for unidade, (email_gestor_final, df_unidade_bruto, df_unidade_integrado) in fatias.items()]
+
+    fila = entrega.FilaDeEntrega().iniciar() if PARAMETROS_ENTREGA["EM_SEGUNDO_PLANO"] else None
+    def registrar(resultado: Dict[str, Any]):
+        mensagem = resultado.pop("mensagem", None)
+        if mensagem is not None:
+            fila.enviar(**mensagem, identificador=resultado["unidade"])
+        resultados.append(resultado)
+
+    try:
+        if max_workers <= 1:
+            for tarefa in tarefas:
+                registrar(processar_unidade(*tarefa, enviar_email=fila is None))
+            return resultados
+
+        logger.info(f"Processando {len(tarefas)} unidades em paralelo com {max_workers} processos.")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {executor.submit(processar_unidade, *tarefa, enviar_email=fila is None): tarefa[0] for tarefa in tarefas}
+            for futuro in as_completed(futuros):
+                unidade = futuros[futuro]
+                try:
+                    registrar(futuro.result())
+                except Exception as e:
+                    # Falhas do próprio processo (ex.: worker encerrado) também ficam isoladas na unidade.
+                    logger.critical(f"❌ Processo da unidade '{unidade}' falhou: {e}", exc_info=True)
+                    resultados.append({"unidade": unidade, "status": "erro", "duracao_s": float('nan'), "erro": str(e)})
+        return resultados
+    finally:
+        if fila is not None:
+            status_entrega = {envio["identificador"]: envio["status"] for envio in fila.encerrar()}
+            for resultado in resultados:
+                resultado["entrega"] = status_entrega.get(resultado["unidade"], "")
+
+# Colunas fixas de cada CSV de histórico: execuções do mesmo dia gravam sempre no mesmo layout
+# (ex.: 'entrega' só existe com PARAMETROS_ENTREGA["EM_SEGUNDO_PLANO"]).
+COLUNAS_HISTORICO: Dict[str, List[str]] = {
+    "tempos_execucao": ["EXECUCAO", "unidade", "status", "duracao_s", "erro", "entrega"],
+    "metricas_conexoes": ["EXECUCAO", "conexao", "metrica", "quantidade", "total_s", "media_s", "max_s", "erros_consulta",
+                          "invalidacoes", "pool_tamanho", "pool_em_uso", "pool_livres", "pool_overflow"],
+}
+
+def acrescentar_ao_historico(df: pd.DataFrame, prefixo: str, nome_relatorio: str, inicio_execucao: datetime.datetime):
+    """Acrescenta as linhas da execução ao CSV do dia em PARAMETROS_EXECUCOES["DIRETORIO"], nas colunas de COLUNAS_HISTORICO."""
+    caminho = PARAMETROS_EXECUCOES["DIRETORIO"] / f"{prefixo}_{inicio_execucao:%Y%m%d}.csv"
+    df_historico = df.assign(EXECUCAO=f"{inicio_execucao:%Y-%m-%d %H:%M:%S}").reindex(columns=COLUNAS_HISTORICO[prefixo])
+    exportar_dataframe_para_csv(df_historico, str(caminho), nome_relatorio, acrescentar=True)
+
+def aplicar_retencao_historico():
+    """Remove os CSVs de histórico de execuções além da idade e do tamanho configurados."""
+    registro_modelos.aplicar_retencao(PARAMETROS_EXECUCOES["DIRETORIO"], PARAMETROS_EXECUCOES["IDADE_MAXIMA_DIAS"],
+                                      PARAMETROS_EXECUCOES["TAMANHO_MAXIMO_MB"], padrao="*.csv")
+
+def registrar_resumo_de_tempos(resultados_unidades: List[Dict[str, Any]], inicio_execucao: datetime.datetime):
+    """Registra no log e no histórico de execuções o tempo e o status de cada unidade processada."""
+    if not resultados_unidades:
+        return
+    df_tempos = pd.DataFrame(resultados_unidades).sort_values('duracao_s', ascending=False)
+    logger.info("Resumo de tempos por unidade:\n" + df_tempos.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    acrescentar_ao_historico(df_tempos, "tempos_execucao", "Resumo de tempos por unidade", inicio_execucao)
+
+def registrar_metricas_conexoes(inicio_execucao: datetime.datetime):
+    """Registra no log e no histórico de execuções a telemetria dos pools de conexão (espera de checkout, conexão e consultas)."""
+    df_metricas = database.obter_metricas_conexoes()
+    if df_metricas.empty:
+        return
+    logger.info("Telemetria das conexões:\n" + df_metricas.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    acrescentar_ao_historico(df_metricas, "metricas_conexoes", "Telemetria das conexões", inicio_execucao)
+
+def gerar_previsoes_por_projeto(df_analise: pd.DataFrame, ano: int):
+    """Previsão dos próximos meses de cada unidade x projeto, em lote, exportada para CSV em OUTPUT_DIR."""
+    try:
+        df_previsao = previsao.prever_series_em_lote(df_analise, ['UNIDADE', 'PROJETO'], coluna_mes='MES', coluna_valor='VALOR', ano=ano)
+        exportar_dataframe_para_csv(df_previsao, str(OUTPUT_DIR / f"previsao_unidade_projeto_{ano}.csv"), "Previsão por unidade e projeto")
+    except Exception as e:
+        logger.error(f"❌ Falha na previsão em lote. Erro: {e}", exc_info=True)
+
+def executar_analise_distribuida(atualizar_cache: bool = False, gerar_previsao: bool = False):
     ano_interativo, mes_interativo, unidades_selecionadas, email_destino = obter_parametros_interativos()
     if ano_interativo is None and mes_interativo is None and not unidades_selecionadas and not email_destino: pass
     elif unidades_selecionadas is None: return
@@ -79,19 +307,34 @@ def executar_analise_distribuida():
         logger.info(f"--- MODO AUTOMÁTICO ATIVADO ---")
         mapa_execucao = MAPA_GESTORES
     logger.info("🚀 Iniciando pipeline completo...")
+    inicio_execucao = datetime.datetime.now()
+    database.aquecer_conexoes()
     try:
         ano = ano_interativo if ano_interativo is not None else PARAMETROS_ANALISE["ANO_REFERENCIA"]
         id_periodo = PARAMETROS_ANALISE["ID_PERIODO_ORCAMENTO"]
-        df_realizado_bruto = buscar_dados_realizado(ano=ano)
-        df_orcado = buscar_dados_orcamento(id_periodo=id_periodo)
+        # Realizado e Orçamento vêm de servidores diferentes e são independentes: carregamos ao mesmo tempo.
+        tarefas_carga = {
+            "realizado": lambda: carregar_realizado(ano, atualizar_cache),
+            "orcamento": lambda: buscar_dados_orcamento(id_periodo=id_periodo, atualizar_cache=atualizar_cache),
+        }
+        if not unidades_selecionadas:
+            tarefas_carga["unidades"] = buscar_unidades_disponiveis
+        bases = carregar_bases_concorrentes(tarefas_carga)
+        df_realizado_bruto, df_orcado = bases["realizado"], bases["orcamento"]
+        if bases.get("unidades"):
+            catalogo_unidades = {str(unidade).strip() for unidade in bases["unidades"]}
+            unidades_sem_cadastro = [unidade for unidade in mapa_execucao if unidade not in catalogo_unidades]
+            if unidades_sem_cadastro:
+                logger.warning(f"⚠️  Unidades do MAPA_GESTORES não encontradas na base: {unidades_sem_cadastro}")
         if df_realizado_bruto.empty: return
         df_orcado_anual = df_orcado.groupby('CODCCUSTO')['VALOR_ORCADO'].sum().reset_index()
         df_realizado_enriquecido = enriquecimento.adicionar_colunas_de_data(df_realizado_bruto)
-        contagem_unidades_por_projeto = df_realizado_enriquecido.groupby('PROJETO')['UNIDADE'].nunique().reset_index(name='contagem_unidades')
+        contagem_unidades_por_projeto = df_realizado_enriquecido.groupby('PROJETO', observed=True)['UNIDADE'].nunique().reset_index(name='contagem_unidades')
         contagem_unidades_por_projeto['tipo_projeto'] = contagem_unidades_por_projeto['contagem_unidades'].apply(lambda x: 'Exclusivo' if x == 1 else 'Compartilhado')
         df_realizado_enriquecido = pd.merge(df_realizado_enriquecido, contagem_unidades_por_projeto[['PROJETO', 'tipo_projeto']], on='PROJETO', how='left')
         df_realizado_enriquecido['CODCCUSTO_JUNCAO'] = df_realizado_enriquecido['CC'].str.slice(0, 12)
-        df_real_agg = df_realizado_enriquecido.groupby(['UNIDADE', 'PROJETO', 'tipo_projeto', 'CODCCUSTO_JUNCAO']).agg(VALOR_REALIZADO=('VALOR', 'sum')).reset_index()
+        df_realizado_enriquecido = enriquecimento.compactar_colunas_categoricas(df_realizado_enriquecido)
+        df_real_agg = df_realizado_enriquecido.groupby(['UNIDADE', 'PROJETO', 'tipo_projeto', 'CODCCUSTO_JUNCAO'], observed=True).agg(VALOR_REALIZADO=('VALOR', 'sum')).reset_index()
         df_integrado = pd.merge(df_real_agg, df_orcado_anual, left_on='CODCCUSTO_JUNCAO', right_on='CODCCUSTO', how='left', suffixes=('', '_orcado'))
         df_integrado['VALOR_ORCADO'] = df_integrado['VALOR_ORCADO'].fillna(0)
         df_integrado.drop(columns=['CODCCUSTO'], inplace=True, errors='ignore')
@@ -99,63 +342,29 @@ def executar_analise_distribuida():
         if mes_interativo:
             logger.warning(f" MODO DE SOBRESCRITA ATIVADO: A análise será limitada aos dados até o mês {mes_interativo}. ")
             df_analise_principal = df_analise_principal[df_analise_principal['MES'] <= mes_interativo].copy()
+        # UNIDADE é normalizada uma única vez, depois da classificação Exclusivo/Compartilhado.
+        df_analise_principal = enriquecimento.normalizar_unidade(df_analise_principal)
+        df_integrado = enriquecimento.normalizar_unidade(df_integrado)
     except Exception as e:
         logger.critical(f"❌ Falha na carga/integração inicial. Erro: {e}", exc_info=True)
         return
-    for unidade, email_gestor_final in mapa_execucao.items():
-        logger.info(f"================== PROCESSANDO UNIDADE: {unidade} ==================")
-        try:
-            df_unidade_bruto = df_analise_principal[df_analise_principal['UNIDADE'].str.strip() == unidade].copy()
-            if df_unidade_bruto.empty: 
-                logger.warning(f"Nenhum dado encontrado para a unidade '{unidade}' no período selecionado. Pulando.")
-                continue
-            df_unidade_integrado = df_integrado[df_integrado['UNIDADE'].str.strip() == unidade].copy()
-            cod_unidade_analisada = "N/A"
-            if not df_unidade_bruto.empty:
-                cod_unidade_analisada = df_unidade_bruto['CC'].str[-3:].iloc[0]
-            mes_referencia_num = df_unidade_bruto['MES'].max()
-            resumo = agregacao.gerar_resumo_executivo(df_unidade_bruto, df_unidade_integrado, mes_referencia_num)
-            resumo['numero_unidade'] = cod_unidade_analisada
-            
-            # --- CORREÇÃO: ANÁLISE DE CLUSTER MOVIDA PARA DENTRO DO LOOP ---
-            df_unidade_exclusivos = df_unidade_bruto[df_unidade_bruto['tipo_projeto'] == 'Exclusivo'].copy()
-            df_clusters, resumo_clusters = {}, {}
-            if not df_unidade_exclusivos.empty:
-                df_clusters, resumo_clusters = insights_ia.segmentar_contas_por_comportamento(df_unidade_exclusivos)
-
-            df_integrado_exclusivo = df_unidade_integrado[df_unidade_integrado['tipo_projeto'] == 'Exclusivo']
-            df_integrado_compartilhado = df_unidade_integrado[df_unidade_integrado['tipo_projeto'] == 'Compartilhado']
-            
-            df_ocorrencias_atipicas_ano = insights_ia.detectar_anomalias_de_contexto(df_unidade_exclusivos)
-            df_orcamento_exclusivo = agregacao.agregar_realizado_vs_orcado_por_projeto(df_integrado_exclusivo, df_ocorrencias_atipicas_ano)
-            df_orcamento_compartilhado = agregacao.agregar_realizado_vs_orcado_por_projeto(df_integrado_compartilhado, df_ocorrencias_atipicas_ano)
-            df_fornecedores_exclusivo = agregacao.agregar_despesas_por_fornecedor(df_unidade_exclusivos, top_n=5)
-            df_fornecedores_compartilhado = agregacao.agregar_despesas_por_fornecedor(df_unidade_bruto[df_unidade_bruto['tipo_projeto'] == 'Compartilhado'], top_n=5)
-            df_mes_agregado = agregacao.agregar_despesas_por_mes(df_unidade_bruto)
-            
-            meses_map = {1:'Jan', 2:'Fev', 3:'Mar', 4:'Abr', 5:'Mai', 6:'Jun', 7:'Jul', 8:'Ago', 9:'Set', 10:'Out', 11:'Nov', 12:'Dez'}
-            resumo['mes_referencia'] = meses_map.get(mes_referencia_num, "N/A")
-            df_ocorrencias_filtradas = df_ocorrencias_atipicas_ano[df_ocorrencias_atipicas_ano['DATA'].dt.month == mes_referencia_num].copy()
-            df_ocorrencias_investigadas = insights_ia.investigar_causa_raiz_ocorrencia(df_ocorrencias_filtradas, df_unidade_bruto)
-            if not df_ocorrencias_investigadas.empty:
-                df_ocorrencias_investigadas.rename(columns={'VALOR': 'Realizado'}, inplace=True)
-
-            corpo_html = email.gerar_corpo_email_analise(unidade_gestora=unidade, data_relatorio=datetime.date.today().strftime('%d/%m/%Y'), resumo=resumo, df_orcamento_exclusivo=df_orcamento_exclusivo, df_orcamento_compartilhado=df_orcamento_compartilhado, df_fornecedores_exclusivo=df_fornecedores_exclusivo, df_fornecedores_compartilhado=df_fornecedores_compartilhado, df_mes_agregado=df_mes_agregado, df_ocorrencias_atipicas=df_ocorrencias_investigadas, df_clusters_folha=df_clusters, resumo_clusters_folha=resumo_clusters)
-            
-            unidade_para_assunto = unidade.replace("SP - ", "")
-            assunto = f"Análise de Despesas - {unidade_para_assunto} - Ref {resumo['mes_referencia']}/{ano}"
-            unidade_para_arquivo = slugify(unidade_para_assunto)
-            nome_arquivo_csv = f"despesa_{ano}{resumo['mes_referencia']}_{unidade_para_arquivo}.csv"
-            caminho_anexo = OUTPUT_DIR / nome_arquivo_csv
-            
-            logger.info(f"Gerando arquivo de despesas para anexo em: {caminho_anexo}")
-            df_unidade_bruto.to_csv(caminho_anexo, index=False, sep=';', encoding='utf-8-sig')
-            
-            email.enviar_email_via_smtp(assunto, corpo_html, email_gestor_final, caminho_anexo=str(caminho_anexo))
-            logger.info(f"✅ Análise da unidade '{unidade}' concluída e e-mail enviado com anexo para '{email_gestor_final}'.")
-        except Exception as e:
-            logger.critical(f"❌ Erro no processamento da unidade '{unidade}': {e}", exc_info=True)
+    try:
+        resultados_unidades = executar_unidades(mapa_execucao, df_analise_principal, df_integrado, ano)
+    except Exception as e:
+        logger.critical(f"❌ Falha na distribuição das unidades. Erro: {e}", exc_info=True)
+        resultados_unidades = [{"unidade": unidade, "status": "erro", "duracao_s": float('nan'), "erro": str(e)} for unidade in mapa_execucao]
+    if gerar_previsao:
+        gerar_previsoes_por_projeto(df_analise_principal[df_analise_principal['UNIDADE'].isin(list(mapa_execucao))], ano)
+    registro_modelos.aplicar_retencao()
+    aplicar_retencao_features()
+    registrar_resumo_de_tempos(resultados_unidades, inicio_execucao)
+    registrar_metricas_conexoes(inicio_execucao)
+    aplicar_retencao_historico()
     logger.info("✅ Pipeline finalizado com sucesso.")
 
 if __name__ == "__main__":
-    executar_analise_distribuida()
+    parser = argparse.ArgumentParser(description="Robô de Análise de Despesas com IA")
+    parser.add_argument("--refresh", action="store_true", help="Ignora o cache local e extrai novamente os dados do banco.")
+    parser.add_argument("--previsao", action="store_true", help="Gera também a previsão dos próximos meses por unidade e projeto.")
+    args = parser.parse_args()
+    executar_analise_distribuida(atualizar_cache=args.refresh, gerar_previsao=args.previsao)
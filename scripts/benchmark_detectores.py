@@ -0,0 +1,72 @@
+# benchmark_detectores.py
+"""
+Compara os detectores das séries curtas ("modelo", "mad", "iqr") sobre o histórico do Realizado:
+latência total de cada detector e concordância com o IsolationForest ("modelo") nas duas situações
+em que são usados (tendência dos totais mensais por unidade e faixa normal dos lançamentos de cada mês).
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from analise_despesa.analise.anomalias import DETECTORES, prever_serie_curta
+from analise_despesa.config import OUTPUT_DIR, PARAMETROS_ANALISE
+from analise_despesa.extracao import buscar_dados_realizado
+from analise_despesa.sincronizacao import carregar_realizado_local
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def carregar_historico(ano: int, caminho_csv: str = None) -> pd.DataFrame:
+    """Lê o Realizado do CSV informado, da base local sincronizada ou, em último caso, do banco (com cache)."""
+    if caminho_csv:
+        df = pd.read_csv(caminho_csv, sep=';', encoding='utf-8-sig', parse_dates=['DATA'])
+    else:
+        df = carregar_realizado_local(ano)
+        if df.empty:
+            df = buscar_dados_realizado(ano)
+    df['MES'] = df['DATA'].dt.month
+    df['UNIDADE'] = df['UNIDADE'].astype(str).str.strip()
+    return df
+
+def montar_series(df: pd.DataFrame):
+    """Séries de teste: totais mensais por unidade (> 3 meses) e lançamentos de cada unidade x mês (> 1 valor distinto)."""
+    totais_mensais = {unidade: grupo.to_frame(name='Total Mensal')
+                      for unidade, grupo in df.groupby(['UNIDADE', 'MES'])['VALOR'].sum().groupby(level='UNIDADE') if len(grupo) > 3}
+    lancamentos_mes = {chave: grupo.to_frame(name='VALOR')
+                       for chave, grupo in df.groupby(['UNIDADE', 'MES'])['VALOR'] if grupo.nunique() > 1}
+    return {"tendencia_mensal": (totais_mensais, 'auto'), "faixa_normal_mes": (lancamentos_mes, 0.02)}
+
+def comparar_detectores(series_por_cenario) -> pd.DataFrame:
+    linhas = []
+    for cenario, (series, contamination) in series_por_cenario.items():
+        previsoes = {}
+        for detector in DETECTORES:
+            inicio = time.perf_counter()
+            previsoes[detector] = {chave: prever_serie_curta(matriz, contamination, detector) for chave, matriz in series.items()}
+            duracao = time.perf_counter() - inicio
+            referencia = previsoes["modelo"]
+            rotulos_iguais = np.concatenate([previsoes[detector][chave] == referencia[chave] for chave in series]) if series else np.array([])
+            atipicos = sum(int((p == -1).sum()) for p in previsoes[detector].values())
+            linhas.append({
+                "cenario": cenario, "detector": detector, "series": len(series), "tempo_total_s": round(duracao, 4),
+                "tempo_medio_ms": round(1000 * duracao / max(len(series), 1), 3), "atipicos": atipicos,
+                "concordancia_rotulos_%": round(100 * rotulos_iguais.mean(), 2) if rotulos_iguais.size else np.nan,
+            })
+    return pd.DataFrame(linhas)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark dos detectores de anomalias das séries curtas.")
+    parser.add_argument("--ano", type=int, default=PARAMETROS_ANALISE["ANO_REFERENCIA"])
+    parser.add_argument("--csv", help="CSV do Realizado (ex.: exportado por exportar_view.py). Padrão: base local ou banco.")
+    args = parser.parse_args()
+
+    df_historico = carregar_historico(args.ano, args.csv)
+    logger.info(f"Histórico carregado: {len(df_historico)} lançamentos de {df_historico['UNIDADE'].nunique()} unidades.")
+    df_resultado = comparar_detectores(montar_series(df_historico))
+    logger.info("Resultado do benchmark:\n" + df_resultado.to_string(index=False))
+    caminho = OUTPUT_DIR / f"benchmark_detectores_{args.ano}.csv"
+    df_resultado.to_csv(caminho, index=False, sep=';', encoding='utf-8-sig')
+    logger.info(f"Resultado salvo em: {caminho}")
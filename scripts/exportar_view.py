@@ -4,8 +4,8 @@ import time
 import os
 import pandas as pd
 
-# Importa apenas o que é necessário para a conexão
-from analise_despesa.database import obter_conexao
+# Importa apenas o que é necessário para a extração
+from analise_despesa.extracao import buscar_dados_realizado_paralelo
 from analise_despesa.config import PARAMETROS_ANALISE
 
 # Configuração básica de logging
@@ -16,6 +16,7 @@ def exportar_view_para_csv():
     """
     Conecta-se ao banco de dados, lê o conteúdo completo da VIEW 'vw_AnaliseDespesas'
     para um ano específico e salva em um arquivo CSV para verificação.
+    As colunas essenciais são validadas e os tipos seguem o contrato de dtypes da extração.
     """
     try:
         ano = PARAMETROS_ANALISE["ANO_REFERENCIA"]
@@ -30,17 +31,11 @@ def exportar_view_para_csv():
     os.makedirs(os.path.dirname(caminho_csv), exist_ok=True)
 
     inicio = time.perf_counter()
-    engine = obter_conexao("SPSVSQL39_FINANCA")
-    
-    sql_query = f"""
-        SELECT * 
-        FROM {nome_view}
-        WHERE YEAR([DATA]) = {ano}
-    """
 
     try:
+        # Leitura por intervalos mensais de DATA (predicado indexável), com PARAMETROS_ANALISE["WORKERS_EXTRACAO"] threads.
         logger.info("Executando a consulta na VIEW...")
-        df = pd.read_sql(sql_query, engine)
+        df = buscar_dados_realizado_paralelo(ano)
         
         fim_leitura = time.perf_counter()
         logger.info(f"Leitura da VIEW concluída em {fim_leitura - inicio:.2f}s. "
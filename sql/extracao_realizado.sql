@@ -1,5 +1,6 @@
 -- Busca todos os dados de despesas realizadas (brutos, linha a linha) para um ano.
--- Parâmetro: :ano
+-- Parâmetros: :data_inicio (1º de janeiro do ano, inclusivo), :data_fim (1º de janeiro do ano seguinte, exclusivo)
+-- O filtro por intervalo em DATA (em vez de YEAR(DATA)) permite ao servidor usar índices na coluna.
 SELECT *
 FROM vw_AnaliseDespesas
-WHERE YEAR(DATA) = ?;
+WHERE DATA >= ? AND DATA < ?;
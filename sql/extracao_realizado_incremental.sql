@@ -0,0 +1,13 @@
+-- Busca os lançamentos do Realizado para a sincronização incremental de um ano.
+-- Parâmetros: :inicio_ano (inclusivo), :fim_ano (exclusivo), :corte (inclusivo) e :lctref (marca d'água).
+-- Traz TODAS as linhas do ano de cada LCTREF com alguma linha a partir do corte ou acima da marca d'água
+-- (lançamentos retroativos): a base local substitui o LCTREF inteiro, inclusive as linhas anteriores ao corte.
+SELECT *
+FROM vw_AnaliseDespesas
+WHERE DATA >= ? AND DATA < ?
+  AND LCTREF IN (
+      SELECT LCTREF
+      FROM vw_AnaliseDespesas
+      WHERE DATA >= ? AND DATA < ?
+        AND (DATA >= ? OR LCTREF > ?)
+  );
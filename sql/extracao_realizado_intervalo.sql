@@ -0,0 +1,5 @@
+-- Busca os dados de despesas realizadas (brutos, linha a linha) em um intervalo semiaberto de datas.
+-- Parâmetros: :data_inicio (inclusivo), :data_fim (exclusivo)
+SELECT *
+FROM vw_AnaliseDespesas
+WHERE DATA >= ? AND DATA < ?;
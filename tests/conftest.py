@@ -0,0 +1,19 @@
+# tests/conftest.py
+import pytest
+from analise_despesa.config import (PARAMETROS_CACHE, PARAMETROS_EXECUCOES, PARAMETROS_FEATURES, PARAMETROS_LEITOR_LOCAL, PARAMETROS_MODELOS,
+                                    PARAMETROS_SINCRONIZACAO)
+
+@pytest.fixture(autouse=True)
+def registro_de_modelos_temporario(tmp_path_factory, monkeypatch):
+    """Isola o registro de modelos de cada teste em um diretório temporário (nunca usa OUTPUT_DIR/modelos)."""
+    monkeypatch.setitem(PARAMETROS_MODELOS, "DIRETORIO", tmp_path_factory.mktemp("modelos"))
+    return PARAMETROS_MODELOS["DIRETORIO"]
+
+@pytest.fixture(autouse=True)
+def diretorios_de_saida_temporarios(tmp_path_factory, monkeypatch):
+    """Cache de consultas, features, histórico de execuções, snapshots e base local também em diretórios temporários: nenhum teste grava em OUTPUT_DIR."""
+    monkeypatch.setitem(PARAMETROS_CACHE, "DIRETORIO", tmp_path_factory.mktemp("cache"))
+    monkeypatch.setitem(PARAMETROS_FEATURES, "DIRETORIO", tmp_path_factory.mktemp("features"))
+    monkeypatch.setitem(PARAMETROS_EXECUCOES, "DIRETORIO", tmp_path_factory.mktemp("execucoes"))
+    monkeypatch.setitem(PARAMETROS_LEITOR_LOCAL, "DIRETORIO_SNAPSHOTS", tmp_path_factory.mktemp("snapshots"))
+    monkeypatch.setitem(PARAMETROS_SINCRONIZACAO, "DIRETORIO", tmp_path_factory.mktemp("realizado_local"))
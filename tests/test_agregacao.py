@@ -36,3 +36,45 @@ def test_agregacao_por_fornecedor_evita_duplicatas(dados_teste):
     assert df_agregado.iloc[0]['VALOR'] == 1200
     assert df_agregado.iloc[1]['FORNECEDOR'] == 'Forn-B'
     assert df_agregado.iloc[1]['VALOR'] == 500
+
+def test_agregacao_em_lote_equivale_as_agregacoes_por_unidade():
+    """
+    Dado uma base com várias unidades, projetos exclusivos e compartilhados,
+    Quando as agregações são calculadas em lote,
+    Então resumo, fornecedores e tabela mensal de cada unidade são iguais aos das funções por unidade.
+    """
+    import numpy as np
+    rng = np.random.default_rng(7)
+    n = 600
+    df_bruto = pd.DataFrame({
+        'UNIDADE': rng.choice(['U1', 'U2', 'U3'], n),
+        'tipo_projeto': rng.choice(['Exclusivo', 'Compartilhado'], n),
+        'FORNECEDOR': rng.choice([f'Forn-{i}' for i in range(12)], n),
+        'MES': rng.integers(1, 11, n),
+        'VALOR': rng.gamma(2.0, 500.0, n).round(2),
+    })
+    # A U3 não tem projetos compartilhados: o lote deve tratar o tipo ausente como a função por unidade.
+    df_bruto.loc[df_bruto['UNIDADE'] == 'U3', 'tipo_projeto'] = 'Exclusivo'
+    df_integrado = pd.DataFrame({
+        'UNIDADE': ['U1', 'U1', 'U2', 'U3'], 'tipo_projeto': ['Exclusivo', 'Compartilhado', 'Exclusivo', 'Exclusivo'],
+        'VALOR_ORCADO': [12000.0, 6000.0, 24000.0, 1200.0],
+    })
+
+    agregados = agregacao.agregar_unidades_em_lote(df_bruto, df_integrado, top_n=5)
+
+    assert set(agregados) == {'U1', 'U2', 'U3'}
+    for unidade, agregado in agregados.items():
+        df_unidade = df_bruto[df_bruto['UNIDADE'] == unidade]
+        mes_referencia = df_unidade['MES'].max()
+        esperado = agregacao.gerar_resumo_executivo(df_unidade, df_integrado[df_integrado['UNIDADE'] == unidade], mes_referencia)
+        assert agregado['mes_referencia_num'] == mes_referencia
+        assert agregado['resumo'].keys() == esperado.keys()
+        for chave, valor in esperado.items():
+            assert agregado['resumo'][chave] == pytest.approx(valor), chave
+        for tipo in ['Exclusivo', 'Compartilhado']:
+            fornecedores_esperados = agregacao.agregar_despesas_por_fornecedor(df_unidade[df_unidade['tipo_projeto'] == tipo], top_n=5)
+            if fornecedores_esperados.empty:
+                assert agregado['fornecedores'][tipo].empty
+            else:
+                pd.testing.assert_frame_equal(agregado['fornecedores'][tipo], fornecedores_esperados)
+        pd.testing.assert_frame_equal(agregado['mes_agregado'], agregacao.agregar_despesas_por_mes(df_unidade))
@@ -0,0 +1,86 @@
+# tests/test_anomalias.py
+import numpy as np
+import pandas as pd
+import pytest
+from analise_despesa.analise import agregacao, anomalias, insights_ia
+from analise_despesa.config import PARAMETROS_ANALISE
+from analise_despesa.exceptions import AnaliseDespesaError
+
+def test_previsoes_em_lote_sao_identicas_as_sequenciais():
+    """
+    Dado várias matrizes de features,
+    Quando os modelos são ajustados em lote com várias threads,
+    Então cada previsão é idêntica à do ajuste individual com a mesma semente.
+    """
+    rng = np.random.default_rng(11)
+    matrizes = {f'U{i}': rng.normal(size=(50 + 10 * i, 3)) for i in range(5)}
+
+    previsoes = anomalias.prever_em_lote(matrizes, contamination=0.05, n_jobs=3)
+
+    assert list(previsoes) == list(matrizes)
+    for chave, matriz in matrizes.items():
+        np.testing.assert_array_equal(previsoes[chave], anomalias.ajustar_e_prever(matriz, contamination=0.05))
+
+def test_deteccao_de_contexto_em_lote_equivale_a_chamada_por_unidade():
+    """
+    Dado os lançamentos exclusivos de várias unidades (uma delas pequena demais para o modelo),
+    Quando a detecção de contexto é feita em lote,
+    Então cada unidade recebe as mesmas ocorrências da chamada individual.
+    """
+    rng = np.random.default_rng(5)
+    def lancamentos(n):
+        return pd.DataFrame({
+            'DATA': pd.Timestamp('2025-03-01'), 'COMPLEMENTO': '-',
+            'FORNECEDOR': rng.choice(['A', 'B', 'C', 'D'], n), 'PROJETO': rng.choice(['P1', 'P2'], n),
+            'VALOR': rng.gamma(2.0, 300.0, n).round(2),
+        })
+    dfs_por_unidade = {'U1': lancamentos(120), 'U2': lancamentos(80), 'U3': lancamentos(5)}
+
+    ocorrencias = insights_ia.detectar_anomalias_em_lote(dfs_por_unidade)
+
+    assert list(ocorrencias) == ['U1', 'U2', 'U3']
+    assert ocorrencias['U3'].empty
+    for unidade in ['U1', 'U2']:
+        pd.testing.assert_frame_equal(ocorrencias[unidade], insights_ia.detectar_anomalias_de_contexto(dfs_por_unidade[unidade]))
+
+def test_detectores_robustos_sinalizam_pico_evidente():
+    """
+    Dado uma série curta com um pico evidente e uma série constante,
+    Quando avaliadas pelos detectores MAD e IQR,
+    Então apenas o pico é atípico e a série sem dispersão não tem atípicos.
+    """
+    serie = [100.0, 104.0, 98.0, 101.0, 99.0, 103.0, 500.0]
+    for detector in ['mad', 'iqr']:
+        assert anomalias.prever_robusto(serie, detector).tolist() == [1, 1, 1, 1, 1, 1, -1]
+        assert (anomalias.prever_robusto([50.0] * 6, detector) == 1).all()
+
+def test_detector_da_tabela_mensal_e_selecionavel():
+    """
+    Dado despesas mensais com um mês de pico,
+    Quando a tabela mensal é montada com o detector 'mad' (e com um detector inexistente),
+    Então o pico é sinalizado em forma fechada e o detector inválido gera AnaliseDespesaError.
+    """
+    df_bruto = pd.DataFrame({
+        'MES': list(range(1, 9)), 'tipo_projeto': 'Exclusivo',
+        'VALOR': [1000.0, 1020.0, 990.0, 1010.0, 5000.0, 1005.0, 995.0, 1015.0],
+    })
+
+    df_mensal = agregacao.agregar_despesas_por_mes(df_bruto, detector='mad')
+
+    assert df_mensal.loc[df_mensal['Mês'] == 'Mai', 'Sinalização da IA'].item() == 'Pico Atípico'
+    assert (df_mensal.loc[df_mensal['Mês'] != 'Mai', 'Sinalização da IA'] == '').all()
+    with pytest.raises(AnaliseDespesaError):
+        agregacao.agregar_despesas_por_mes(df_bruto, detector='outro')
+
+def test_lote_sem_detector_segue_a_configuracao(monkeypatch):
+    """
+    Dado DETECTOR_SERIES_CURTAS = 'iqr',
+    Quando o lote é previsto sem informar o detector,
+    Então as previsões são as do detector configurado (forma fechada), como em prever_serie_curta.
+    """
+    monkeypatch.setitem(PARAMETROS_ANALISE, "DETECTOR_SERIES_CURTAS", "iqr")
+    serie = np.array([[100.0], [102.0], [98.0], [101.0], [99.0], [100.0], [400.0]])
+
+    previsoes = anomalias.prever_em_lote({'SP - A': serie})
+
+    assert previsoes['SP - A'].tolist() == anomalias.prever_serie_curta(serie).tolist() == [1, 1, 1, 1, 1, 1, -1]
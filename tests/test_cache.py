@@ -0,0 +1,65 @@
+# tests/test_cache.py
+import os
+import time
+import pandas as pd
+import pytest
+from analise_despesa import cache
+from analise_despesa.config import PARAMETROS_CACHE
+
+@pytest.fixture(autouse=True)
+def cache_temporario(tmp_path, monkeypatch):
+    """Direciona o cache para um diretório temporário em cada teste."""
+    monkeypatch.setitem(PARAMETROS_CACHE, "DIRETORIO", tmp_path)
+    monkeypatch.setitem(PARAMETROS_CACHE, "ATIVO", True)
+    return tmp_path
+
+def _carga_contada(contador):
+    def carregar():
+        contador.append(1)
+        return pd.DataFrame({'VALOR': [1.5, 2.5], 'UNIDADE': ['SP - A', 'SP - B']})
+    return carregar
+
+def test_segunda_chamada_usa_cache():
+    chamadas = []
+    df_1 = cache.obter_ou_executar("SELECT 1", (2025,), "CONEXAO", _carga_contada(chamadas))
+    df_2 = cache.obter_ou_executar("SELECT 1", (2025,), "CONEXAO", _carga_contada(chamadas))
+
+    assert len(chamadas) == 1
+    pd.testing.assert_frame_equal(df_1, df_2)
+
+def test_chave_considera_parametros_e_conexao():
+    assert cache.gerar_chave_cache("SELECT 1", (2025,), "A") != cache.gerar_chave_cache("SELECT 1", (2024,), "A")
+    assert cache.gerar_chave_cache("SELECT 1", (2025,), "A") != cache.gerar_chave_cache("SELECT 1", (2025,), "B")
+
+def test_atualizar_ignora_entrada_existente():
+    chamadas = []
+    cache.obter_ou_executar("SELECT 1", None, "CONEXAO", _carga_contada(chamadas))
+    cache.obter_ou_executar("SELECT 1", None, "CONEXAO", _carga_contada(chamadas), atualizar=True)
+
+    assert len(chamadas) == 2
+
+def test_entrada_expirada_e_descartada(cache_temporario, monkeypatch):
+    chamadas = []
+    cache.obter_ou_executar("SELECT 1", None, "CONEXAO", _carga_contada(chamadas))
+    monkeypatch.setitem(PARAMETROS_CACHE, "TTL_HORAS", 1)
+    for arquivo in cache_temporario.glob("*.parquet"):
+        duas_horas_atras = time.time() - 2 * 3600
+        os.utime(arquivo, (duas_horas_atras, duas_horas_atras))
+
+    cache.obter_ou_executar("SELECT 1", None, "CONEXAO", _carga_contada(chamadas))
+
+    assert len(chamadas) == 2
+
+def test_limite_de_tamanho_remove_menos_usada(cache_temporario, monkeypatch):
+    chave_antiga = cache.gerar_chave_cache("SELECT 1", None, "CONEXAO")
+    chave_nova = cache.gerar_chave_cache("SELECT 2", None, "CONEXAO")
+    cache.gravar_cache(chave_antiga, pd.DataFrame({'VALOR': range(1000)}))
+    arquivo_antigo = cache_temporario / f"{chave_antiga}.parquet"
+    os.utime(arquivo_antigo, (time.time() - 60, arquivo_antigo.stat().st_mtime))
+    tamanho_uma_entrada_mb = arquivo_antigo.stat().st_size / 1024 ** 2
+    monkeypatch.setitem(PARAMETROS_CACHE, "TAMANHO_MAXIMO_MB", tamanho_uma_entrada_mb * 1.5)
+
+    cache.gravar_cache(chave_nova, pd.DataFrame({'VALOR': range(1000)}))
+
+    assert not arquivo_antigo.exists()
+    assert (cache_temporario / f"{chave_nova}.parquet").exists()
@@ -0,0 +1,117 @@
+# tests/test_contexto_incremental.py
+import logging
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import IsolationForest
+from analise_despesa.analise import contexto_incremental, insights_ia, registro_modelos
+from analise_despesa.config import PARAMETROS_ANALISE, PARAMETROS_MODELOS
+
+def _lancamentos(meses, seed=0, n_por_mes=60):
+    rng = np.random.default_rng(seed)
+    partes = []
+    for mes in meses:
+        partes.append(pd.DataFrame({
+            'DATA': pd.Timestamp(2025, mes, 10), 'MES': mes, 'COMPLEMENTO': '-',
+            'FORNECEDOR': rng.choice(['A', 'B', 'C', 'D', 'E'], n_por_mes), 'PROJETO': rng.choice(['P1', 'P2', 'P3'], n_por_mes),
+            'VALOR': rng.gamma(2.0, 300.0, n_por_mes).round(2),
+        }))
+    return pd.concat(partes, ignore_index=True)
+
+def test_acumuladores_combinados_reproduzem_estatisticas_do_ano():
+    """
+    Dado os acumuladores de dois períodos calculados separadamente,
+    Quando são combinados,
+    Então frequências, médias e desvios dos pares são os do período inteiro.
+    """
+    df = _lancamentos(range(1, 7))
+    combinados = contexto_incremental.combinar_acumuladores(
+        contexto_incremental.calcular_acumuladores(df[df['MES'] <= 4]), contexto_incremental.calcular_acumuladores(df[df['MES'] > 4]))
+    esperado = df.groupby(['FORNECEDOR', 'PROJETO'])['VALOR'].agg(['count', 'mean', 'std'])
+
+    pares = combinados['pares'].loc[esperado.index]
+    np.testing.assert_allclose(pares['n'], esperado['count'])
+    np.testing.assert_allclose(pares['media'], esperado['mean'])
+    np.testing.assert_allclose(np.sqrt(pares['m2'] / (pares['n'] - 1)), esperado['std'])
+    assert combinados['fornecedor'].sort_index().tolist() == df['FORNECEDOR'].value_counts().sort_index().tolist()
+
+def test_primeira_execucao_equivale_ao_modo_completo_e_a_seguinte_pontua_so_o_mes(monkeypatch):
+    """
+    Dado uma unidade sem estado incremental,
+    Quando a detecção roda em setembro e depois em outubro,
+    Então setembro equivale ao modo completo e outubro não treina modelo, mantendo as ocorrências dos meses fechados.
+    """
+    monkeypatch.setitem(PARAMETROS_ANALISE, "REAJUSTE_CONTEXTO_MESES", 3)
+    monkeypatch.setitem(PARAMETROS_ANALISE, "LIMITE_DERIVA_CONTEXTO", 10.0)
+    df_ano = _lancamentos(range(1, 11))
+    df_setembro = df_ano[df_ano['MES'] <= 9]
+
+    ocorrencias_setembro = contexto_incremental.detectar_anomalias_incremental(df_setembro, 'SP - A')
+    pd.testing.assert_frame_equal(ocorrencias_setembro, insights_ia.detectar_anomalias_de_contexto(df_setembro))
+
+    monkeypatch.setattr(IsolationForest, "fit", lambda *a, **k: pytest.fail("treinou novamente"))
+    ocorrencias_outubro = contexto_incremental.detectar_anomalias_incremental(df_ano, 'SP - A')
+
+    assert list(ocorrencias_outubro.columns) == list(ocorrencias_setembro.columns)
+    anteriores = ocorrencias_setembro[ocorrencias_setembro['DATA'].dt.month < 9].reset_index(drop=True)
+    pd.testing.assert_frame_equal(ocorrencias_outubro[ocorrencias_outubro['DATA'].dt.month < 9].reset_index(drop=True), anteriores)
+
+def test_reajuste_completo_no_prazo_programado(monkeypatch):
+    """
+    Dado um estado ajustado há REAJUSTE_CONTEXTO_MESES meses,
+    Quando o novo mês é processado,
+    Então o modelo é reajustado com o ano inteiro (resultado igual ao modo completo).
+    """
+    monkeypatch.setitem(PARAMETROS_ANALISE, "REAJUSTE_CONTEXTO_MESES", 2)
+    df_ano = _lancamentos(range(1, 9), seed=4)
+    contexto_incremental.detectar_anomalias_incremental(df_ano[df_ano['MES'] <= 6], 'SP - B')
+
+    ocorrencias = contexto_incremental.detectar_anomalias_incremental(df_ano, 'SP - B')
+
+    pd.testing.assert_frame_equal(ocorrencias, insights_ia.detectar_anomalias_de_contexto(df_ano))
+
+def test_estado_incremental_sobrevive_a_retencao_do_registro(monkeypatch):
+    """
+    Dado um estado incremental gravado,
+    Quando a retenção do registro de modelos roda com limite de tamanho zero,
+    Então o estado é preservado e o mês seguinte continua sem novo treino.
+    """
+    monkeypatch.setitem(PARAMETROS_ANALISE, "LIMITE_DERIVA_CONTEXTO", 10.0)
+    df_ano = _lancamentos(range(1, 11))
+    contexto_incremental.detectar_anomalias_incremental(df_ano[df_ano['MES'] <= 9], 'SP - C')
+
+    registro_modelos.aplicar_retencao(idade_maxima_dias=0, tamanho_maximo_mb=0)
+
+    monkeypatch.setattr(IsolationForest, "fit", lambda *a, **k: pytest.fail("treinou novamente"))
+    contexto_incremental.detectar_anomalias_incremental(df_ano, 'SP - C')
+
+def test_registro_desativado_gera_aviso(monkeypatch, caplog):
+    """
+    Dado o registro de modelos desativado,
+    Quando a detecção incremental roda,
+    Então um aviso informa que o ajuste completo será feito a cada execução.
+    """
+    monkeypatch.setitem(PARAMETROS_MODELOS, "ATIVO", False)
+
+    with caplog.at_level(logging.WARNING, logger=contexto_incremental.__name__):
+        contexto_incremental.detectar_anomalias_incremental(_lancamentos(range(1, 4)), 'SP - D')
+
+    assert "registro de modelos desativado" in caplog.text
+
+def test_alteracao_em_mes_fechado_dispara_reajuste(monkeypatch):
+    """
+    Dado um estado incremental ajustado em setembro,
+    Quando um lançamento de março é corrigido e outro é incluído em abril antes da execução de outubro,
+    Então o modelo é reajustado com o ano inteiro (resultado igual ao modo completo) em vez de manter as ocorrências antigas.
+    """
+    monkeypatch.setitem(PARAMETROS_ANALISE, "REAJUSTE_CONTEXTO_MESES", 6)
+    monkeypatch.setitem(PARAMETROS_ANALISE, "LIMITE_DERIVA_CONTEXTO", 10.0)
+    df_ano = _lancamentos(range(1, 11), seed=7)
+    contexto_incremental.detectar_anomalias_incremental(df_ano[df_ano['MES'] <= 9], 'SP - E')
+
+    df_corrigido = df_ano.copy()
+    df_corrigido.loc[df_corrigido.index[df_corrigido['MES'] == 3][0], 'VALOR'] = 50000.0
+    df_corrigido = pd.concat([df_corrigido, df_corrigido[df_corrigido['MES'] == 4].head(1)], ignore_index=True)
+    ocorrencias = contexto_incremental.detectar_anomalias_incremental(df_corrigido, 'SP - E')
+
+    pd.testing.assert_frame_equal(ocorrencias, insights_ia.detectar_anomalias_de_contexto(df_corrigido))
@@ -0,0 +1,178 @@
+# tests/test_database.py
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+import sqlalchemy
+from sqlalchemy import text
+from sqlalchemy.dialects import mssql
+from analise_despesa import database
+from analise_despesa.config import CONEXOES
+
+@pytest.fixture
+def conexao_sqlite(tmp_path, monkeypatch):
+    """Registra uma conexão SQLite em arquivo (pool com 2 conexões e sem overflow) e descarta o engine ao final."""
+    monkeypatch.setitem(CONEXOES, "TESTE", {"tipo": "sqlite", "caminho": tmp_path / "teste.db",
+                                            "pool": {"TAMANHO": 2, "OVERFLOW": 0, "AQUECER": 2}})
+    monkeypatch.setattr(database, "_ENGINES", {})
+    yield "TESTE"
+    for engine in database._ENGINES.values():
+        engine.dispose()
+
+def _metricas(nome_conexao):
+    df = database.obter_metricas_conexoes()
+    return df[df['conexao'] == nome_conexao].set_index('metrica')
+
+def test_pool_segue_a_configuracao_da_conexao(conexao_sqlite):
+    engine = database.obter_conexao(conexao_sqlite)
+
+    assert database.obter_conexao(conexao_sqlite) is engine
+    assert engine.pool.size() == 2
+    assert engine.pool._max_overflow == 0
+    assert engine.pool._pre_ping is True
+
+def test_aquecimento_abre_as_conexoes_antes_da_primeira_consulta(conexao_sqlite):
+    """
+    Dado uma conexão com AQUECER = 2,
+    Quando as conexões são aquecidas,
+    Então o pool já tem duas conexões livres e a consulta seguinte não abre nenhuma conexão nova.
+    """
+    database.aquecer_conexoes([conexao_sqlite])
+    engine = database.obter_conexao(conexao_sqlite)
+    assert engine.pool.checkedin() == 2
+
+    with engine.connect() as conexao:
+        conexao.execute(text("SELECT 1"))
+
+    assert _metricas(conexao_sqlite).loc['conexao', 'quantidade'] == 2
+
+def test_telemetria_separa_espera_de_checkout_conexao_e_consulta(conexao_sqlite):
+    """
+    Dado um pool de 2 conexões disputado por 3 threads que seguram a conexão por 0,2 s,
+    Quando as consultas terminam,
+    Então a espera por conexão livre aparece no checkout e as consultas (inclusive com erro) são contadas.
+    """
+    engine = database.obter_conexao(conexao_sqlite)
+
+    def consultar():
+        with engine.connect() as conexao:
+            conexao.execute(text("SELECT 1"))
+            time.sleep(0.2)
+    threads = [threading.Thread(target=consultar) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with pytest.raises(Exception):
+        with engine.connect() as conexao:
+            conexao.execute(text("SELECT * FROM tabela_inexistente"))
+
+    metricas = _metricas(conexao_sqlite)
+    assert metricas.loc['espera_checkout', 'quantidade'] == 4
+    assert metricas.loc['espera_checkout', 'max_s'] >= 0.15
+    assert metricas.loc['conexao', 'quantidade'] == 2
+    assert metricas.loc['consulta', 'quantidade'] == 3
+    assert metricas['erros_consulta'].iloc[0] == 1
+    assert metricas['pool_em_uso'].iloc[0] == 0
+
+def test_parametro_de_pool_desconhecido_gera_erro(conexao_sqlite, monkeypatch):
+    monkeypatch.setitem(CONEXOES[conexao_sqlite], "pool", {"TAMANHO_MAXIMO": 3})
+
+    with pytest.raises(ValueError):
+        database.obter_conexao(conexao_sqlite)
+
+@pytest.fixture
+def despesas():
+    return pd.DataFrame({'LCTREF': np.arange(1, 1001), 'VALOR': np.round(np.linspace(-50, 5000, 1000), 2),
+                         'DATA': pd.Timestamp('2025-01-01') + pd.to_timedelta(np.arange(1000) % 300, unit='D'),
+                         'UNIDADE': pd.Categorical(['SP - Finanças', 'SP - Cultura'] * 500),
+                         'COMPLEMENTO': ['Nota', None] * 500})
+
+def _ler(engine, tabela):
+    return pd.read_sql_query(text(f"SELECT * FROM {tabela} ORDER BY LCTREF"), engine, parse_dates=['DATA'])
+
+def test_carga_em_massa_grava_tipada_em_lotes_paralelos(conexao_sqlite, despesas):
+    """
+    Dado 1.000 lançamentos,
+    Quando salvos em lotes de 64 linhas por 3 conexões,
+    Então a tabela final tem todas as linhas com os tipos mapeados, e a tabela de staging é removida.
+    """
+    resultado = database.salvar_dataframe(despesas, "despesas", conexao_sqlite, workers=3, linhas_por_lote=64)
+
+    engine = database.obter_conexao(conexao_sqlite)
+    df_gravado = _ler(engine, "despesas")
+    assert resultado["linhas"] == 1000 and resultado["linhas_por_segundo"] > 0
+    pd.testing.assert_frame_equal(df_gravado, despesas.astype({'UNIDADE': object}))
+    tipos = {coluna["name"]: str(coluna["type"]) for coluna in sqlalchemy.inspect(engine).get_columns("despesas")}
+    assert tipos == {'LCTREF': 'BIGINT', 'VALOR': 'FLOAT', 'DATA': 'DATETIME', 'UNIDADE': 'VARCHAR(16)', 'COMPLEMENTO': 'VARCHAR(16)'}
+    assert sqlalchemy.inspect(engine).get_table_names() == ["despesas"]
+
+def test_mesclagem_por_chave_atualiza_existentes_e_insere_novas(conexao_sqlite, despesas):
+    """
+    Dado uma tabela já carregada,
+    Quando um lote com 10 LCTREF existentes (com valor novo, um deles repetido) e 2 novos é salvo com chave='LCTREF',
+    Então as 10 linhas são atualizadas com a última ocorrência, as 2 inseridas e as demais preservadas.
+    """
+    database.salvar_dataframe(despesas, "despesas", conexao_sqlite)
+    alteracoes = pd.concat([despesas.iloc[:10].assign(VALOR=-1.0), despesas.iloc[[0]].assign(VALOR=-2.0),
+                            despesas.iloc[:2].assign(LCTREF=[5001, 5002])], ignore_index=True)
+
+    database.salvar_dataframe(alteracoes, "despesas", conexao_sqlite, chave='LCTREF')
+
+    df_gravado = _ler(database.obter_conexao(conexao_sqlite), "despesas").set_index('LCTREF')
+    assert len(df_gravado) == 1002
+    assert df_gravado.loc[1, 'VALOR'] == -2.0
+    assert (df_gravado.loc[2:10, 'VALOR'] == -1.0).all()
+    assert df_gravado.loc[11, 'VALOR'] == despesas.loc[10, 'VALOR']
+    assert df_gravado.loc[5001, 'UNIDADE'] == 'SP - Finanças'
+
+def test_dialeto_de_carga_e_plugavel_e_falha_desfaz_a_carga(conexao_sqlite, despesas, monkeypatch):
+    """
+    Dado uma tabela já carregada e um dialeto de carga registrado para o SQLite cuja movimentação final falha,
+    Quando um novo lote é acrescentado,
+    Então o erro é propagado, a tabela mantém só as linhas anteriores e o staging é removido.
+    """
+    database.salvar_dataframe(despesas, "despesas", conexao_sqlite)
+    def mover_com_falha(preparador, destino, staging, colunas, dica):
+        return [f"INSERT INTO {destino} (LCTREF) SELECT LCTREF FROM {staging}", "SELECT * FROM tabela_inexistente"]
+    monkeypatch.setitem(database.DIALETOS_CARGA, "sqlite", {**database.DIALETOS_CARGA["padrao"], "mover": mover_com_falha})
+
+    with pytest.raises(Exception):
+        database.salvar_dataframe(despesas, "despesas", conexao_sqlite, if_exists="append")
+
+    engine = database.obter_conexao(conexao_sqlite)
+    assert len(_ler(engine, "despesas")) == 1000
+    assert sqlalchemy.inspect(engine).get_table_names() == ["despesas"]
+
+def test_textos_longos_respeitam_o_limite_do_nvarchar():
+    """
+    Dado textos de 3.000 e de 5.000 caracteres,
+    Quando os tipos são mapeados para o SQL Server,
+    Então a largura fica em NVARCHAR(4000) e, acima do limite, em NVARCHAR(max).
+    """
+    dialeto = mssql.dialect()
+
+    tipo_3000 = database._tipo_da_coluna(pd.Series(['x' * 3000]))
+    tipo_5000 = database._tipo_da_coluna(pd.Series(['x' * 5000]))
+
+    assert tipo_3000.compile(dialect=dialeto) == 'NVARCHAR(4000)'
+    assert tipo_5000.compile(dialect=dialeto) == 'NVARCHAR(max)'
+
+def test_acrescimo_e_mesclagem_usam_os_tipos_da_tabela_existente(conexao_sqlite, despesas):
+    """
+    Dado uma tabela criada com textos curtos,
+    Quando um lote com textos mais longos é acrescentado ou mesclado,
+    Então os tipos vêm da tabela de destino (e não do lote), e a substituição volta a inferir pelo lote.
+    """
+    database.salvar_dataframe(despesas, "despesas", conexao_sqlite)
+    engine = database.obter_conexao(conexao_sqlite)
+    lote_longo = despesas.iloc[:2].assign(COMPLEMENTO='x' * 100)
+
+    tipos_acrescimo = database._tipos_das_colunas(engine, lote_longo, "despesas", reaproveitar_destino=True)
+    tipos_substituicao = database._tipos_das_colunas(engine, lote_longo, "despesas", reaproveitar_destino=False)
+    database.salvar_dataframe(lote_longo.assign(LCTREF=[7001, 7002]), "despesas", conexao_sqlite, chave='LCTREF')
+
+    assert str(tipos_acrescimo['COMPLEMENTO']) == 'VARCHAR(16)'
+    assert str(tipos_substituicao['COMPLEMENTO']) == 'VARCHAR(128)'
+    assert _ler(engine, "despesas").set_index('LCTREF').loc[7001, 'COMPLEMENTO'] == 'x' * 100
@@ -15,3 +15,43 @@ def test_adicionar_colunas_de_data():
     assert 'ANO' in df_resultado.columns
     assert df_resultado['MES'].tolist() == [1, 3]
     assert df_resultado['ANO'].tolist() == [2025, 2025]
+
+def test_indice_por_unidade_fatia_sem_varrer_a_tabela():
+    # Dado (Arrange)
+    df_teste = pd.DataFrame({
+        'UNIDADE': ['SP - A ', 'SP - B', 'SP - A', 'SP - C'],
+        'VALOR': [10, 20, 30, 40],
+    }, index=[7, 8, 9, 10])
+
+    # Quando (Act)
+    df_normalizado = enriquecimento.normalizar_unidade(df_teste)
+    indice = enriquecimento.construir_indice_por_unidade(df_normalizado)
+    df_unidade_a = enriquecimento.fatiar_por_unidade(df_normalizado, indice, 'SP - A')
+    df_inexistente = enriquecimento.fatiar_por_unidade(df_normalizado, indice, 'SP - Z')
+
+    # Então (Assert)
+    assert df_unidade_a['VALOR'].tolist() == [10, 30]
+    assert df_unidade_a.index.tolist() == [7, 9]
+    assert df_inexistente.empty
+
+def test_normalizar_unidade_categorica_unifica_categorias():
+    df_teste = pd.DataFrame({'UNIDADE': pd.Categorical(['SP - A ', 'SP - A', 'SP - B'])})
+
+    df_resultado = enriquecimento.normalizar_unidade(df_teste)
+
+    assert df_resultado['UNIDADE'].tolist() == ['SP - A', 'SP - A', 'SP - B']
+    assert isinstance(df_resultado['UNIDADE'].dtype, pd.CategoricalDtype)
+
+def test_compactar_colunas_categoricas_reduz_memoria_e_preserva_valores():
+    df_teste = pd.DataFrame({
+        'FORNECEDOR': ['Fornecedor Beta', 'Fornecedor Alfa'] * 500,
+        'tipo_projeto': ['Exclusivo', 'Compartilhado'] * 500,
+        'VALOR': [1.0, 2.0] * 500,
+    })
+
+    df_resultado = enriquecimento.compactar_colunas_categoricas(df_teste)
+
+    assert df_resultado['FORNECEDOR'].cat.categories.tolist() == ['Fornecedor Alfa', 'Fornecedor Beta']
+    assert df_resultado['FORNECEDOR'].tolist() == df_teste['FORNECEDOR'].tolist()
+    assert df_resultado['VALOR'].dtype == 'float64'
+    assert df_resultado.memory_usage(deep=True).sum() < df_teste.memory_usage(deep=True).sum() / 3
@@ -0,0 +1,133 @@
+# tests/test_entrega.py
+import email as email_stdlib
+import smtplib
+import socketserver
+import threading
+import pytest
+from analise_despesa.comunicacao import entrega
+
+class _SessaoSMTPLocal(socketserver.StreamRequestHandler):
+    """Servidor SMTP mínimo: aceita AUTH PLAIN sem TLS e guarda as mensagens recebidas."""
+    def handle(self):
+        self.server.conexoes += 1
+        responder = lambda linha: self.wfile.write((linha + "\r\n").encode())
+        responder("220 servidor de teste")
+        recebidas = 0
+        while True:
+            linha = self.rfile.readline().decode().strip()
+            if not linha:
+                return
+            comando = linha.split(" ")[0].upper()
+            if comando in ("EHLO", "HELO"):
+                self.wfile.write(b"250-servidor de teste\r\n250 AUTH PLAIN\r\n")
+            elif comando == "AUTH":
+                responder("235 autenticado")
+            elif comando == "DATA":
+                responder("354 termine com .")
+                linhas = []
+                while (conteudo := self.rfile.readline()) not in (b".\r\n", b""):
+                    linhas.append(conteudo)
+                self.server.mensagens.append(email_stdlib.message_from_bytes(b"".join(linhas)))
+                responder("250 recebida")
+                recebidas += 1
+                if self.server.mensagens_por_conexao and recebidas >= self.server.mensagens_por_conexao:
+                    return  # derruba a sessão sem QUIT, como um servidor que encerra conexões
+            elif comando == "QUIT":
+                responder("221 até logo")
+                return
+            else:
+                responder("250 ok")
+
+@pytest.fixture
+def servidor_smtp():
+    servidor = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SessaoSMTPLocal)
+    servidor.daemon_threads = True
+    servidor.mensagens, servidor.conexoes, servidor.mensagens_por_conexao = [], 0, None
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+def _configuracao(servidor):
+    return {"host": "127.0.0.1", "porta": servidor.server_address[1], "usuario": "robo@teste", "senha": "x",
+            "usar_starttls": False, "timeout": 5}
+
+def test_fila_reaproveita_a_sessao_autenticada_entre_mensagens(servidor_smtp, tmp_path):
+    """
+    Dado um servidor SMTP local e três relatórios, um deles com anexo,
+    Quando a fila de entrega envia tudo com uma única thread,
+    Então todos chegam ao servidor pela mesma sessão.
+    """
+    caminho_anexo = tmp_path / "despesa.csv"
+    caminho_anexo.write_text("VALOR;UNIDADE\n10;SP - A\n", encoding="utf-8-sig")
+
+    with entrega.FilaDeEntrega(_configuracao(servidor_smtp), workers=1) as fila:
+        fila.enviar("Relatório A", "<p>A</p>", "a@teste", caminho_anexo=str(caminho_anexo), identificador="SP - A")
+        fila.enviar("Relatório B", "<p>B</p>", "b@teste")
+        fila.enviar("Relatório C", "<p>C</p>", "c@teste")
+
+    assert [resultado["status"] for resultado in fila.resultados] == ["enviado"] * 3
+    assert fila.resultados[0]["identificador"] == "SP - A"
+    assert servidor_smtp.conexoes == 1
+    assert [mensagem["To"] for mensagem in servidor_smtp.mensagens] == ["a@teste", "b@teste", "c@teste"]
+    assert servidor_smtp.mensagens[0].get_payload()[1].get_filename() == "despesa.csv"
+
+def test_fila_reconecta_quando_o_servidor_derruba_a_sessao(servidor_smtp):
+    """
+    Dado um servidor que encerra a conexão depois de cada mensagem,
+    Quando a fila envia várias mensagens pela mesma thread,
+    Então cada sessão derrubada é reaberta sem consumir tentativas nem esperar o backoff.
+    """
+    servidor_smtp.mensagens_por_conexao = 1
+
+    with entrega.FilaDeEntrega(_configuracao(servidor_smtp), workers=1, espera_inicial_s=60) as fila:
+        for i in range(3):
+            fila.enviar(f"Relatório {i}", "<p>corpo</p>", "gestor@teste")
+
+    assert [(resultado["status"], resultado["tentativas"]) for resultado in fila.resultados] == [("enviado", 1)] * 3
+    assert servidor_smtp.conexoes == 3
+
+class _SessaoFalsa:
+    """Sessão que recusa em definitivo os destinatários em 'recusados'."""
+    def __init__(self, recusados=()):
+        self.recusados = recusados
+    def send_message(self, mensagem):
+        if mensagem["To"] in self.recusados:
+            raise smtplib.SMTPRecipientsRefused({mensagem["To"]: (550, b"inexistente")})
+    def quit(self):
+        pass
+
+def test_falha_temporaria_e_repetida_e_recusa_definitiva_nao():
+    """
+    Dado um servidor que recusa a primeira conexão (421) e depois recusa um destinatário (550),
+    Quando a fila envia duas mensagens,
+    Então a primeira é entregue na segunda tentativa e a segunda falha sem nova tentativa.
+    """
+    conexoes = iter([smtplib.SMTPConnectError(421, b"ocupado"), _SessaoFalsa(recusados=("x@teste",))])
+    def fabrica():
+        conexao = next(conexoes)
+        if isinstance(conexao, Exception):
+            raise conexao
+        return conexao
+
+    fila = entrega.FilaDeEntrega({"usuario": "robo@teste"}, fabrica_conexao=fabrica, workers=1, tentativas=3, espera_inicial_s=0)
+    with fila:
+        fila.enviar("Relatório", "<p>corpo</p>", "gestor@teste")
+        fila.enviar("Relatório", "<p>corpo</p>", "x@teste")
+
+    assert [(resultado["status"], resultado["tentativas"]) for resultado in fila.resultados] == [("enviado", 2), ("falha", 1)]
+
+def test_sem_credenciais_registra_falha_sem_interromper(monkeypatch):
+    """
+    Dado um ambiente sem credenciais SMTP,
+    Quando relatórios são enfileirados,
+    Então nenhum envio é tentado e cada mensagem volta com status de falha.
+    """
+    for variavel in ("SMTP_HOST", "SMTP_USER", "SMTP_PASSWORD"):
+        monkeypatch.delenv(variavel, raising=False)
+
+    with entrega.FilaDeEntrega() as fila:
+        fila.enviar("Relatório", "<p>corpo</p>", "gestor@teste", identificador="SP - A")
+
+    assert fila.resultados[0]["identificador"] == "SP - A"
+    assert fila.resultados[0]["status"] == "falha"
@@ -0,0 +1,89 @@
+# tests/test_exportacao.py
+import gzip
+import zipfile
+import pandas as pd
+import pytest
+from analise_despesa.analise.exportacao import exportar_anexo, exportar_dataframe_para_csv
+from analise_despesa.comunicacao import email
+from analise_despesa.exceptions import AnaliseDespesaError
+
+@pytest.fixture
+def df_despesas():
+    return pd.DataFrame({'VALOR': [1500.25, 320.0, 99.9] * 200, 'UNIDADE': ['SP - Finanças e Controladoria'] * 600,
+                         'DATA': pd.to_datetime(['2025-01-10', '2025-02-03', '2025-03-21'] * 200)})
+
+@pytest.mark.parametrize("formato", ["zip", "gzip"])
+def test_anexo_compactado_contem_o_mesmo_csv_do_anexo_original(df_despesas, tmp_path, formato):
+    """
+    Dado o Realizado de uma unidade,
+    Quando o anexo é gerado em formato compactado,
+    Então o conteúdo descompactado é byte a byte o CSV original (';', UTF-8 com BOM) e a taxa é informada.
+    """
+    caminho_csv = tmp_path / "despesa_2025Mar_financas.csv"
+    df_despesas.to_csv(tmp_path / "referencia.csv", index=False, sep=';', encoding='utf-8-sig')
+    csv_original = (tmp_path / "referencia.csv").read_bytes()
+
+    resultado = exportar_anexo(df_despesas, caminho_csv, formato)
+
+    if formato == "zip":
+        conteudo = zipfile.ZipFile(resultado["caminho"]).read(caminho_csv.name)
+    else:
+        conteudo = gzip.decompress(resultado["caminho"].read_bytes())
+    assert conteudo == csv_original
+    assert not caminho_csv.exists()
+    assert resultado["bytes_originais"] == len(csv_original)
+    assert resultado["taxa_compressao"] > 1
+
+def test_formato_de_anexo_invalido_gera_erro(df_despesas, tmp_path):
+    with pytest.raises(AnaliseDespesaError):
+        exportar_anexo(df_despesas, tmp_path / "despesa.csv", "pdf")
+
+def test_anexo_segue_como_parte_binaria(df_despesas, tmp_path):
+    """
+    Dado um anexo zip,
+    Quando a mensagem é montada,
+    Então o arquivo segue em base64 como application/zip, com os mesmos bytes gravados em disco.
+    """
+    caminho = exportar_anexo(df_despesas, tmp_path / "despesa.csv", "zip")["caminho"]
+
+    mensagem = email.montar_mensagem("Assunto", "<p>corpo</p>", "gestor@teste", "robo@teste", str(caminho))
+
+    anexo = mensagem.get_payload()[1]
+    assert anexo.get_content_type() == "application/zip"
+    assert anexo.get_filename() == "despesa.zip"
+    assert anexo.get_payload(decode=True) == caminho.read_bytes()
+
+def test_csv_acrescentado_mantem_um_unico_cabecalho(tmp_path):
+    """
+    Dado duas execuções gravando no mesmo CSV com acrescentar=True,
+    Quando o arquivo é lido,
+    Então há um único cabeçalho (sem BOM repetido) e as linhas das duas execuções.
+    """
+    caminho = tmp_path / "historico" / "tempos.csv"
+    for execucao in ["08:00", "09:00"]:
+        exportar_dataframe_para_csv(pd.DataFrame({'unidade': ['SP - A', 'SP - B'], 'EXECUCAO': execucao}),
+                                    str(caminho), "Histórico", acrescentar=True)
+
+    df_lido = pd.read_csv(caminho, sep=';', encoding='utf-8-sig')
+    assert list(df_lido.columns) == ['unidade', 'EXECUCAO']
+    assert df_lido['EXECUCAO'].tolist() == ['08:00', '08:00', '09:00', '09:00']
+    assert caminho.read_bytes().count('\ufeff'.encode('utf-8')) == 1
+
+def test_csv_acrescentado_alinha_colunas_ao_cabecalho_existente(tmp_path):
+    """
+    Dado um CSV criado sem a coluna 'entrega',
+    Quando uma execução com 'entrega' (e colunas em outra ordem) e outra sem 'erro' são acrescentadas,
+    Então as linhas seguem o cabeçalho original e o arquivo continua legível.
+    """
+    caminho = tmp_path / "tempos.csv"
+    exportar_dataframe_para_csv(pd.DataFrame({'unidade': ['SP - A'], 'status': ['concluida'], 'erro': ['']}),
+                                str(caminho), "Histórico", acrescentar=True)
+    exportar_dataframe_para_csv(pd.DataFrame({'entrega': ['enviado'], 'status': ['erro'], 'erro': ['falhou'], 'unidade': ['SP - B']}),
+                                str(caminho), "Histórico", acrescentar=True)
+    exportar_dataframe_para_csv(pd.DataFrame({'unidade': ['SP - C'], 'status': ['sem_dados']}),
+                                str(caminho), "Histórico", acrescentar=True)
+
+    df_lido = pd.read_csv(caminho, sep=';', encoding='utf-8-sig')
+    assert list(df_lido.columns) == ['unidade', 'status', 'erro']
+    assert df_lido['unidade'].tolist() == ['SP - A', 'SP - B', 'SP - C']
+    assert df_lido['erro'].fillna('').tolist() == ['', 'falhou', '']
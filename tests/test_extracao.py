@@ -0,0 +1,78 @@
+# tests/test_extracao.py
+import datetime
+import time
+import pandas as pd
+import pytest
+import sqlalchemy
+from analise_despesa import database, extracao
+from analise_despesa.exceptions import AnaliseDespesaError
+
+def test_aplicar_contrato_dtypes_converte_colunas():
+    # Dado (Arrange)
+    df_lote = pd.DataFrame({
+        'VALOR': ['10.5', '20'],
+        'DATA': ['2025-01-15', '2025-02-20'],
+        'UNIDADE': ['SP - A', 'SP - B'],
+        'COMPLEMENTO': ['x', 'y'],
+    })
+
+    # Quando (Act)
+    df_resultado = extracao.aplicar_contrato_dtypes(df_lote)
+
+    # Então (Assert)
+    assert df_resultado['VALOR'].dtype == 'float64'
+    assert pd.api.types.is_datetime64_any_dtype(df_resultado['DATA'])
+    assert isinstance(df_resultado['UNIDADE'].dtype, pd.CategoricalDtype)
+    assert df_resultado['COMPLEMENTO'].dtype == object
+
+def test_concatenar_lotes_preserva_categorias():
+    """Lotes com categorias diferentes devem continuar categóricos após a concatenação."""
+    lote_1 = extracao.aplicar_contrato_dtypes(pd.DataFrame({'VALOR': [1.0], 'UNIDADE': ['SP - A']}))
+    lote_2 = extracao.aplicar_contrato_dtypes(pd.DataFrame({'VALOR': [2.0, 3.0], 'UNIDADE': ['SP - B', 'SP - A']}))
+
+    df_resultado = extracao.concatenar_lotes([lote_1, lote_2])
+
+    assert isinstance(df_resultado['UNIDADE'].dtype, pd.CategoricalDtype)
+    assert df_resultado['UNIDADE'].tolist() == ['SP - A', 'SP - B', 'SP - A']
+    assert df_resultado['VALOR'].tolist() == [1.0, 2.0, 3.0]
+
+def test_planejar_intervalos_mensais_cobre_o_ano_sem_sobreposicao():
+    intervalos = extracao.planejar_intervalos_mensais(2024)
+
+    assert len(intervalos) == 12
+    assert intervalos[0][0] == datetime.datetime(2024, 1, 1)
+    assert intervalos[-1][1] == datetime.datetime(2025, 1, 1)
+    assert all(fim == proximo_inicio for (_, fim), (proximo_inicio, _) in zip(intervalos, intervalos[1:]))
+
+def test_extracao_paralela_concatena_meses_em_ordem(tmp_path, monkeypatch):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'financa.db'}")
+    monkeypatch.setattr(database, "obter_conexao", lambda nome_conexao: engine)
+    datas = pd.to_datetime(['2025-12-31', '2025-01-01', '2025-06-15', '2024-12-31', '2026-01-01'])
+    pd.DataFrame({
+        'DATA': datas, 'VALOR': [12.0, 1.0, 6.0, -1.0, -1.0], 'PROJETO': 'P', 'FORNECEDOR': 'F', 'CC': 'C',
+        'UNIDADE': 'U', 'COD_CONTA': '3', 'DESC_NIVEL_4': 'D',
+    }).to_sql('vw_AnaliseDespesas', engine, index=False)
+
+    df_resultado = extracao.buscar_dados_realizado_paralelo(2025, max_workers=3)
+
+    assert df_resultado['VALOR'].tolist() == [1.0, 6.0, 12.0]
+
+def test_carga_concorrente_executa_bases_ao_mesmo_tempo():
+    def carga_lenta(valor):
+        def carregar():
+            time.sleep(0.3)
+            return valor
+        return carregar
+
+    inicio = time.perf_counter()
+    resultados = extracao.carregar_bases_concorrentes({'realizado': carga_lenta(1), 'orcamento': carga_lenta(2)})
+
+    assert resultados == {'realizado': 1, 'orcamento': 2}
+    assert time.perf_counter() - inicio < 0.55
+
+def test_carga_concorrente_propaga_falha_como_erro_da_aplicacao():
+    def carga_com_falha():
+        raise ConnectionError("servidor indisponível")
+
+    with pytest.raises(AnaliseDespesaError, match="orcamento"):
+        extracao.carregar_bases_concorrentes({'realizado': lambda: 1, 'orcamento': carga_com_falha})
@@ -0,0 +1,118 @@
+# tests/test_features.py
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from analise_despesa.analise import features, insights_ia
+
+@pytest.fixture
+def base_multiunidade() -> pd.DataFrame:
+    """Base sintética com duas unidades, projetos exclusivos e compartilhados."""
+    rng = np.random.default_rng(3)
+    n = 400
+    df = pd.DataFrame({
+        'UNIDADE': rng.choice(['U1', 'U2'], n),
+        'tipo_projeto': rng.choice(['Exclusivo', 'Exclusivo', 'Compartilhado'], n),
+        'FORNECEDOR': rng.choice([f'Forn-{i}' for i in range(15)], n),
+        'PROJETO': rng.choice([f'PROJ-{i}' for i in range(4)], n),
+        'DESC_NIVEL_4': rng.choice([f'Conta {i}' for i in range(6)], n),
+        'MES': rng.integers(1, 10, n),
+        'VALOR': rng.gamma(2.0, 400.0, n).round(2),
+        'DATA': pd.Timestamp('2025-01-01'),
+        'COMPLEMENTO': 'x',
+    })
+    df['DATA'] = pd.to_datetime({'year': 2025, 'month': df['MES'], 'day': 1})
+    for coluna in ['UNIDADE', 'FORNECEDOR', 'PROJETO', 'DESC_NIVEL_4']:
+        df[coluna] = df[coluna].astype('category')
+    return df
+
+def test_insights_com_repositorio_equivalem_ao_calculo_por_unidade(base_multiunidade, monkeypatch, tmp_path):
+    """
+    Dado o repositório de features construído uma vez para todas as unidades,
+    Quando os três modelos de insights_ia recebem o recorte de uma unidade,
+    Então os resultados são iguais aos do cálculo feito só com a base da unidade.
+    """
+    monkeypatch.setitem(features.PARAMETROS_FEATURES, "DIRETORIO", tmp_path)
+    repositorio = features.construir_repositorio_features(base_multiunidade)
+
+    for unidade in ['U1', 'U2']:
+        recorte = repositorio.recortar(unidade)
+        df_unidade = base_multiunidade[base_multiunidade['UNIDADE'] == unidade]
+        df_exclusivos = df_unidade[df_unidade['tipo_projeto'] == 'Exclusivo'].copy()
+
+        esperado = insights_ia.detectar_anomalias_de_contexto(df_exclusivos, contamination=0.1)
+        obtido = insights_ia.detectar_anomalias_de_contexto(df_exclusivos, contamination=0.1, features=recorte)
+        pd.testing.assert_frame_equal(obtido, esperado)
+
+        pd.testing.assert_frame_equal(
+            insights_ia.investigar_causa_raiz_ocorrencia(esperado, df_unidade, features=recorte, unidade=unidade),
+            insights_ia.investigar_causa_raiz_ocorrencia(esperado, df_unidade))
+
+        tabelas_esperadas, resumo_esperado = insights_ia.segmentar_contas_por_comportamento(df_exclusivos)
+        tabelas_obtidas, resumo_obtido = insights_ia.segmentar_contas_por_comportamento(df_exclusivos, features=recorte, unidade=unidade)
+        assert resumo_obtido == resumo_esperado
+        for nome, tabela in tabelas_esperadas.items():
+            pd.testing.assert_frame_equal(tabelas_obtidas[nome], tabela)
+
+def test_repositorio_e_reaproveitado_da_memoria_e_do_disco(base_multiunidade, monkeypatch, tmp_path):
+    """
+    Dado um repositório já construído para a base,
+    Quando ele é pedido novamente (na mesma execução ou em outra),
+    Então é reaproveitado da memória ou do arquivo joblib, sem recalcular.
+    """
+    monkeypatch.setitem(features.PARAMETROS_FEATURES, "DIRETORIO", tmp_path)
+    monkeypatch.setattr(features, "_CACHE_MEMORIA", {})
+    primeiro = features.construir_repositorio_features(base_multiunidade)
+    assert features.construir_repositorio_features(base_multiunidade) is primeiro
+    assert len(list(tmp_path.glob("*.joblib"))) == 1
+
+    features._CACHE_MEMORIA.clear()
+    monkeypatch.setattr(features.RepositorioFeatures, "construir", classmethod(lambda cls, *a, **k: pytest.fail("recalculou")))
+    do_disco = features.construir_repositorio_features(base_multiunidade)
+    pd.testing.assert_frame_equal(do_disco.contexto, primeiro.contexto)
+
+def test_features_de_comportamento_vetorizadas_equivalem_ao_calculo_por_conta(base_multiunidade):
+    """
+    Dado contas com vários meses, um único mês e meses negativos, em duas unidades,
+    Quando as features de comportamento são calculadas em uma única chamada,
+    Então total, frequência e CV de cada conta são os do cálculo conta a conta, com meses ativos e concentração.
+    """
+    df = base_multiunidade.copy()
+    df['DESC_NIVEL_4'] = df['DESC_NIVEL_4'].cat.add_categories(['Conta Única', 'Conta Estorno'])
+    df.loc[0, ['UNIDADE', 'DESC_NIVEL_4', 'MES', 'VALOR']] = ['U1', 'Conta Única', 3, 500.0]
+    df.loc[1, ['UNIDADE', 'DESC_NIVEL_4', 'MES', 'VALOR']] = ['U1', 'Conta Estorno', 4, -80.0]
+
+    comportamento = features.calcular_features_de_comportamento(df, chaves=['UNIDADE', 'DESC_NIVEL_4'])
+
+    for (unidade, conta), linha in comportamento.iterrows():
+        lancamentos = df[(df['UNIDADE'] == unidade) & (df['DESC_NIVEL_4'] == conta)]
+        mensal = lancamentos.groupby('MES')['VALOR'].sum()
+        positivos = mensal[mensal > 0]
+        cv_esperado = positivos.std() / positivos.mean() if len(positivos) >= 2 else 0.0
+        assert linha['valor_total'] == pytest.approx(lancamentos['VALOR'].sum())
+        assert linha['frequencia'] == len(lancamentos)
+        assert linha['coef_variacao'] == pytest.approx(cv_esperado)
+        assert linha['meses_ativos'] == len(positivos)
+        assert linha['concentracao_pico'] == pytest.approx(positivos.max() / positivos.sum() if len(positivos) else 0.0)
+    assert comportamento.loc[('U1', 'Conta Única'), 'coef_variacao'] == 0.0
+    assert comportamento.loc[('U1', 'Conta Estorno'), 'meses_ativos'] == 0
+
+def test_retencao_remove_arquivos_de_features_antigos_e_menos_usados(monkeypatch, tmp_path):
+    """
+    Dado três arquivos de features (um vencido e dois válidos, um deles usado recentemente),
+    Quando a retenção é aplicada com limite de tamanho para um só arquivo,
+    Então o vencido e o menos usado são removidos.
+    """
+    monkeypatch.setitem(features.PARAMETROS_FEATURES, "DIRETORIO", tmp_path)
+    monkeypatch.setitem(features.PARAMETROS_FEATURES, "IDADE_MAXIMA_DIAS", 30)
+    monkeypatch.setitem(features.PARAMETROS_FEATURES, "TAMANHO_MAXIMO_MB", 1.5 / 1024)
+    agora = time.time()
+    for nome, gravado_ha_dias, usado_ha_dias in [("vencido", 40, 1), ("pouco_usado", 2, 2), ("recente", 3, 0)]:
+        caminho = tmp_path / f"{nome}.joblib"
+        caminho.write_bytes(b"x" * 1024)
+        os.utime(caminho, (agora - usado_ha_dias * 86400, agora - gravado_ha_dias * 86400))
+
+    features.aplicar_retencao()
+
+    assert [caminho.name for caminho in tmp_path.glob("*.joblib")] == ["recente.joblib"]
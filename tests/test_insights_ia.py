@@ -0,0 +1,32 @@
+# tests/test_insights_ia.py
+import pandas as pd
+from analise_despesa.analise import insights_ia
+
+def test_investigar_causa_raiz_monta_justificativas_por_regra():
+    """
+    Dado ocorrências que disparam nenhuma, uma ou várias regras,
+    Quando a causa raiz é investigada,
+    Então cada justificativa lista as razões na ordem das regras, separadas por ' | '.
+    """
+    df_historico = pd.DataFrame({
+        'FORNECEDOR': ['Forn-A'] * 5 + ['Forn-B'] * 2 + ['Forn-C'] * 4,
+        'PROJETO': ['PROJ-X'] * 5 + ['PROJ-Y'] * 2 + ['PROJ-X', 'PROJ-X', 'PROJ-X', 'PROJ-Y'],
+    })
+    df_ocorrencias = pd.DataFrame({
+        'FORNECEDOR': ['Forn-A', 'Forn-A', 'Forn-B', 'Forn-C', 'Forn-D'],
+        'PROJETO': ['PROJ-X', 'PROJ-X', 'PROJ-Y', 'PROJ-Y', 'PROJ-Z'],
+        'VALOR': [1234.5, 900.0, 50.0, 10.0, 99.4],
+        'Z_SCORE_VALOR': [2.5, 0.3, -3.14159, 0.0, float('nan')],
+    }, index=[10, 11, 12, 13, 14])
+
+    df_investigado = insights_ia.investigar_causa_raiz_ocorrencia(df_ocorrencias, df_historico)
+
+    assert 'Z_SCORE_VALOR' not in df_investigado.columns
+    assert list(df_investigado.index) == [10, 11, 12, 13, 14]
+    assert df_investigado['Justificativa IA'].tolist() == [
+        "Valor (R$ 1234) é um pico ou vale estatístico (Z-Score: 2.50) para esta combinação.",
+        "Combinação de fatores (valor, frequência) considerada incomum pela IA.",
+        "Valor (R$ 50) é um pico ou vale estatístico (Z-Score: -3.14) para esta combinação. | Combinação Fornecedor-Projeto rara (vista 2x no ano). | Fornecedor com baixa atividade geral na unidade (2 lançamentos no ano).",
+        "Combinação Fornecedor-Projeto rara (vista 1x no ano).",
+        "Combinação Fornecedor-Projeto rara (vista 0x no ano). | Fornecedor com baixa atividade geral na unidade (0 lançamentos no ano).",
+    ]
@@ -0,0 +1,99 @@
+# tests/test_leitor_local.py
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from analise_despesa import leitor_local
+from analise_despesa.config import PARAMETROS_LEITOR_LOCAL
+
+@pytest.fixture(autouse=True)
+def snapshots_temporarios(tmp_path, monkeypatch):
+    """Snapshots em diretório temporário, lotes pequenos e cache vazio em cada teste."""
+    monkeypatch.setitem(PARAMETROS_LEITOR_LOCAL, "DIRETORIO_SNAPSHOTS", tmp_path / "snapshots")
+    monkeypatch.setitem(PARAMETROS_LEITOR_LOCAL, "LINHAS_POR_LOTE", 50)
+    leitor_local.limpar_cache()
+    yield
+    leitor_local.limpar_cache()
+
+def _gravar_csv(caminho, n=600, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'VALOR': np.round(rng.normal(1000, 300, n), 2),
+                       'UNIDADE': rng.choice(['SP - Administração', 'SP - Finanças', 'SP - Cultura', None], n),
+                       'DATA': (pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 540, n), unit='D')).astype(str),
+                       'COMPLEMENTO': rng.choice(['Nota 1', None, 'Nota 2'], n)})
+    df.loc[::37, 'DATA'] = None
+    df.to_csv(caminho, sep=';', index=False, encoding='utf-8-sig')
+    return str(caminho)
+
+def _fatia_direta(arquivo_csv, unidade, inicio, fim):
+    df = pd.read_csv(arquivo_csv, sep=';', encoding='utf-8-sig', parse_dates=['DATA'], low_memory=False)
+    return df[(df['UNIDADE'] == unidade) & (df['DATA'] >= pd.Timestamp(inicio)) & (df['DATA'] <= pd.Timestamp(fim))].copy()
+
+def _params(arquivo_csv, unidade, inicio, fim):
+    return {"caminho_csv": arquivo_csv, "unidade_gestora": unidade, "data_inicio": inicio, "data_fim": fim}
+
+@pytest.mark.parametrize("unidade,inicio,fim", [("SP - Finanças", "2024-03-01", "2024-09-30"),
+                                                ("SP - Cultura", "2024-01-01", "2025-12-31"),
+                                                ("SP - Inexistente", "2024-01-01", "2025-12-31")])
+def test_fatia_do_snapshot_igual_a_leitura_direta_do_csv(tmp_path, unidade, inicio, fim):
+    """
+    Dado um CSV exportado,
+    Quando uma unidade e um período são fatiados pelo snapshot colunar,
+    Então o resultado (linhas, ordem, índice, tipos e nulos) é o da leitura direta do CSV.
+    """
+    arquivo_csv = _gravar_csv(tmp_path / "base.csv")
+
+    df_fatia = leitor_local.carregar_e_fatiar_dados(_params(arquivo_csv, unidade, inicio, fim))
+
+    pd.testing.assert_frame_equal(df_fatia, _fatia_direta(arquivo_csv, unidade, inicio, fim))
+
+def test_snapshot_e_reaproveitado_e_invalidado_quando_o_csv_muda(tmp_path, monkeypatch):
+    """
+    Dado um CSV já convertido em snapshot,
+    Quando o cache em memória é descartado, o snapshot é reaproveitado sem reler o CSV;
+    E quando o CSV é regravado, a fatia seguinte reflete o conteúdo novo.
+    """
+    arquivo_csv = _gravar_csv(tmp_path / "base.csv")
+    params = _params(arquivo_csv, "SP - Finanças", "2024-01-01", "2025-12-31")
+    leitor_local.carregar_e_fatiar_dados(params)
+
+    leitor_local.limpar_cache()
+    leitura_csv = pd.read_csv
+    monkeypatch.setattr(pd, "read_csv", lambda *a, **k: pytest.fail("o CSV foi relido"))
+    leitor_local.carregar_e_fatiar_dados(params)
+    monkeypatch.setattr(pd, "read_csv", leitura_csv)
+
+    _gravar_csv(tmp_path / "base.csv", n=200, seed=1)
+    os.utime(arquivo_csv, ns=(0, os.stat(arquivo_csv).st_mtime_ns + 10 ** 9))
+    pd.testing.assert_frame_equal(leitor_local.carregar_e_fatiar_dados(params),
+                                  _fatia_direta(arquivo_csv, "SP - Finanças", "2024-01-01", "2025-12-31"))
+
+def test_cache_mantem_no_maximo_os_arquivos_configurados(tmp_path, monkeypatch):
+    monkeypatch.setitem(PARAMETROS_LEITOR_LOCAL, "ARQUIVOS_EM_CACHE", 2)
+    arquivos = [_gravar_csv(tmp_path / f"base_{i}.csv", n=100, seed=i) for i in range(3)]
+
+    for arquivo_csv in arquivos:
+        leitor_local.carregar_e_fatiar_dados(_params(arquivo_csv, "SP - Cultura", "2024-01-01", "2025-12-31"))
+
+    assert list(leitor_local._SNAPSHOTS) == [str(tmp_path / "base_1.csv"), str(tmp_path / "base_2.csv")]
+
+def test_indice_persistido_delimita_a_fatia_por_busca_binaria(tmp_path):
+    """
+    Dado um snapshot já convertido e reaberto do disco,
+    Quando o período pedido começa e termina exatamente em datas existentes,
+    Então a faixa contígua encontrada pelo índice inclui as duas pontas e só contém linhas da unidade.
+    """
+    arquivo_csv = _gravar_csv(tmp_path / "base.csv")
+    leitor_local.converter_para_snapshot(arquivo_csv)
+    df_direto = pd.read_csv(arquivo_csv, sep=';', encoding='utf-8-sig', parse_dates=['DATA'])
+    datas_financas = df_direto.loc[df_direto['UNIDADE'] == 'SP - Finanças', 'DATA'].dropna().sort_values()
+    inicio, fim = datas_financas.iloc[10], datas_financas.iloc[-10]
+
+    entrada = leitor_local._abrir_snapshot(arquivo_csv)
+    primeira, ultima = leitor_local._faixa_de_linhas(entrada, 'SP - Finanças', inicio, fim)
+
+    assert set(entrada["indice"]) == {'SP - Administração', 'SP - Finanças', 'SP - Cultura'}
+    recorte = entrada["tabela"].slice(primeira, ultima - primeira).to_pandas()
+    assert set(recorte['UNIDADE']) == {'SP - Finanças'}
+    assert recorte['DATA'].min() == inicio and recorte['DATA'].max() == fim
+    assert len(recorte) == datas_financas.between(inicio, fim).sum()
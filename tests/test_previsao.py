@@ -0,0 +1,73 @@
+# tests/test_previsao.py
+import numpy as np
+import pandas as pd
+import pytest
+from analise_despesa.analise import previsao
+
+def _longo():
+    """Duas séries longas (10 meses, com um mês sem lançamentos) e uma curta (3 meses)."""
+    linhas = [('U1', 'P1', mes, 100.0 + 10 * mes) for mes in range(1, 11) if mes != 5]
+    linhas += [('U2', 'P1', mes, 50.0 + (mes % 3) * 20) for mes in range(1, 11)]
+    linhas += [('U2', 'P2', mes, valor) for mes, valor in [(8, 30.0), (9, 50.0), (10, 40.0)]]
+    return pd.DataFrame(linhas, columns=['UNIDADE', 'PROJETO', 'MES', 'VALOR'])
+
+def test_matriz_de_series_preenche_lacunas_e_respeita_o_inicio():
+    """
+    Dado séries que começam em meses diferentes e têm meses sem lançamentos,
+    Quando a matriz séries x meses é montada,
+    Então os meses vazios após o início valem 0 e os anteriores ao início ficam NaN.
+    """
+    matriz = previsao.montar_matriz_de_series(_longo(), ['UNIDADE', 'PROJETO'], ano=2025)
+
+    assert list(matriz.columns) == list(pd.date_range('2025-01-01', '2025-10-01', freq='MS'))
+    assert matriz.loc[('U1', 'P1'), pd.Timestamp('2025-05-01')] == 0
+    assert matriz.loc[('U2', 'P2')].isna().sum() == 7
+
+def test_suavizacao_exponencial_vetorizada_equivale_ao_calculo_serie_a_serie():
+    """
+    Dado várias séries com inícios diferentes,
+    Quando a suavização exponencial é calculada para todas de uma vez,
+    Então nível e desvio de cada série são os do cálculo recursivo individual.
+    """
+    valores = np.array([[np.nan, np.nan, 10.0, 14.0, 9.0, 12.0], [5.0, 7.0, 6.0, 8.0, 30.0, 7.0]])
+    previsoes, desvios = previsao._suavizacao_exponencial(valores, 0.5, 2)
+
+    for i, serie in enumerate(valores):
+        serie = serie[~np.isnan(serie)]
+        nivel, erros = serie[0], []
+        for y in serie[1:]:
+            erros.append(y - nivel)
+            nivel = 0.5 * y + 0.5 * nivel
+        sigma = np.sqrt(np.mean(np.square(erros)))
+        assert previsoes[i].tolist() == pytest.approx([nivel, nivel])
+        assert desvios[i].tolist() == pytest.approx([sigma, sigma * np.sqrt(1.25)])
+
+def test_previsao_em_lote_usa_sarimax_nas_longas_e_reaproveita_o_registro(monkeypatch):
+    """
+    Dado séries longas e curtas no formato longo,
+    Quando a previsão em lote roda duas vezes,
+    Então as longas usam SARIMAX, as curtas a forma fechada, e a segunda execução não reajusta nenhum modelo.
+    """
+    df_previsao = previsao.prever_series_em_lote(_longo(), ['UNIDADE', 'PROJETO'], ano=2025, meses_a_prever=2, max_workers=1)
+
+    metodos = df_previsao.groupby(['UNIDADE', 'PROJETO'])['Método'].first().to_dict()
+    assert metodos == {('U1', 'P1'): 'sarimax', ('U2', 'P1'): 'sarimax', ('U2', 'P2'): 'suavizacao_exponencial'}
+    assert df_previsao['Mês Previsto'].drop_duplicates().tolist() == [pd.Timestamp('2025-11-01'), pd.Timestamp('2025-12-01')]
+    assert (df_previsao['Mínimo Esperado'] <= df_previsao['Previsão']).all()
+
+    monkeypatch.setattr(previsao, "_ajustar_sarimax", lambda *a, **k: pytest.fail("reajustou o SARIMAX"))
+    pd.testing.assert_frame_equal(
+        previsao.prever_series_em_lote(_longo(), ['UNIDADE', 'PROJETO'], ano=2025, meses_a_prever=2, max_workers=1), df_previsao)
+
+def test_previsao_individual_monta_indice_de_datas():
+    """
+    Dado um histórico mensal com nomes de meses,
+    Quando a previsão individual é gerada,
+    Então os meses previstos seguem o último mês do histórico.
+    """
+    df_historico = pd.DataFrame({'Mês': ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun'], 'Valor': [10.0, 12.0, 11.0, 15.0, 14.0, 16.0]})
+
+    df_previsao = previsao.prever_proximos_meses(df_historico, meses_a_prever=2)
+
+    ano = pd.Timestamp.now().year
+    assert df_previsao['Mês Previsto'].tolist() == [pd.Timestamp(ano, 7, 1).strftime('%b/%Y'), pd.Timestamp(ano, 8, 1).strftime('%b/%Y')]
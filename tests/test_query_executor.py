@@ -0,0 +1,96 @@
+# tests/test_query_executor.py
+import asyncio
+import time
+import pytest
+from sqlalchemy import event
+from analise_despesa import database, queries
+from analise_despesa.config import CONEXOES
+from analise_despesa.query_executor import ExecutorAssincrono, executar_consultas_em_paralelo
+
+CONSULTA_INFINITA = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) AS n FROM c"
+
+@pytest.fixture
+def banco_lento(tmp_path, monkeypatch):
+    """
+    Conexão SQLite com a função dormir(segundos), que simula uma consulta lenta no servidor,
+    e arquivos SQL em um diretório temporário. Retorna a fábrica de Consultas.
+    """
+    monkeypatch.setitem(CONEXOES, "LENTA", {"tipo": "sqlite", "caminho": tmp_path / "lenta.db", "pool": {"TAMANHO": 4}})
+    monkeypatch.setattr(database, "_ENGINES", {})
+    monkeypatch.setattr(queries, "SQL_DIR", f"{tmp_path}/")
+    engine = database.obter_conexao("LENTA")
+
+    @event.listens_for(engine, "connect")
+    def registrar_dormir(dbapi_connection, conn_rec):
+        dbapi_connection.create_function("dormir", 1, lambda segundos: time.sleep(segundos) or segundos)
+
+    def criar_consulta(nome, sql):
+        (tmp_path / f"{nome}.sql").write_text(sql, encoding="utf-8")
+        return queries.Consulta(titulo=nome, sql_filename=f"{nome}.sql", tipo="sql", conexao="LENTA")
+    yield criar_consulta
+    engine.dispose()
+
+def test_lote_executa_consultas_ao_mesmo_tempo(banco_lento):
+    """
+    Dado 4 consultas de 0,3 s cada em uma conexão com pool de 4,
+    Quando executadas em lote,
+    Então o tempo total fica perto de uma consulta (e não da soma) e cada resultado vem com seus parâmetros.
+    """
+    consultas = {f"q{i}": banco_lento(f"q{i}", "SELECT dormir(0.3) AS espera, :valor AS valor") for i in range(4)}
+
+    inicio = time.perf_counter()
+    resultados = executar_consultas_em_paralelo(consultas, params={nome: {"valor": i} for i, nome in enumerate(consultas)})
+    duracao = time.perf_counter() - inicio
+
+    assert duracao < 0.8
+    assert {nome: resultado["df"].loc[0, "valor"] for nome, resultado in resultados.items()} == {"q0": 0, "q1": 1, "q2": 2, "q3": 3}
+    assert all(resultado["status"] == "ok" for resultado in resultados.values())
+
+def test_resultados_chegam_por_ordem_de_conclusao_e_timeout_interrompe_a_consulta(banco_lento):
+    """
+    Dado uma consulta sem fim, uma lenta, uma rápida e uma com erro,
+    Quando executadas em lote com timeout de 0,5 s,
+    Então os resultados chegam na ordem em que terminam, a consulta sem fim é interrompida no banco
+    e a conexão volta ao pool.
+    """
+    consultas = {"infinita": banco_lento("infinita", CONSULTA_INFINITA),
+                 "lenta": banco_lento("lenta", "SELECT dormir(0.2) AS espera"),
+                 "rapida": banco_lento("rapida", "SELECT 1 AS n"),
+                 "com_erro": banco_lento("com_erro", "SELECT * FROM tabela_inexistente")}
+
+    async def coletar():
+        async with ExecutorAssincrono(timeout_s=0.5) as executor:
+            return [resultado async for resultado in executor.executar_em_lote(consultas)]
+    resultados = asyncio.run(coletar())
+
+    assert [resultado["nome"] for resultado in resultados][-2:] == ["lenta", "infinita"]
+    assert {resultado["nome"]: resultado["status"] for resultado in resultados} == {
+        "infinita": "timeout", "lenta": "ok", "rapida": "ok", "com_erro": "erro"}
+    engine = database.obter_conexao("LENTA")
+    limite = time.perf_counter() + 2
+    while engine.pool.checkedout() and time.perf_counter() < limite:
+        time.sleep(0.05)
+    assert engine.pool.checkedout() == 0
+
+def test_cancelar_a_tarefa_interrompe_as_consultas_em_andamento(banco_lento):
+    """
+    Dado um lote de consultas sem fim,
+    Quando a tarefa que consome o lote é cancelada,
+    Então o cancelamento é propagado e as consultas são interrompidas no banco.
+    """
+    consultas = {f"infinita_{i}": banco_lento(f"infinita_{i}", CONSULTA_INFINITA) for i in range(2)}
+
+    async def consumir(executor):
+        return [resultado async for resultado in executor.executar_em_lote(consultas, timeout_s=60)]
+
+    async def cancelar_no_meio():
+        async with ExecutorAssincrono() as executor:
+            tarefa = asyncio.create_task(consumir(executor))
+            await asyncio.sleep(0.3)
+            tarefa.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await tarefa
+            await asyncio.sleep(0.2)
+    asyncio.run(cancelar_no_meio())
+
+    assert database.obter_conexao("LENTA").pool.checkedout() == 0
@@ -0,0 +1,66 @@
+# tests/test_registro_modelos.py
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import IsolationForest
+from analise_despesa.analise import anomalias, insights_ia, registro_modelos
+from analise_despesa.config import PARAMETROS_MODELOS
+
+def test_modelo_salvo_pontua_sem_novo_treino(monkeypatch):
+    """
+    Dado um IsolationForest já treinado e registrado para uma unidade,
+    Quando os mesmos dados são pontuados novamente,
+    Então o modelo salvo é usado (sem fit) e as previsões são as mesmas do ajuste sem registro.
+    """
+    matriz = np.random.default_rng(1).normal(size=(80, 3))
+    primeira = anomalias.ajustar_e_prever(matriz, contamination=0.05, escopo='SP - A', nome_modelo='iforest_teste')
+    monkeypatch.setattr(IsolationForest, "fit", lambda *a, **k: pytest.fail("treinou novamente"))
+
+    segunda = anomalias.ajustar_e_prever(matriz, contamination=0.05, escopo='SP - A', nome_modelo='iforest_teste')
+
+    np.testing.assert_array_equal(primeira, segunda)
+    monkeypatch.undo()
+    np.testing.assert_array_equal(segunda, anomalias.ajustar_e_prever(matriz, contamination=0.05))
+
+def test_kmeans_parte_dos_centroides_anteriores_quando_os_dados_mudam():
+    """
+    Dado uma segmentação registrada para a unidade,
+    Quando os dados mudam (novo mês de lançamentos),
+    Então o novo KMeans é inicializado pelos centróides anteriores e gravado com a nova impressão digital.
+    """
+    rng = np.random.default_rng(2)
+    colunas = ['valor_total', 'frequencia', 'coef_variacao']
+    df_features = pd.DataFrame(rng.gamma(2.0, 10.0, size=(30, 3)), columns=colunas)
+    insights_ia._agrupar_contas(df_features, 3, escopo='SP - A')
+    df_novo = df_features * 1.05
+
+    rotulos = insights_ia._agrupar_contas(df_novo, 3, escopo='SP - A')
+
+    assert len(list(PARAMETROS_MODELOS["DIRETORIO"].glob("*kmeans_contas*.joblib"))) == 2
+    impressao = registro_modelos.calcular_impressao_digital(df_novo, n_clusters=3, random_state=42)
+    scaler, kmeans = registro_modelos.ler_modelo('SP - A', 'kmeans_contas', impressao)
+    assert isinstance(kmeans.init, np.ndarray)
+    np.testing.assert_array_equal(rotulos, kmeans.labels_)
+
+def test_retencao_remove_por_idade_e_por_tamanho(monkeypatch):
+    """
+    Dado modelos antigos e um registro acima do tamanho máximo,
+    Quando a retenção é aplicada,
+    Então os antigos saem primeiro e depois os menos usados até caber no limite.
+    """
+    for i, escopo in enumerate(['U1', 'U2', 'U3']):
+        registro_modelos.gravar_modelo(escopo, 'm', f'{i:064d}', np.zeros(20000))
+    diretorio = PARAMETROS_MODELOS["DIRETORIO"]
+    antigo, recente, menos_usado = sorted(diretorio.glob("*.joblib"))
+    agora = time.time()
+    os.utime(antigo, (agora, agora - 100 * 86400))
+    os.utime(menos_usado, (agora - 3600, agora))
+    os.utime(recente, (agora, agora))
+    monkeypatch.setitem(PARAMETROS_MODELOS, "IDADE_MAXIMA_DIAS", 90)
+    monkeypatch.setitem(PARAMETROS_MODELOS, "TAMANHO_MAXIMO_MB", 0.2)
+
+    registro_modelos.aplicar_retencao()
+
+    assert [caminho.name for caminho in diretorio.glob("*.joblib")] == [recente.name]
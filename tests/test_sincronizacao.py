@@ -0,0 +1,89 @@
+# tests/test_sincronizacao.py
+import pandas as pd
+import pytest
+import sqlalchemy
+from analise_despesa import database, sincronizacao
+from analise_despesa.config import PARAMETROS_SINCRONIZACAO
+
+def _linha(lctref, data, valor, unidade='SP - A'):
+    return {'LCTREF': lctref, 'DATA': data, 'VALOR': valor, 'PROJETO': 'PROJ-X', 'FORNECEDOR': 'Forn-A',
+            'CC': '1.01.01.01.01.001', 'UNIDADE': unidade, 'COD_CONTA': '3.1.1', 'DESC_NIVEL_4': 'Pessoal'}
+
+@pytest.fixture
+def banco_fake(tmp_path, monkeypatch):
+    """Simula a view vw_AnaliseDespesas em um SQLite e a base local em um diretório temporário."""
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'financa.db'}")
+    monkeypatch.setattr(database, "obter_conexao", lambda nome_conexao: engine)
+    monkeypatch.setitem(PARAMETROS_SINCRONIZACAO, "DIRETORIO", tmp_path / "realizado_local")
+    monkeypatch.setitem(PARAMETROS_SINCRONIZACAO, "DIAS_RETROATIVOS", 10)
+
+    def gravar_view(linhas):
+        df = pd.DataFrame(linhas)
+        df['DATA'] = pd.to_datetime(df['DATA'])
+        df.to_sql('vw_AnaliseDespesas', engine, if_exists='replace', index=False)
+    return gravar_view
+
+def test_sincronizacao_inicial_particiona_por_mes(banco_fake):
+    banco_fake([_linha(1, '2025-01-10', 100.0), _linha(2, '2025-02-05', 200.0), _linha(3, '2024-12-30', 999.0)])
+
+    resumo = sincronizacao.sincronizar_realizado(2025)
+    df_local = sincronizacao.carregar_realizado_local(2025)
+
+    assert resumo['linhas_extraidas'] == 2
+    assert resumo['particoes_regravadas'] == 2
+    assert sorted(df_local['LCTREF'].tolist()) == [1, 2]
+    assert sincronizacao.ler_marca_dagua(2025)['lctref'] == 2
+
+def test_sincronizacao_incremental_captura_lancamentos_tardios(banco_fake):
+    banco_fake([_linha(1, '2025-01-10', 100.0), _linha(2, '2025-03-20', 200.0)])
+    sincronizacao.sincronizar_realizado(2025)
+
+    # Lançamento 2 alterado, lançamento tardio (3) dentro da janela retroativa e um novo (4).
+    # O lançamento 1 muda no banco, mas está fora da janela e não deve ser reextraído.
+    banco_fake([_linha(1, '2025-01-10', 111.0), _linha(2, '2025-03-20', 250.0),
+                _linha(3, '2025-03-15', 50.0), _linha(4, '2025-04-02', 75.0)])
+    resumo = sincronizacao.sincronizar_realizado(2025)
+    df_local = sincronizacao.carregar_realizado_local(2025).set_index('LCTREF')
+
+    assert resumo['corte'] == pd.Timestamp('2025-03-10')
+    assert resumo['linhas_extraidas'] == 3
+    assert df_local.loc[1, 'VALOR'] == 100.0
+    assert df_local.loc[2, 'VALOR'] == 250.0
+    assert sorted(df_local.index.tolist()) == [1, 2, 3, 4]
+    assert isinstance(df_local['UNIDADE'].dtype, pd.CategoricalDtype)
+
+def test_sincronizacao_incremental_captura_lctref_novo_com_data_retroativa(banco_fake):
+    """
+    Dado uma base já sincronizada até março,
+    Quando surge um LCTREF novo com DATA em janeiro (fora da janela retroativa),
+    Então ele é extraído pela marca d'água de LCTREF e gravado na partição de janeiro.
+    """
+    banco_fake([_linha(1, '2025-01-10', 100.0), _linha(2, '2025-03-20', 200.0)])
+    sincronizacao.sincronizar_realizado(2025)
+
+    banco_fake([_linha(1, '2025-01-10', 100.0), _linha(2, '2025-03-20', 200.0), _linha(5, '2025-01-05', 42.0),
+                _linha(6, '2024-12-31', 1.0)])
+    resumo = sincronizacao.sincronizar_realizado(2025)
+    df_local = sincronizacao.carregar_realizado_local(2025).set_index('LCTREF')
+
+    assert resumo['linhas_extraidas'] == 2
+    assert sorted(df_local.index.tolist()) == [1, 2, 5]
+    assert df_local.loc[5, 'VALOR'] == 42.0
+    assert sincronizacao.ler_marca_dagua(2025)['lctref'] == 5
+
+def test_sincronizacao_incremental_preserva_linhas_de_lctref_anteriores_ao_corte(banco_fake):
+    """
+    Dado um LCTREF com linhas em janeiro e em junho (dentro da janela retroativa),
+    Quando a sincronização incremental roda sobre a mesma origem,
+    Então o LCTREF volta com todas as suas linhas e a linha de janeiro não é perdida.
+    """
+    linhas = [_linha(100, '2025-01-15', 10.0), _linha(100, '2025-06-10', 20.0), _linha(200, '2025-06-18', 30.0)]
+    banco_fake(linhas)
+    sincronizacao.sincronizar_realizado(2025)
+
+    resumo = sincronizacao.sincronizar_realizado(2025)
+    df_local = sincronizacao.carregar_realizado_local(2025)
+
+    assert resumo['linhas_extraidas'] == 3
+    assert len(df_local) == 3
+    assert sorted(df_local['DATA'].dt.strftime('%Y-%m-%d').tolist()) == ['2025-01-15', '2025-06-10', '2025-06-18']
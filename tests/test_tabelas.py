@@ -0,0 +1,56 @@
+# tests/test_tabelas.py
+import numpy as np
+import pandas as pd
+from analise_despesa.comunicacao import tabelas
+
+def _to_html(df, formatos, na_rep='N/A'):
+    formatadores = {coluna: tabelas.FORMATADORES[formato] for coluna, formato in formatos.items()}
+    return df.to_html(index=False, na_rep=na_rep, classes='table', formatters=formatadores)
+
+def test_renderizacao_em_lote_reproduz_o_to_html():
+    """
+    Dado tabelas com valores de borda (zeros, -0, arredondamento .5, milhões, infinito, nulos e HTML no texto),
+    Quando renderizadas com os formatos de moeda, inteiro e percentual,
+    Então o HTML é idêntico, byte a byte, ao do DataFrame.to_html com os formatadores escalares.
+    """
+    df = pd.DataFrame({
+        'Agrupamento': pd.Categorical(['Folha & Encargos', '<Benefícios>', None, 'Viagens', 'Outros', 'Taxas']),
+        'Justificativa': ['ok', None, np.nan, 'tab\tquebra\nlinha', ' espaço ', 'x'],
+        'Valor': [0.0, -0.4, 2.5, 1234567.891, np.inf, np.nan],
+        'Valor Inteiro': np.array([0, -1500, 7, 10 ** 9, 3, 42], dtype=np.int64),
+        'Qtd': [3.9, -0.5, np.nan, 1e6, 12.0, 0.0],
+        'CV': [0.125, -0.004, 1.5, np.nan, 0.005, 10.0],
+        'DATA': pd.to_datetime(['2025-01-03', None, '2025-02-10', '2025-03-01', '2025-12-31', '2025-07-04']),
+        'Código': np.arange(6),
+    })
+    formatos = {'Agrupamento': 'texto', 'Valor': 'moeda', 'Valor Inteiro': 'moeda', 'Qtd': 'inteiro', 'CV': 'percentual'}
+
+    for na_rep in ('N/A', '-'):
+        assert tabelas.renderizar_tabela(df, formatos, na_rep) == _to_html(df, formatos, na_rep)
+    assert tabelas.renderizar_tabela(df.iloc[:0], formatos) == _to_html(df.iloc[:0], formatos)
+
+def test_colunas_nao_cobertas_usam_o_to_html():
+    """
+    Dado uma coluna float sem formato e uma data com horário,
+    Quando a tabela é renderizada,
+    Então a marcação continua igual à do DataFrame.to_html.
+    """
+    df = pd.DataFrame({'Score': [0.1234, 2.0], 'Quando': pd.to_datetime(['2025-01-01 10:30', '2025-01-02 00:00'])})
+
+    assert tabelas.renderizar_tabela(df, {}) == _to_html(df, {})
+
+def test_textos_curtos_com_caracteres_especiais_sao_escapados_por_inteiro():
+    """
+    Dado textos curtos com &, < e > (nas células e no cabeçalho),
+    Quando a tabela é renderizada,
+    Então o escape não trunca o texto e o HTML é o do DataFrame.to_html.
+    """
+    df = pd.DataFrame({'A&B': ['A&B', '<', '>', 'x<y>z', '&&'],
+                       'Fornecedor': pd.Categorical(['P&G', '<i>', 'a>b', None, ' & ']),
+                       'Valor': [1.0, 2.0, 3.0, 4.0, 5.0]})
+    formatos = {'Fornecedor': 'texto', 'Valor': 'moeda'}
+
+    html = tabelas.renderizar_tabela(df, formatos)
+
+    assert html == _to_html(df, formatos)
+    assert '<td>A&amp;B</td>' in html and '<td>&lt;</td>' in html and '<th>A&amp;B</th>' in html